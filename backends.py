@@ -0,0 +1,246 @@
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import numpy as np
+import utils as ut
+from data_config import FINISHES
+from normalizer import DEFAULT_NORMALIZER, normalize_arrow
+
+# Backends the matching stages can run on
+BACKENDS = ('pandas', 'arrow')
+# Distinct values handed to each thread of the Arrow backend
+ARROW_CHUNK_SIZE = 1 << 16
+
+
+class PandasBackend:
+    """
+    The string operations of the matching stages on object-dtype pandas columns: normalizing
+    descriptions and items, stripping finishes, the exact-match and anti-join lookups, and
+    substring filters. Every backend returns the same values, as object-dtype series or numpy arrays.
+    """
+
+    name = 'pandas'
+
+    def normalize(self, series):
+        return DEFAULT_NORMALIZER.normalize_series(series)
+
+    def split_finishes(self, series, finishes=FINISHES):
+        return ut.split_finishes(series, finishes)
+
+    def remove_finishes(self, series, finishes=FINISHES):
+        return self.split_finishes(series, finishes)['base'].rename(series.name)
+
+    def positions(self, values, index):
+        """
+        Position of every value in a pandas Index, or -1 where it is not there.
+        """
+        return index.get_indexer(pd.Index(values, dtype=object))
+
+    def is_in(self, values, candidates):
+        return pd.Series(values, dtype=object).isin(candidates).to_numpy(dtype=bool)
+
+    def contains(self, series, text):
+        """
+        Flags the values that contain 'text', False for missing ones.
+        """
+        return series.str.contains(text, na=False, regex=False).to_numpy(dtype=bool)
+
+
+class ArrowBackend(PandasBackend):
+    """
+    The same operations on Arrow string arrays with pyarrow.compute kernels, which run outside
+    the GIL: the distinct values are split in chunks that are processed on a thread pool.
+    Columns holding values other than strings fall back to the pandas backend.
+    """
+
+    name = 'arrow'
+
+    def __init__(self, max_workers=None):
+        # Fails here rather than in the middle of a run when pyarrow is not installed
+        import pyarrow.compute
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+    def _strings(self, values):
+        """
+        The values as an Arrow string array, missing values as nulls, or None when some are not strings.
+        """
+        import pyarrow as pa
+        try:
+            return pa.array(np.asarray(values, dtype=object), type=pa.string(), from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return None
+
+    def _map_chunks(self, func, array):
+        """
+        Applies func to consecutive chunks of the array, on the thread pool when there are several.
+        """
+        chunks = [array.slice(start, ARROW_CHUNK_SIZE) for start in range(0, len(array), ARROW_CHUNK_SIZE)]
+        if len(chunks) <= 1 or self.max_workers <= 1:
+            return [func(chunk) for chunk in chunks]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(func, chunks))
+
+    def _chunked(self, func, array):
+        import pyarrow as pa
+        chunks = self._map_chunks(func, array)
+        return pa.concat_arrays(chunks) if chunks else func(array)
+
+    def normalize(self, series):
+        codes, uniques = pd.factorize(series, use_na_sentinel=False)
+        uniques = pd.Series(uniques, dtype=object)
+        # Missing values normalize as empty strings, other non-strings have no key
+        is_text = uniques.map(lambda value: isinstance(value, str)).to_numpy(dtype=bool)
+        is_missing = uniques.isna().to_numpy()
+        strings = self._strings(uniques.where(is_text, None))
+        if strings is None:
+            return super().normalize(series)
+
+        keys = np.asarray(self._chunked(normalize_arrow, strings).to_pandas(), dtype=object)
+        keys[is_missing] = ''
+        keys[~is_text & ~is_missing] = np.nan
+        return pd.Series(keys[codes], index=series.index, dtype='object', name=series.name)
+
+    def split_finishes(self, series, finishes=FINISHES):
+        import pyarrow.compute as pc
+
+        if not pd.api.types.is_string_dtype(series):
+            series = series.astype(str)
+        codes, uniques = pd.factorize(series)
+        strings = self._strings(uniques)
+        if strings is None:
+            return super().split_finishes(series, finishes)
+
+        # RE2 has no lookahead: the delimiter after a finish is matched and put back, and the
+        # 'BTB' after a trailing finish is kept. That is exact for keys holding one finish, so
+        # keys with more than one, or two delimited finishes in a row, go through utils instead.
+        # RE2's '$' does not match before a trailing newline as Python's does, nor does its
+        # '\s' match all the whitespace Python's does, so keys holding anything but printable
+        # ASCII go there too
+        alternatives = '|'.join(re.escape(finish) for finish in sorted(finishes, key=len, reverse=True))
+        pattern = rf'[-\s]+({alternatives})([-\s]|$)|({alternatives})((?:BTB)?)$'
+        named = rf'[-\s]+(?P<delimited>{alternatives})(?:[-\s]|$)|(?P<trailing>{alternatives})(?:BTB)?$'
+        chained = rf'[-\s]({alternatives})[-\s]+({alternatives})([-\s]|$)'
+
+        def split(array):
+            simple = pc.and_(
+                pc.and_(
+                    pc.less_equal(pc.count_substring_regex(array, pattern), 1),
+                    pc.invert(pc.match_substring_regex(array, chained)),
+                ),
+                pc.invert(pc.match_substring_regex(array, r'[^ -~]')),
+            )
+            found = pc.extract_regex(array, named)
+            delimited, trailing = pc.struct_field(found, [0]), pc.struct_field(found, [1])
+            finish = pc.if_else(pc.not_equal(delimited, ''), delimited, trailing)
+            finish = pc.if_else(pc.equal(finish, ''), None, finish)
+            base = pc.replace_substring_regex(array, pattern, r'\2\4')
+            return [part.to_numpy(zero_copy_only=False) for part in (base, finish, simple)]
+
+        chunks = self._map_chunks(split, strings)
+        bases = np.concatenate([chunk[0] for chunk in chunks] + [np.empty(0)]).astype(object)
+        found_finishes = np.concatenate([chunk[1] for chunk in chunks] + [np.empty(0)]).astype(object)
+        simple = np.concatenate([chunk[2] for chunk in chunks] + [np.empty(0)]).astype(bool)
+
+        pattern_python = ut.compile_finish_pattern(tuple(finishes))
+        for position in np.flatnonzero(~simple):
+            bases[position], found_finishes[position] = ut._split_finish(uniques[position], pattern_python)
+
+        # A trailing row of missing values is picked up by the -1 code of missing keys
+        parts = pd.DataFrame({
+            'base': np.append(bases, np.nan), 'finish': np.append(found_finishes, None),
+        }, dtype=object)
+        return parts.iloc[codes].set_index(series.index)
+
+    def positions(self, values, index):
+        import pyarrow.compute as pc
+        strings, candidates = self._strings(values), self._strings(index)
+        if strings is None or candidates is None:
+            return super().positions(values, index)
+        positions = pc.index_in(strings, value_set=candidates, skip_nulls=False)
+        return pc.fill_null(positions, -1).to_numpy(zero_copy_only=False).astype(np.int64)
+
+    def is_in(self, values, candidates):
+        import pyarrow.compute as pc
+        strings, candidates_array = self._strings(values), self._strings(pd.unique(np.asarray(candidates, dtype=object)))
+        if strings is None or candidates_array is None:
+            return super().is_in(values, candidates)
+        return pc.is_in(strings, value_set=candidates_array, skip_nulls=False).to_numpy(zero_copy_only=False)
+
+    def contains(self, series, text):
+        import pyarrow.compute as pc
+        strings = self._strings(series)
+        if strings is None:
+            return super().contains(series, text)
+        found = pc.fill_null(pc.match_substring(strings, text), False)
+        return found.to_numpy(zero_copy_only=False).astype(bool)
+
+
+def get_backend(backend='pandas'):
+    """
+    A backend by name, or the backend itself when one is passed.
+    """
+    if isinstance(backend, PandasBackend):
+        return backend
+    if backend == 'pandas':
+        return PandasBackend()
+    if backend == 'arrow':
+        return ArrowBackend()
+    raise ValueError(f"backend must be one of {BACKENDS}, got '{backend}'")
+
+
+def check_parity(products, price_list, targets=('final_update', 'uncreated_items'), sheet_workers=1, directory=None):
+    """
+    Runs the pipeline on both backends and raises an AssertionError when any target differs.
+    With a directory, also exports every target of each backend to a '<backend>' folder in it,
+    the way the update and create files are written, and checks that the files are the same.
+    Returns the seconds each backend took.
+    """
+    from pipeline import run_pipeline
+    from export_writer import export_frame
+
+    outputs, seconds = {}, {}
+    for backend in BACKENDS:
+        start = time.perf_counter()
+        outputs[backend] = run_pipeline(
+            products, price_list, targets=targets, checkpoint_dir=None, sheet_workers=sheet_workers, backend=backend,
+        )
+        seconds[backend] = time.perf_counter() - start
+
+    for target in targets:
+        expected, result = outputs['pandas'][target], outputs['arrow'][target]
+        if not expected.equals(result):
+            raise AssertionError(f"'{target}' differs between the pandas and the arrow backends")
+
+    if directory is not None:
+        for target in targets:
+            files = {}
+            for backend in BACKENDS:
+                folder = os.path.join(directory, backend)
+                os.makedirs(folder, exist_ok=True)
+                [path] = export_frame(outputs[backend][target], target, folder)
+                with open(path, 'rb') as file:
+                    files[backend] = file.read()
+            if files['pandas'] != files['arrow']:
+                raise AssertionError(f"The '{target}' files differ between the pandas and the arrow backends")
+    return seconds
+
+def benchmark(n_products=200_000, items_per_sheet=2_000, seed=0):
+    """
+    Times the pipeline on both backends over a synthetic dataset and checks that their outputs are the same.
+    """
+    from synthetic_data import generate_price_list, generate_products
+
+    price_list = generate_price_list(items_per_sheet, seed)
+    products = generate_products(price_list, n_products, seed=seed)
+    seconds = check_parity(products, price_list)
+
+    print(f"Products: {n_products:,}  Items per sheet: {items_per_sheet:,}")
+    print(f"pandas backend: {seconds['pandas']:.3f}s")
+    print(f"arrow backend:  {seconds['arrow']:.3f}s  ({seconds['pandas'] / seconds['arrow']:.1f}x)")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -1,128 +1,121 @@
-import pandas as pd
-import utils as ut
-from data_config import SHEET_DICT
-
-def find_non_matched_rows(products_df, price_list_dict):
-    """
-    Identifies rows in the 'products' DataFrame that did not exactly 
-    match any row in the price_list DataFrames.
-    """
-    desc_column = ut.get_dict_column(products_df)
-
-    # Prepare the products description for matching
-    products_prepared = products_df.copy()
-    products_prepared['temp_match_col'] = ut.prepare_data_for_matching(products_prepared[desc_column])
-    
-    # Flag for matched products, initialized to False for all
-    matched_products = pd.Series(False, index=products_prepared.index)
-
-    for _, sheet_df in price_list_dict.items():
-    
-        item_column = ut.get_item_column(sheet_df)
-        # Prepare the sheet description for matching
-        sheet_df['temp_match_col'] = ut.prepare_data_for_matching(sheet_df[item_column])
-        # Identify matched products
-        is_matched = products_prepared['temp_match_col'].isin(sheet_df['temp_match_col'])
-        matched_products |= is_matched
-
-    # Filter non-matched products
-    non_matched_products = products_prepared.loc[~matched_products, products_df.columns]
-    return non_matched_products
-
-
-def match_and_update_price(products_df, price_list_dict):
-    """
-    This function takes the dataframe and the dictionary of pricelists. 
-    For every exact match after data preparation, the row is returned in a dataframe with an updated price.
-    """
-    eclipse_df = products_df.copy()
-    desc_column = ut.get_dict_column(eclipse_df)
-    eclipse_df['temp_match_col'] = ut.prepare_data_for_matching(eclipse_df[desc_column])
-
-    matched_products = pd.DataFrame() # Initialize as an empty DataFrame
-
-    for _, sheet_df in price_list_dict.items():
-        item_column = ut.get_item_column(sheet_df)
-        sheet_df['temp_match_col'] = ut.prepare_data_for_matching(sheet_df[item_column])
-        merged_df = pd.merge(eclipse_df, sheet_df, on='temp_match_col', how='left')
-        matched_products = pd.concat([matched_products, merged_df], ignore_index=True)
-
-    matched_products = ut.update_price_columns(matched_products)
-    matched_products.dropna(subset=[item_column], inplace=True)
-    return matched_products[products_df.columns]
-
-def collect_uncreated_items(products_df, price_list_dict):
-    """
-    This function's purpose is to analyse the price list, check Eclipse's database and find all the items that 
-    have not been created yet.
-    """
-    
-    uncreated_items = pd.DataFrame()
-    for _, sheet_df in price_list_dict.items():
-        item_column = ut.get_item_column(sheet_df)
-        non_matched_items = sheet_df[~sheet_df['temp_match_col'].isin(products_df['temp_match_col'])]
-        uncreated_items = pd.concat([uncreated_items, non_matched_items], ignore_index=True)
-    uncreated_items.dropna(subset=[item_column], inplace=True)
-    return uncreated_items.drop(columns=['temp_match_col'])
-
-def find_matches_with_custom_finishes(non_matches_df, price_list_dict):
-    """
-    Removes all finishes from the price list and then tries to match with the database
-    """
-    df = non_matches_df.copy()
-    desc_column = ut.get_dict_column(df)
-    # Prepare for matching
-    df['temp_match_col'] = ut.prepare_data_for_matching(df[desc_column])
-    unfinished_items = []
-
-    for _, sheet_df in price_list_dict.items():
-        item_column = ut.get_item_column(sheet_df)
-        # Remove finishes and prepare
-        sheet_df['modified_item'] = ut.vectorized_remove_finishes(sheet_df[item_column])
-        sheet_df['temp_match_col'] = ut.prepare_data_for_matching(sheet_df['modified_item'])
-        unfinished_items.extend(sheet_df['temp_match_col'].unique())
-    unique_unfinished_items = set(unfinished_items)
-
-    # Apply custom matching logic
-    df['is_potential_match'] = df['temp_match_col'].apply(
-        lambda x: ut.is_match_or_substring(x, unique_unfinished_items)
-    )
-    # Filter non_matched_products
-    potential_matches = df[df['is_potential_match']].copy()
-    potential_matches.drop(['temp_match_col', 'is_potential_match'], axis=1, inplace=True)
-
-    return potential_matches
-
-def price_custom_finishes(custom_finishes_df, price_list_dict):
-    """
-    Function that applies pricing to any item with a custom finish.
-    Given that we are dealing with items that do not fully match, 
-    a dummy column is to be used to fill in the prices, based on custom logic.
-    """
-    df = custom_finishes_df.copy()
-    desc_column = ut.get_dict_column(df)
-    df['prepared_desc'] = ut.prepare_data_for_matching(df[desc_column])
-    price_dict = {}
-    for _, sheet_df in price_list_dict.items():
-        # Get the item and price columns
-        item_column  = ut.get_item_column(sheet_df)
-        price_column = ut.get_price_column(sheet_df)
-        if item_column and price_column:
-            sheet_df.dropna(subset=[item_column], inplace=True)
-                # Prepare data for matching
-            sheet_df['prepared_column'] = ut.prepare_data_for_matching(sheet_df[item_column])
-            sheet_df['temp_match_col'] = ut.vectorized_remove_finishes(sheet_df['prepared_column'])
-            # Update price_dict
-            for _, row in sheet_df.iterrows():
-                price_dict[row['temp_match_col']] = row[price_column]
-            df['Updated LIST PRICE'] = df['prepared_desc1'].apply(lambda x: ut.upcharge_or_standard_charge(x, price_dict))
-            
-    df = ut.update_price_columns(df)
-    df.dropna(subset=['Updated LIST PRICE'], inplace=True)
-
-    # Drop the 'Updated LIST PRICE' column
-    df.drop(columns = ['Updated LIST PRICE', 'prepared_desc1'], axis=1, inplace=True)
-    return df
-
-
-
+import pandas as pd
+import utils as ut
+from price_index import PriceIndex
+from parallel_matching import keys_for_sheet
+from match_context import keys_for, backend_for
+from custom_finish_pricing import CustomFinishPricer
+from finish_index import FinishPriceIndex
+from residual_tracker import SOURCE_COLUMN
+from data_config import SHEET_DICT
+
+def find_non_matched_rows(products_df, price_list_dict, sheet_keys=None, context=None):
+    """
+    Identifies rows in the 'products' DataFrame that did not exactly 
+    match any row in the price_list DataFrames.
+    """
+    # Prepare the products description for matching
+    product_keys = keys_for(products_df, context)
+    backend = backend_for(context)
+
+    if sheet_keys is not None:
+        # The sheets were normalized once already
+        matched_products = backend.is_in(product_keys, sheet_keys['temp_match_col'])
+        return products_df.loc[~matched_products]
+
+    # Flag for matched products, initialized to False for all
+    matched_products = pd.Series(False, index=products_df.index)
+
+    for _, sheet_df in price_list_dict.items():
+    
+        item_column = ut.get_item_column(sheet_df)
+        # Identify matched products
+        is_matched = backend.is_in(product_keys, backend.normalize(sheet_df[item_column]))
+        matched_products |= is_matched
+
+    # Filter non-matched products
+    non_matched_products = products_df.loc[~matched_products]
+    return non_matched_products
+
+
+def match_and_update_price(products_df, price_list_dict, price_index=None, context=None):
+    """
+    This function takes the dataframe and the dictionary of pricelists. 
+    For every exact match after data preparation, the row is returned in a dataframe with an updated price
+    and the matched item in its 'PRICE SOURCE' column.
+    All sheets are looked up at once through a single PriceIndex, so every product appears at most once.
+    """
+    if price_index is None:
+        price_index = context.price_index if context is not None else PriceIndex(price_list_dict)
+
+    matches = price_index.lookup(keys_for(products_df, context))
+    is_matched = matches['ITEM'].notna().to_numpy()
+
+    matched_products = products_df.loc[is_matched].copy()
+    matched_products['Updated LIST PRICE'] = matches.loc[is_matched, 'PRICE'].to_numpy()
+    matched_products = ut.update_price_columns(matched_products)
+    matched_products[SOURCE_COLUMN] = matches.loc[is_matched, 'ITEM'].to_numpy()
+    return matched_products[[*products_df.columns, SOURCE_COLUMN]]
+
+def collect_uncreated_items(products_df, price_list_dict, sheet_keys=None, context=None):
+    """
+    This function's purpose is to analyse the price list, check Eclipse's database and find all the items that 
+    have not been created yet.
+    """
+    backend = backend_for(context)
+    if sheet_keys is None:
+        product_keys = keys_for(products_df, context)
+
+    uncreated_items = pd.DataFrame()
+    item_column = None
+    for sheet_name, sheet_df in price_list_dict.items():
+        item_column = ut.get_item_column(sheet_df)
+        if sheet_keys is not None:
+            # Reuse the keys and the product flags built once for all the sheets
+            in_products = keys_for_sheet(sheet_keys, sheet_name)['IN_PRODUCTS'].reindex(sheet_df.index, fill_value=False)
+        else:
+            in_products = backend.is_in(backend.normalize(sheet_df[item_column]), product_keys)
+        uncreated_items = pd.concat([uncreated_items, sheet_df[~in_products]], ignore_index=True)
+    if item_column is None:
+        return uncreated_items
+    uncreated_items.dropna(subset=[item_column], inplace=True)
+    # Sheets read before the stages stopped modifying them may still carry the helper column
+    return uncreated_items.drop(columns=['temp_match_col'], errors='ignore')
+
+def find_matches_with_custom_finishes(non_matches_df, price_list_dict, finish_index=None, context=None):
+    """
+    Removes all finishes from the price list and then tries to match with the database
+    """
+    # The base items, without their finish, come from the finish index of the price list
+    if finish_index is None:
+        finish_index = context.individual_finish_index if context is not None else FinishPriceIndex(price_list_dict)
+    unique_unfinished_items = {base for base in finish_index.bases if isinstance(base, str) and base}
+
+    # Apply custom matching logic, scanning every description once against all items
+    is_potential_match = ut.vectorized_is_match_or_substring(keys_for(non_matches_df, context), unique_unfinished_items)
+    return non_matches_df[is_potential_match.to_numpy(dtype=bool)]
+
+def price_custom_finishes(custom_finishes_df, price_list_dict, finish_index=None, context=None):
+    """
+    Function that applies pricing to any item with a custom finish.
+    Given that we are dealing with items that do not fully match, 
+    a dummy column is to be used to fill in the prices, based on custom logic.
+    The base item each price was taken from is kept in the 'PRICE SOURCE' column.
+    """
+    if finish_index is None and context is not None:
+        finish_index = context.individual_finish_index
+
+    # Build the base item -> price table once from all the sheets and price every description in one pass
+    if finish_index is not None:
+        pricer = CustomFinishPricer.from_finish_index(finish_index)
+    else:
+        pricer = CustomFinishPricer.from_price_list(price_list_dict)
+    prices = pricer.price(keys_for(custom_finishes_df, context))
+
+    df = custom_finishes_df.assign(**{'Updated LIST PRICE': prices})
+    df = ut.update_price_columns(df)
+    df.dropna(subset=['Updated LIST PRICE'], inplace=True)
+    df[SOURCE_COLUMN] = pricer.sources(keys_for(df, context))
+
+    # Drop the 'Updated LIST PRICE' column
+    df.drop(columns = ['Updated LIST PRICE'], axis=1, inplace=True)
+    return df
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+from data_loading import load_clean_eclipse_products, find_latest_price_list
+from price_list_cache import load_clean_workbook
+from workbook_reader import close_workbook
+from match_context import MatchContext
+from pipeline import run_pipeline, CHECKPOINT_DIRECTORY
+from resolution_cache import RESOLUTION_CACHE_FILE
+from supplier_config import config_from_dict
+
+BATCH_MANIFEST = 'suppliers.json'
+PRODUCTS_FILE = "All products information.csv"
+SUMMARY_COLUMNS = ['SUPPLIER', 'WORKBOOK', 'PRICED', 'ALSO PRICED BY OTHERS', 'TO CREATE', 'SUGGESTED', 'SECONDS', 'ERROR']
+
+# A supplier of a batch run: its name, the folder of its price lists and its SupplierConfig
+Supplier = namedtuple('Supplier', ['name', 'directory', 'config'])
+
+
+def load_suppliers(manifest_path=BATCH_MANIFEST):
+    """
+    Reads a batch manifest: a JSON file with a "suppliers" list, each supplier having a
+    "name", the "directory" of its price lists (relative to the manifest) and optionally its
+    own "sheets", "finishes", "revival_sheets", "metro_sheets", "mortise_types" and
+    "tubular_types". An optional "products" entry names the products export.
+    Returns the suppliers and the path of the products export.
+    """
+    with open(manifest_path) as file:
+        manifest = json.load(file)
+    root = os.path.dirname(os.path.abspath(manifest_path))
+
+    suppliers = []
+    for entry in manifest.get('suppliers', []):
+        if 'name' not in entry or 'directory' not in entry:
+            raise ValueError(f"Every supplier needs a 'name' and a 'directory', got {entry}")
+        suppliers.append(Supplier(entry['name'], os.path.join(root, entry['directory']), config_from_dict(entry)))
+    names = [supplier.name for supplier in suppliers]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Supplier names must be unique, got {names}")
+    return suppliers, os.path.join(root, manifest.get('products', PRODUCTS_FILE))
+
+def price_supplier(supplier, products, context,
+                   targets=('final_update', 'uncreated_items', 'fuzzy_suggestions', 'stored_resolutions'),
+                   resolution_cache=True):
+    """
+    Runs the pipeline for the latest price list of one supplier, with a context derived
+    from the shared one so the product keys are not derived again. With resolution_cache,
+    the supplier's resolutions are cached in its own folder, under the rules of its config.
+    Returns the workbook path and the outputs, or None and no outputs without a price list.
+    """
+    if not os.path.isdir(supplier.directory):
+        raise FileNotFoundError(f"No folder '{supplier.directory}'")
+    workbook_path = find_latest_price_list(supplier.directory)
+    if workbook_path is None:
+        return None, None
+    price_list = load_clean_workbook(workbook_path, sheet_names=supplier.config.sheet_dict)
+    supplier_context = context.derive(price_list=price_list, config=supplier.config)
+    try:
+        outputs = run_pipeline(
+            products, price_list, targets=targets, checkpoint_dir=os.path.join(supplier.directory, CHECKPOINT_DIRECTORY),
+            context=supplier_context,
+            resolution_cache=os.path.join(supplier.directory, RESOLUTION_CACHE_FILE) if resolution_cache else None,
+        )
+    finally:
+        close_workbook(price_list)
+    return workbook_path, outputs
+
+def run_batch(suppliers, products, on_outputs=None, max_workers=None, sheet_workers=1, backend='pandas',
+              resolution_cache=True):
+    """
+    Prices the products against every supplier's latest price list, the suppliers running
+    side by side on a thread pool. The products are keyed once and every supplier reads the
+    same keys; each supplier gets its own outputs, passed to on_outputs(supplier, outputs)
+    as soon as they are ready. A supplier that fails does not stop the others.
+    Returns the run summary, one row per supplier; 'ALSO PRICED BY OTHERS' counts the
+    products of a supplier's update that another supplier priced as well.
+    """
+    context = MatchContext(products, {}, sheet_workers, backend=backend)
+    # The shared keys are derived before the suppliers read them
+    for name in ('keys', 'base_keys', 'components'):
+        getattr(context, name)
+
+    def process(supplier):
+        started = time.perf_counter()
+        row = dict.fromkeys(SUMMARY_COLUMNS)
+        row['SUPPLIER'] = supplier.name
+        try:
+            workbook_path, outputs = price_supplier(supplier, products, context, resolution_cache=resolution_cache)
+            if outputs is None:
+                row['ERROR'] = "no 'Price List' file with a valid date"
+            else:
+                row['WORKBOOK'] = os.path.basename(workbook_path)
+                if on_outputs is not None:
+                    on_outputs(supplier, outputs)
+        except Exception as error:
+            print(f"Supplier '{supplier.name}' failed: {error!r}")
+            row['ERROR'], outputs = repr(error), None
+        row['SECONDS'] = round(time.perf_counter() - started, 1)
+        return row, outputs
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(suppliers) or 1) as executor:
+        results = list(executor.map(process, suppliers))
+
+    # How many suppliers priced each product
+    priced_ids = [outputs['final_update']['ID'].unique() for _, outputs in results if outputs is not None]
+    supplier_counts = pd.Series(np.concatenate(priced_ids) if priced_ids else [], dtype=object).value_counts()
+    rows = []
+    for row, outputs in results:
+        if outputs is not None:
+            ids = outputs['final_update']['ID'].unique()
+            row['PRICED'] = len(outputs['final_update'])
+            row['ALSO PRICED BY OTHERS'] = int((supplier_counts.reindex(ids).to_numpy() > 1).sum())
+            row['TO CREATE'] = len(outputs['uncreated_items'])
+            row['SUGGESTED'] = outputs['fuzzy_suggestions']['ID'].nunique()
+        rows.append(row)
+    summary = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+    counts = ['PRICED', 'ALSO PRICED BY OTHERS', 'TO CREATE', 'SUGGESTED']
+    summary[counts] = summary[counts].astype('Int64')
+    return summary
+
+def combined_update(updates):
+    """
+    One update from the updates of several suppliers, given in manifest order, so they can be
+    written to the database in one go. A product priced by more than one supplier keeps the
+    price of the first of them in the manifest; the later suppliers' rows for it are left out.
+    """
+    updates = list(updates)
+    if not updates:
+        return pd.DataFrame()
+    combined = pd.concat(updates, ignore_index=True)
+    duplicated = combined['ID'].duplicated(keep='first')
+    if duplicated.any():
+        print(f"{duplicated.sum()} products priced by several suppliers keep the price of the first one in the manifest")
+    return combined[~duplicated].reset_index(drop=True)
+
+def batch(manifest_path=BATCH_MANIFEST, on_outputs=None, max_workers=None, sheet_workers=1, backend='pandas',
+          resolution_cache=True):
+    """
+    Loads the products export once and runs every supplier of the manifest. Returns the run summary.
+    """
+    suppliers, products_path = load_suppliers(manifest_path)
+    products = load_clean_eclipse_products(products_path)
+    print(f"Pricing {len(products)} products against {len(suppliers)} suppliers")
+    return run_batch(suppliers, products, on_outputs, max_workers, sheet_workers, backend, resolution_cache)
@@ -0,0 +1,318 @@
+import os
+import gc
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import importlib
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+import numpy as np
+
+from synthetic_data import generate_dataset
+
+SIZES = (10_000, 100_000, 1_000_000)
+RESULTS_FILE = 'benchmark_results.json'
+BASELINE_FILE = 'benchmark_baseline.json'
+
+# Per-row scalar functions are timed over this many descriptions only
+SCALAR_SAMPLE = 1_000
+
+
+def _copy_sheets(price_list):
+    return {sheet_name: sheet_df.copy() for sheet_name, sheet_df in price_list.items()}
+
+def _module(name):
+    return importlib.import_module(name)
+
+@contextmanager
+def _working_directory(directory):
+    previous = os.getcwd()
+    os.chdir(directory)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+class BenchmarkContext:
+    """
+    Synthetic dataset of one size and the intermediate inputs the functions need,
+    computed once on first use.
+    """
+
+    def __init__(self, directory, size, match_rate, seed):
+        self.directory = directory
+        self.products, self.price_list = generate_dataset(directory, size, match_rate, seed=seed)
+        self._cache = {}
+
+    def _get(self, name, build):
+        if name not in self._cache:
+            self._cache[name] = build()
+        return self._cache[name]
+
+    def sheets(self, category=None):
+        """
+        A fresh copy of the sheets, since most functions add columns to them.
+        """
+        price_list = self.price_list
+        if category:
+            price_list = _module('data_loading').filter_price_list(price_list, category)
+        return _copy_sheets(price_list)
+
+    @property
+    def sample(self):
+        return self.products['Desc1'].head(SCALAR_SAMPLE)
+
+    @property
+    def price_dict(self):
+        def build():
+            ut = _module('utils')
+            keys = pd.concat([
+                ut.vectorized_remove_finishes(ut.prepare_data_for_matching(sheet_df['ITEM']), _module('data_config').FINISHES)
+                for sheet_df in self.price_list.values()
+            ])
+            prices = pd.concat([sheet_df['PRICE'] for sheet_df in self.price_list.values()])
+            return dict(zip(keys, prices))
+        return self._get('price_dict', build)
+
+    @property
+    def unmatched(self):
+        return self._get('unmatched', lambda: _module('basic_matching').find_non_matched_rows(
+            self.products, self.sheets()))
+
+    @property
+    def metro_items(self):
+        return self._get('metro_items', lambda: _module('kit_matching').map_metro_items(
+            {name: self.price_list[name] for name in _module('data_config').METRO_SHEET_NAMES}))
+
+    @property
+    def raw_products(self):
+        return self._get('raw_products', lambda: self.run_in_directory(_module('data_loading').load_eclipse_products))
+
+    @property
+    def raw_price_list(self):
+        return self._get('raw_price_list', lambda: self.run_in_directory(_module('data_loading').load_price_list))
+
+    def run_in_directory(self, func, *args):
+        with _working_directory(self.directory):
+            return func(*args)
+
+    def clear_caches(self):
+        for cache in ('.price_list_cache', '.pipeline_checkpoints'):
+            shutil.rmtree(os.path.join(self.directory, cache), ignore_errors=True)
+
+
+# Each case maps a function name to a setup that receives the context and returns a zero-argument call.
+# Setups run outside the measurement.
+def _cases():
+    def call(module, function, *args):
+        return lambda context: (lambda: getattr(_module(module), function)(*[arg(context) for arg in args]))
+
+    products = lambda context: context.products
+    sheets = lambda context: context.sheets()
+    individual = lambda context: context.sheets('individual')
+    kits = lambda context: context.sheets('kit')
+    sample = lambda context: context.sample
+    price_dict = lambda context: context.price_dict
+    item_set = lambda context: set(context.price_dict)
+    unmatched = lambda context: context.unmatched
+    first_sheet = lambda context: next(iter(context.price_list.values()))
+
+    def scalar(module, function, lookup):
+        def setup(context):
+            func, table, descriptions = getattr(_module(module), function), lookup(context), context.sample
+            return lambda: descriptions.apply(lambda desc: func(desc, table))
+        return setup
+
+    def in_directory(module, function, *args):
+        def setup(context):
+            context.clear_caches()
+            func = getattr(_module(module), function)
+            values = [arg(context) for arg in args]
+            return lambda: context.run_in_directory(func, *values)
+        return setup
+
+    def metro(function, types_name):
+        def setup(context):
+            # The synthetic Metro items use the synthetic mechanism codes
+            km, types = _module('kit_matching'), getattr(_module('synthetic_data'), types_name)
+            if function == 'categorize_metro_items':
+                return lambda: km.categorize_metro_items(context.metro_items, types)
+            categorized = km.categorize_metro_items(context.metro_items, types)
+            return lambda: km.merge_and_update_patterns_based_on_description(
+                categorized, context.unmatched, 'temp_match_col', types)
+        return setup
+
+    return {
+        'utils.get_price_column': call('utils', 'get_price_column', first_sheet),
+        'utils.get_item_column': call('utils', 'get_item_column', first_sheet),
+        'utils.get_dict_column': call('utils', 'get_dict_column', products),
+        'utils.prepare_data_for_matching': call('utils', 'prepare_data_for_matching', lambda c: c.products['Desc1']),
+        'utils.chained_prepare_data_for_matching': call(
+            'utils', 'chained_prepare_data_for_matching', lambda c: c.products['Desc1']),
+        'utils.update_price_columns': call(
+            'utils', 'update_price_columns', lambda c: c.products.assign(**{'Updated LIST PRICE': c.products['LIST PRICE']})),
+        'utils.is_match_or_substring': scalar('utils', 'is_match_or_substring', item_set),
+        'utils.custom_finish_upcharge': scalar('utils', 'custom_finish_upcharge', price_dict),
+        'utils.upcharge_or_standard_charge': scalar('utils', 'upcharge_or_standard_charge', price_dict),
+        'utils.vectorized_is_match_or_substring': call(
+            'utils', 'vectorized_is_match_or_substring', lambda c: c.products['Desc1'], item_set),
+        'utils.vectorized_upcharge_or_standard_charge': call(
+            'utils', 'vectorized_upcharge_or_standard_charge', lambda c: c.products['Desc1'], price_dict),
+        'utils.vectorized_remove_finishes': call(
+            'utils', 'vectorized_remove_finishes', lambda c: c.products['Desc1'], lambda c: _module('data_config').FINISHES),
+        'utils.drop_matching_rows_by_id': call('utils', 'drop_matching_rows_by_id', products, unmatched),
+        'basic_matching.find_non_matched_rows': call('basic_matching', 'find_non_matched_rows', products, sheets),
+        'basic_matching.match_and_update_price': call('basic_matching', 'match_and_update_price', products, sheets),
+        'basic_matching.collect_uncreated_items': call('basic_matching', 'collect_uncreated_items', products, individual),
+        'basic_matching.find_matches_with_custom_finishes': call(
+            'basic_matching', 'find_matches_with_custom_finishes', unmatched, individual),
+        'basic_matching.price_custom_finishes': call('basic_matching', 'price_custom_finishes', unmatched, individual),
+        'kit_matching.find_and_update_revival_kits': call('kit_matching', 'find_and_update_revival_kits', unmatched, kits),
+        'kit_matching.map_metro_items': call(
+            'kit_matching', 'map_metro_items',
+            lambda c: {name: c.price_list[name] for name in _module('data_config').METRO_SHEET_NAMES}),
+        'kit_matching.categorize_metro_items': metro('categorize_metro_items', 'SYNTHETIC_MORTISE_TYPES'),
+        'kit_matching.merge_and_update_patterns_based_on_description': metro(
+            'merge_and_update_patterns_based_on_description', 'SYNTHETIC_MORTISE_TYPES'),
+        'data_loading.load_eclipse_products': in_directory('data_loading', 'load_eclipse_products'),
+        'data_loading.clean_eclipse_products': call(
+            'data_loading', 'clean_eclipse_products', lambda c: c.raw_products.copy()),
+        'data_loading.load_clean_eclipse_products': in_directory('data_loading', 'load_clean_eclipse_products'),
+        'data_loading.detect_encoding': in_directory(
+            'data_loading', 'detect_encoding', lambda c: "All products information.csv"),
+        'data_loading.extract_date': call('data_loading', 'extract_date', lambda c: 'Price List 2024-01-24.xlsx'),
+        'data_loading.find_price_list_versions': in_directory('data_loading', 'find_price_list_versions'),
+        'data_loading.find_latest_price_list': in_directory('data_loading', 'find_latest_price_list'),
+        'data_loading.load_price_list': in_directory('data_loading', 'load_price_list'),
+        'data_loading.clean_price_list': call(
+            'data_loading', 'clean_price_list', lambda c: _copy_sheets(c.raw_price_list)),
+        'data_loading.filter_price_list': call('data_loading', 'filter_price_list', sheets),
+        'main.main': in_directory('main', 'main'),
+    }
+
+
+def measure(setup, context, track_memory=True):
+    """
+    Times one call and, separately, measures its peak traced memory, so tracing does not skew the time.
+    """
+    gc.collect()
+    func = setup(context)
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+
+    peak_mb = None
+    if track_memory:
+        func = setup(context)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            peak_mb = tracemalloc.get_traced_memory()[1] / (1 << 20)
+        finally:
+            tracemalloc.stop()
+    return {'seconds': seconds, 'peak_mb': peak_mb, 'error': None}
+
+def run_benchmarks(sizes=SIZES, match_rate=0.7, seed=0, only=None, track_memory=True, workdir=None):
+    """
+    Generates a dataset per size and measures every case on it.
+    Failing cases are recorded with their error instead of stopping the run.
+    """
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'match_rate': match_rate,
+        'results': {},
+    }
+    cases = {name: setup for name, setup in _cases().items() if not only or any(part in name for part in only)}
+
+    for size in sizes:
+        directory = tempfile.mkdtemp(prefix=f'benchmark_{size}_', dir=workdir)
+        try:
+            print(f"Generating {size:,} products...")
+            context = BenchmarkContext(directory, size, match_rate, seed)
+            results = report['results'][str(size)] = {}
+            for name, setup in cases.items():
+                try:
+                    results[name] = measure(setup, context, track_memory)
+                except Exception as error:
+                    results[name] = {'seconds': None, 'peak_mb': None, 'error': f'{type(error).__name__}: {error}'}
+                _print_result(size, name, results[name])
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return report
+
+def _print_result(size, name, result):
+    if result['error']:
+        print(f"{size:>9,}  {name:<62} ERROR {result['error'][:80]}")
+        return
+    memory = f"{result['peak_mb']:9.1f} MB" if result['peak_mb'] is not None else ''
+    print(f"{size:>9,}  {name:<62} {result['seconds']:9.3f} s {memory}")
+
+def find_regressions(report, baseline, tolerance=0.2, min_seconds=0.05, min_mb=1.0):
+    """
+    Compares a report with a baseline. A case regresses when its time or peak memory grows
+    by more than 'tolerance', ignoring differences below the noise floors.
+    """
+    regressions = []
+    for size, results in report['results'].items():
+        for name, result in results.items():
+            previous = baseline.get('results', {}).get(size, {}).get(name)
+            if not previous or result['error'] or previous.get('error'):
+                continue
+            for metric, floor in (('seconds', min_seconds), ('peak_mb', min_mb)):
+                new, old = result.get(metric), previous.get(metric)
+                if new is None or old is None:
+                    continue
+                if new > old * (1 + tolerance) and new - old > floor:
+                    regressions.append({'size': size, 'case': name, 'metric': metric, 'baseline': old, 'current': new})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the matching pipeline on synthetic data")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help="numbers of products to generate")
+    parser.add_argument('--match-rate', type=float, default=0.7, help="share of products derived from price list items")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='+', help="run only the cases whose name contains one of these strings")
+    parser.add_argument('--no-memory', action='store_true', help="skip the traced peak memory measurement")
+    parser.add_argument('--output', default=RESULTS_FILE)
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative slowdown before flagging")
+    parser.add_argument('--workdir', help="directory for the generated datasets, a temporary one by default")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sizes, args.match_rate, args.seed, args.only, not args.no_memory, args.workdir)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as file:
+        regressions = find_regressions(report, json.load(file), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression['size']:>9} {regression['case']} {regression['metric']}: "
+              f"{regression['baseline']:.3f} -> {regression['current']:.3f}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import pandas as pd
+import numpy as np
+
+from data_config import FINISHES
+from finish_index import FinishPriceIndex
+from substring_automaton import SubstringAutomaton
+
+# Upcharge applied to items ordered in a custom finish
+CUSTOM_FINISH_UPCHARGE = 1.2
+
+
+def build_base_price_table(price_list_dict, finishes=FINISHES):
+    """
+    Builds the base item -> price table from every sheet in one go. The keys are the
+    normalized items with their finish removed; when a key repeats, the last row in
+    workbook order wins, as it did when the sheets were read row by row into a dict.
+    """
+    return FinishPriceIndex(price_list_dict, finishes).base_prices(keep='last')
+
+
+class CustomFinishPricer:
+    """
+    Prices descriptions against a base price table. Descriptions ending in 'XX' take the
+    price of the exact key; any other description takes the highest price among the keys
+    it contains, plus the custom finish upcharge.
+    """
+
+    def __init__(self, price_table):
+        self.price_table = price_table
+        self._automaton = SubstringAutomaton(price_table.to_dict())
+
+    @classmethod
+    def from_price_list(cls, price_list_dict, finishes=FINISHES):
+        return cls(build_base_price_table(price_list_dict, finishes))
+
+    @classmethod
+    def from_finish_index(cls, finish_index):
+        return cls(finish_index.base_prices(keep='last'))
+
+    def candidates(self, prepared_descriptions):
+        """
+        The base items each description's price is chosen from: the description itself when
+        it ends in 'XX', otherwise every base item it contains. Returns a series of lists.
+        """
+        return prepared_descriptions.map(
+            lambda description: [description] if description.endswith('XX') else self._automaton.contained(description)
+        )
+
+    def sources(self, prepared_descriptions):
+        """
+        The base item each description is priced from: the highest priced of its candidates,
+        the first one found on a tie, or None when none of them has a price.
+        """
+        prices = self.price_table.to_dict()
+
+        def best(candidates):
+            best_item, best_price = None, np.nan
+            for candidate in candidates:
+                price = prices.get(candidate, np.nan)
+                if not np.isnan(price) and (np.isnan(best_price) or price > best_price):
+                    best_item, best_price = candidate, price
+            return best_item
+
+        return self.candidates(prepared_descriptions).map(best)
+
+    def price(self, prepared_descriptions):
+        """
+        Prices a series of normalized descriptions in one pass. Each distinct
+        description is resolved once and the prices are mapped back to every row.
+        """
+        codes, uniques = pd.factorize(prepared_descriptions)
+        uniques = pd.Series(uniques, dtype=object)
+        is_standard = uniques.str.endswith('XX').fillna(False).to_numpy(dtype=bool)
+
+        unique_prices = np.full(len(uniques), np.nan)
+        positions = self.price_table.index.get_indexer(uniques[is_standard])
+        unique_prices[is_standard] = np.where(
+            positions >= 0, self.price_table.to_numpy()[positions] if len(self.price_table) else np.nan, np.nan)
+        unique_prices[~is_standard] = (
+            self._automaton.max_contained_series(uniques[~is_standard]).to_numpy() * CUSTOM_FINISH_UPCHARGE
+        )
+
+        prices = np.where(codes >= 0, unique_prices[codes] if len(unique_prices) else np.nan, np.nan)
+        return pd.Series(prices, index=prepared_descriptions.index)
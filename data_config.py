@@ -1,54 +1,71 @@
-# Column types of the products dataframe
-COLUMN_TYPES = {
-    'Desc1': str,
-    'Desc2': str,
-    'Desc3': str,
-    'Desc4': str,
-    'Desc5': str,
-    'Status': int,
-    'Buy Line': str,
-    'Price Line': str,
-    'LIST PRICE': float,
-    'REP COST': float
-}
-
-# Define sheet types for categorizing product sheets
-SHEET_DICT = {
-    'Cabinet Knobs': 'individual', 
-    'Cabinet Pulls': 'individual',
-    'Appliance Pulls': 'individual', 
-    'Back to Back Appliance Pulls': 'individual',
-    'Revival Modern': 'kit', 
-    'Revival Modern Special Finish': 'kit', 
-    'Revival Classic': 'kit',
-    'Revival Classic Special Finish': 'kit', 
-    'Revival Components': 'individual',
-    'Revival Components Special Fin': 'individual', 
-    'Vents & Registers': 'individual',
-    'Artisan Door Pulls': 'individual', 
-    'Bath Suites': 'individual', 
-    'Heritage': 'kit',
-    'Metro Knobs + Levers': 'kit', 
-    'Metro Tubular': 'kit', 
-    'Metro Pocket Door + Thumb Turn': 'kit',
-    'Accessories': 'individual',
-}
-
-
-# List of finishes used across all product lines.
-FINISHES = (
-    'AB', 'BAB', 'BN', 'BRAB', 'BRB', 'BBML', 'BRN', 'DB', 'BP', 'NB', 'MB', 'SN',
-    'ORB', 'PW', 'BLN', 'PB', 'PC', 'PN', 'SB', 'UB',
-)
-
-# Revival sheet names categorized under different design themes.
-REVIVAL_SHEETS = (
-    'Revival Classic', 'Revival Classic Special Finish',
-    'Revival Modern', 'Revival Modern Special Finish', 
-    'Heritage',
-)
-
-# Names of sheets related to Metro product lines.
-METRO_SHEET_NAMES = (
-    'Metro Knobs + Levers', 'Metro Pocket Door + Thumb Turn', 'Metro Tubular',
-)
+# Column types of the products dataframe
+COLUMN_TYPES = {
+    'Desc1': str,
+    'Desc2': str,
+    'Desc3': str,
+    'Desc4': str,
+    'Desc5': str,
+    'Status': int,
+    'Buy Line': str,
+    'Price Line': str,
+    'LIST PRICE': float,
+    'REP COST': float
+}
+
+# Columns of the products export used by the pipeline, in their cleaned names
+PRODUCT_COLUMNS = ['ID'] + list(COLUMN_TYPES)
+
+# Low-cardinality product columns stored as categoricals by the streaming loader
+CATEGORICAL_PRODUCT_COLUMNS = ('Status', 'Buy Line', 'Price Line')
+
+# Define sheet types for categorizing product sheets
+SHEET_DICT = {
+    'Cabinet Knobs': 'individual', 
+    'Cabinet Pulls': 'individual',
+    'Appliance Pulls': 'individual', 
+    'Back to Back Appliance Pulls': 'individual',
+    'Revival Modern': 'kit', 
+    'Revival Modern Special Finish': 'kit', 
+    'Revival Classic': 'kit',
+    'Revival Classic Special Finish': 'kit', 
+    'Revival Components': 'individual',
+    'Revival Components Special Fin': 'individual', 
+    'Vents & Registers': 'individual',
+    'Artisan Door Pulls': 'individual', 
+    'Bath Suites': 'individual', 
+    'Heritage': 'kit',
+    'Metro Knobs + Levers': 'kit', 
+    'Metro Tubular': 'kit', 
+    'Metro Pocket Door + Thumb Turn': 'kit',
+    'Accessories': 'individual',
+}
+
+
+# List of finishes used across all product lines.
+FINISHES = (
+    'AB', 'BAB', 'BN', 'BRAB', 'BRB', 'BBML', 'BRN', 'DB', 'BP', 'NB', 'MB', 'SN',
+    'ORB', 'PW', 'BLN', 'PB', 'PC', 'PN', 'SB', 'UB',
+)
+
+# Revival sheet names categorized under different design themes.
+REVIVAL_SHEETS = (
+    'Revival Classic', 'Revival Classic Special Finish',
+    'Revival Modern', 'Revival Modern Special Finish', 
+    'Heritage',
+)
+
+# Names of sheets related to Metro product lines.
+METRO_SHEET_NAMES = (
+    'Metro Knobs + Levers', 'Metro Pocket Door + Thumb Turn', 'Metro Tubular',
+)
+
+# Mechanism codes of Metro mortise sets, as they appear after the numeric body of an item,
+# mapped to their names. The supplier's codes have not been confirmed against its catalogue yet,
+# so both maps are empty and the Metro mortise and tubular stages match nothing. A supplier whose
+# codes are known lists them with 'mortise_types' and 'tubular_types' in its SupplierConfig
+# (see supplier_config.py and the batch manifest).
+MORTISE_TYPES = {}
+
+# Mechanism codes of Metro tubular sets. No code may contain a mortise code, so each
+# set is claimed by one of the two maps only.
+TUBULAR_TYPES = {}
@@ -1,122 +1,260 @@
-import pandas as pd
-import numpy as np
-import os
-from datetime import datetime
-import re
-from data_config import COLUMN_TYPES, SHEET_DICT
-
-def load_eclipse_products():
-    current_directory = os.getcwd()
-    csv_file_path = os.path.join(current_directory, "All products information.csv")
-
-
-    try:
-        # Load the CSV file, skip the first 8 rows, and set the 9th row as the header, treat all columns as strings
-        products = pd.read_csv(csv_file_path, skiprows = 8, header = 0, dtype = str)
-
-    except UnicodeDecodeError:
-          products = pd.read_csv(csv_file_path, skiprows=8, header=0, encoding='ISO-8859-1', dtype = str)
-            
-    return products
-
-def clean_eclipse_products(df):
-     dataframe = df.copy()
-     # Dropping and renaming
-     dataframe = dataframe.iloc[2:].rename(columns={'DESC': 'Desc5', 'Sta': 'Status'})
-
-     # Ensure the 'Desc5' column is right after 'Desc4', if both exist
-     if 'Desc5' in dataframe.columns and 'Desc4' in dataframe.columns:
-        cols = dataframe.columns.tolist()
-        desc5 = dataframe['Desc5']
-        dataframe.drop(labels = ['Desc5'], axis = 1, inplace= True)
-        dataframe.insert(cols.index('Desc4')+1, 'Desc5', desc5)
-
-     # Handle non-numeric values from the columns
-     dataframe['Status'] = pd.to_numeric(dataframe['Status'], errors = 'coerce').fillna(0).astype(int)
-     dataframe['LIST PRICE'] = pd.to_numeric(dataframe['LIST PRICE'], errors = 'coerce')
-     dataframe['REP COST'] = pd.to_numeric(dataframe['REP COST'], errors = 'coerce')
-
-     # Drop rows where 'ID' or 'Desc1' is NA
-     dataframe.dropna(subset=['ID', 'Desc1'], inplace=True)
-
-         # Apply the column_types to set final dtypes to columns
-     for col, dtype in COLUMN_TYPES.items():
-        if col in dataframe.columns:
-            dataframe[col] = dataframe[col].astype(dtype)
-
-     if 'ID' in dataframe.columns:
-        # Drop rows where 'ID' is NA
-        dataframe.dropna(subset=['ID'], inplace = True)
-        # Convert 'ID' to integers
-        dataframe['ID'] = dataframe['ID'].astype(int)
-
-     dataframe = dataframe.replace('(?<!^)\^', '"', regex=True)
-
-     return dataframe.fillna("")
-
-# Function to extract and parse date from filename
-def extract_date(filename):
-    # Regex pattern to match dates in the format "01.24.2024" or "2024-01-24"
-    pattern = r'(\d{2}\.\d{2}\.\d{4})|(\d{4}-\d{2}-\d{2})'
-    match = re.search(pattern, filename)
-    if match:
-        date_str = match.group()
-        for fmt in ('%m.%d.%Y', '%Y-%m-%d'):
-            try:
-                return datetime.strptime(date_str, fmt)
-            except ValueError:
-                pass
-            
-    return datetime.min
-
-def load_price_list():
-    
-    # List all files in the current directory
-    current_directory = os.getcwd()
-    files = os.listdir(current_directory)
-
-    # Filter out all files that contain "Price List"
-    price_list_files = [file for file in files if "price list" in file.lower() and file.endswith('.xlsx')]
-
-    # Determine the file with the latest date
-    latest_prices = max(price_list_files, key = extract_date, default = None)
-
-    # Read the current file
-    if latest_prices:
-        price_list = pd.read_excel(os.path.join(current_directory, latest_prices), sheet_name = None)
-        print(f"Loaded file: {latest_prices}")
-        
-    else:
-        
-        print("No 'Price List' file was found with a valid date, please follow file naming conventions")
-    return price_list
-
-def clean_price_list(d_dfs):
-    
-    dict_of_dfs = d_dfs.copy()
-    
-    for sheet_name, sheet_df in dict_of_dfs.items():
-
-        first_non_null_column = next((col for col in sheet_df.columns if sheet_df[col].notna().any()), None)
-
-        sheet_df.dropna(subset = [first_non_null_column], inplace = True)
-        price_column_set = False
-
-        columns_to_drop = []
-
-        for column in sheet_df.columns:
-            if sheet_df[column].dtype == 'float' and not price_column_set:
-                sheet_df.rename(columns = {column: 'PRICE'}, inplace = True)
-                price_column_set = True
-                
-            elif sheet_df[column].dtype == 'float' and price_column_set:
-                columns_to_drop.append(column)
-                
-        sheet_df.drop(columns = columns_to_drop, inplace = True)
-        sheet_df.dropna(subset = ['PRICE'], inplace = True)
-    
-    return dict_of_dfs
-
-def filter_price_list(dict_of_dfs, category='individual'):
-    return {sheet_name: sheet_df for sheet_name, sheet_df in dict_of_dfs.items() if SHEET_DICT.get(sheet_name) == category}
-
+import pandas as pd
+import numpy as np
+import os
+from datetime import datetime
+import re
+import csv
+import codecs
+from pandas.api.types import union_categoricals
+from data_config import COLUMN_TYPES, SHEET_DICT, PRODUCT_COLUMNS, CATEGORICAL_PRODUCT_COLUMNS
+
+# Strings read as missing values, the same set pandas uses by default
+CSV_NULL_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+]
+
+def load_eclipse_products():
+    current_directory = os.getcwd()
+    csv_file_path = os.path.join(current_directory, "All products information.csv")
+
+
+    try:
+        # Load the CSV file, skip the first 8 rows, and set the 9th row as the header, treat all columns as strings
+        products = pd.read_csv(csv_file_path, skiprows = 8, header = 0, dtype = str)
+
+    except UnicodeDecodeError:
+          products = pd.read_csv(csv_file_path, skiprows=8, header=0, encoding='ISO-8859-1', dtype = str)
+            
+    return products
+
+def clean_eclipse_products(df):
+     # Dropping the first two rows, then cleaning
+     return clean_eclipse_products_chunk(df.iloc[2:].copy())
+
+def clean_eclipse_products_chunk(dataframe):
+     """
+     Cleans a block of rows of the Eclipse export and returns it.
+     Used on the whole export by clean_eclipse_products and on every chunk by the streaming loader.
+     """
+     # Renaming
+     dataframe = dataframe.rename(columns={'DESC': 'Desc5', 'Sta': 'Status'})
+
+     # Ensure the 'Desc5' column is right after 'Desc4', if both exist
+     if 'Desc5' in dataframe.columns and 'Desc4' in dataframe.columns:
+        cols = dataframe.columns.tolist()
+        desc5 = dataframe['Desc5']
+        dataframe.drop(labels = ['Desc5'], axis = 1, inplace= True)
+        dataframe.insert(cols.index('Desc4')+1, 'Desc5', desc5)
+
+     # Handle non-numeric values from the columns
+     dataframe['Status'] = pd.to_numeric(dataframe['Status'], errors = 'coerce').fillna(0).astype(int)
+     dataframe['LIST PRICE'] = pd.to_numeric(dataframe['LIST PRICE'], errors = 'coerce')
+     dataframe['REP COST'] = pd.to_numeric(dataframe['REP COST'], errors = 'coerce')
+
+     # Drop rows where 'ID' or 'Desc1' is NA
+     dataframe.dropna(subset=['ID', 'Desc1'], inplace=True)
+
+         # Apply the column_types to set final dtypes to columns
+     for col, dtype in COLUMN_TYPES.items():
+        if col in dataframe.columns:
+            dataframe[col] = dataframe[col].astype(dtype)
+
+     if 'ID' in dataframe.columns:
+        # Drop rows where 'ID' is NA
+        dataframe.dropna(subset=['ID'], inplace = True)
+        # Convert 'ID' to integers
+        dataframe['ID'] = dataframe['ID'].astype(int)
+
+     dataframe = dataframe.replace(r'(?<!^)\^', '"', regex=True)
+
+     return dataframe.fillna("")
+
+def detect_encoding(file_path, chunk_size = 1 << 20):
+    """
+    Returns 'utf-8' if the whole file decodes as UTF-8, otherwise 'ISO-8859-1'.
+    The file is read in chunks, so memory use does not depend on its size.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(chunk_size), b''):
+                decoder.decode(chunk)
+        decoder.decode(b'', final = True)
+    except UnicodeDecodeError:
+        return 'ISO-8859-1'
+    return 'utf-8'
+
+def iter_eclipse_product_chunks(csv_file_path = None, columns = PRODUCT_COLUMNS, memory_budget_mb = 256, encoding = None):
+    """
+    Streams the Eclipse export with pyarrow's CSV reader and yields cleaned chunks.
+    Only the given columns are parsed, and the chunk size is derived from the memory budget.
+    The row index of every chunk matches the one clean_eclipse_products would give.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pv
+
+    csv_file_path = csv_file_path or os.path.join(os.getcwd(), "All products information.csv")
+    encoding = encoding or detect_encoding(csv_file_path)
+
+    with open(csv_file_path, 'rb') as file:
+        # Skip the first 8 lines, the 9th is the header
+        for _ in range(8):
+            file.readline()
+        header_position = file.tell()
+        header = next(csv.reader([file.readline().decode(encoding)]))
+        file.seek(header_position)
+
+        # Project to the columns the pipeline uses, under their raw export names
+        raw_names = {'Desc5': 'DESC', 'Status': 'Sta'}
+        wanted = {raw_names.get(column, column) for column in columns}
+        include_columns = [column for column in header if column in wanted]
+
+        # Each block is parsed into roughly a quarter of the budget, leaving room
+        # for its pandas conversion and the cleaned copy
+        block_size = max(1 << 20, memory_budget_mb * (1 << 20) // 4)
+        reader = pv.open_csv(
+            file,
+            read_options = pv.ReadOptions(encoding = encoding, block_size = block_size),
+            convert_options = pv.ConvertOptions(
+                include_columns = include_columns,
+                column_types = {column: pa.string() for column in include_columns},
+                strings_can_be_null = True,
+                null_values = CSV_NULL_VALUES,
+            ),
+        )
+
+        # The first two rows after the header are dropped, as in clean_eclipse_products
+        rows_to_skip, offset = 2, 0
+        for batch in reader:
+            # Missing strings come back as None; pandas' reader gives NaN
+            chunk = batch.to_pandas().fillna(np.nan)
+            chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+            offset += len(chunk)
+            if rows_to_skip:
+                skipped = min(rows_to_skip, len(chunk))
+                chunk, rows_to_skip = chunk.iloc[skipped:], rows_to_skip - skipped
+            if len(chunk):
+                yield clean_eclipse_products_chunk(chunk.copy())
+
+def load_clean_eclipse_products(csv_file_path = None, columns = PRODUCT_COLUMNS, memory_budget_mb = 256, encoding = None):
+    """
+    Low-memory replacement for clean_eclipse_products(load_eclipse_products()).
+    Chunks are cleaned as they are read, and the low-cardinality columns are stored as categoricals.
+    Every chunk is split into its columns as soon as it is cleaned, and the frame is put together
+    one column at a time, each column's pieces freed once joined, so at most one column is held
+    twice; concatenating the chunks would copy every column while all the chunks are still held.
+    memory_budget_mb only bounds the parse buffers of each chunk: the frame returned, and the
+    cleaning of a chunk, take more than that.
+    """
+    pieces, index_pieces = {}, []
+    for chunk in iter_eclipse_product_chunks(csv_file_path, columns, memory_budget_mb, encoding):
+        index_pieces.append(chunk.index)
+        for column in chunk.columns:
+            values = chunk[column]
+            if column in CATEGORICAL_PRODUCT_COLUMNS:
+                values = values.astype('category')
+            else:
+                # A copy of its own, so the chunk's blocks are not kept alive by one column
+                values = values.copy()
+            pieces.setdefault(column, []).append(values)
+        del chunk
+
+    if not index_pieces:
+        return pd.DataFrame(columns = columns)
+
+    products = pd.DataFrame(index = index_pieces[0].append(index_pieces[1:]))
+    for column in list(pieces):
+        column_pieces = pieces.pop(column)
+        if column in CATEGORICAL_PRODUCT_COLUMNS:
+            # The union keeps every chunk's categories, in the order they first appear
+            products[column] = union_categoricals([piece.array for piece in column_pieces])
+        else:
+            products[column] = pd.concat(column_pieces, ignore_index = True).array
+        column_pieces.clear()
+    return products
+
+# Function to extract and parse date from filename
+def extract_date(filename):
+    # Regex pattern to match dates in the format "01.24.2024" or "2024-01-24"
+    pattern = r'(\d{2}\.\d{2}\.\d{4})|(\d{4}-\d{2}-\d{2})'
+    match = re.search(pattern, filename)
+    if match:
+        date_str = match.group()
+        for fmt in ('%m.%d.%Y', '%Y-%m-%d'):
+            try:
+                return datetime.strptime(date_str, fmt)
+            except ValueError:
+                pass
+            
+    return datetime.min
+
+def find_price_list_versions(directory=None):
+    """
+    Returns the paths of all the 'Price List' workbooks, oldest first by the date in their name.
+    """
+    # List all files in the directory, the current one by default
+    current_directory = directory or os.getcwd()
+    files = os.listdir(current_directory)
+
+    # Filter out all files that contain "Price List", leaving out the '~$' lock files Excel keeps for open workbooks
+    price_list_files = [
+        file for file in files
+        if "price list" in file.lower() and file.endswith('.xlsx') and not file.startswith('~$')
+    ]
+
+    # Sort by date; on equal dates the first listed file sorts last, the one max() used to pick
+    price_list_files = sorted(reversed(price_list_files), key = extract_date)
+    return [os.path.join(current_directory, file) for file in price_list_files]
+
+def find_latest_price_list(directory=None):
+    """
+    Returns the path of the 'Price List' workbook with the most recent date in its name, or None.
+    """
+    versions = find_price_list_versions(directory)
+    return versions[-1] if versions else None
+
+def load_price_list():
+    
+    latest_prices = find_latest_price_list()
+    price_list = None
+
+    # Read the current file
+    if latest_prices:
+        price_list = pd.read_excel(latest_prices, sheet_name = None)
+        print(f"Loaded file: {os.path.basename(latest_prices)}")
+        
+    else:
+        
+        print("No 'Price List' file was found with a valid date, please follow file naming conventions")
+    return price_list
+
+def clean_price_list(d_dfs):
+    
+    dict_of_dfs = d_dfs.copy()
+    
+    for sheet_name, sheet_df in dict_of_dfs.items():
+
+        first_non_null_column = next((col for col in sheet_df.columns if sheet_df[col].notna().any()), None)
+
+        sheet_df.dropna(subset = [first_non_null_column], inplace = True)
+        price_column_set = False
+
+        columns_to_drop = []
+
+        for column in sheet_df.columns:
+            if sheet_df[column].dtype == 'float' and not price_column_set:
+                sheet_df.rename(columns = {column: 'PRICE'}, inplace = True)
+                price_column_set = True
+                
+            elif sheet_df[column].dtype == 'float' and price_column_set:
+                columns_to_drop.append(column)
+                
+        sheet_df.drop(columns = columns_to_drop, inplace = True)
+        sheet_df.dropna(subset = ['PRICE'], inplace = True)
+    
+    return dict_of_dfs
+
+def filter_price_list(dict_of_dfs, category='individual', sheet_dict=SHEET_DICT):
+    return {sheet_name: sheet_df for sheet_name, sheet_df in dict_of_dfs.items() if sheet_dict.get(sheet_name) == category}
+
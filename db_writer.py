@@ -0,0 +1,151 @@
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine, MetaData, Table, select, update, insert, bindparam
+from sqlalchemy.exc import DBAPIError
+
+# Column the upserts are keyed on
+UPSERT_KEY = 'ID'
+
+
+def create_database_engine(url, pool_size=5, **engine_options):
+    """
+    Creates a pooled engine from an SQLAlchemy URL, e.g. 'sqlite:///eclipse.db'.
+    """
+    return create_engine(url, pool_size=pool_size, pool_pre_ping=True, **engine_options)
+
+def _records(df):
+    """
+    Converts a DataFrame to a list of dicts of native Python values, with None for missing values.
+    """
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+def _upsert_statement(table, columns, dialect):
+    """
+    Builds a dialect-native upsert keyed on ID, or returns None if the dialect has none.
+    """
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        statement = dialect_insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=[table.c[UPSERT_KEY]],
+            set_={column: statement.excluded[column] for column in columns if column != UPSERT_KEY},
+        )
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        statement = dialect_insert(table)
+        return statement.on_duplicate_key_update(
+            {column: statement.inserted[column] for column in columns if column != UPSERT_KEY}
+        )
+    return None
+
+def _classify_batch(connection, table, batch, columns):
+    """
+    Splits a batch into the rows that are new to the table and the rows whose values differ from it.
+    """
+    query = select(*[table.c[column] for column in columns]).where(
+        table.c[UPSERT_KEY].in_(batch[UPSERT_KEY].tolist())
+    )
+    existing = pd.DataFrame(connection.execute(query).fetchall(), columns=columns)
+
+    is_new = ~batch[UPSERT_KEY].isin(existing[UPSERT_KEY])
+    compared = batch[~is_new].merge(existing, on=UPSERT_KEY, how='left', suffixes=('', ' CURRENT'))
+    is_changed = pd.Series(False, index=compared.index)
+    for column in columns:
+        if column == UPSERT_KEY:
+            continue
+        new_values, current_values = compared[column].astype(object), compared[f'{column} CURRENT'].astype(object)
+        same = (new_values == current_values) | (new_values.isna() & current_values.isna())
+        is_changed |= ~same
+
+    changed_ids = compared.loc[is_changed, UPSERT_KEY]
+    return batch[is_new], batch[batch[UPSERT_KEY].isin(changed_ids)]
+
+def _write_batch(connection, table, new_rows, changed_rows, columns):
+    """
+    Upserts the new and changed rows with one executemany call,
+    or one UPDATE and one INSERT executemany where the dialect has no upsert.
+    """
+    statement = _upsert_statement(table, columns, connection.dialect.name)
+    if statement is not None:
+        rows = pd.concat([new_rows, changed_rows])
+        if len(rows):
+            connection.execute(statement, _records(rows))
+        return
+
+    if len(changed_rows):
+        value_columns = [column for column in columns if column != UPSERT_KEY]
+        parameters = {f'value_{position}': column for position, column in enumerate(value_columns)}
+        statement = update(table).where(table.c[UPSERT_KEY] == bindparam('key_value')).values(
+            {column: bindparam(name) for name, column in parameters.items()}
+        )
+        records = [
+            {'key_value': record[UPSERT_KEY], **{name: record[column] for name, column in parameters.items()}}
+            for record in _records(changed_rows)
+        ]
+        connection.execute(statement, records)
+    if len(new_rows):
+        connection.execute(insert(table), _records(new_rows))
+
+def write_price_updates(final_update, url=None, table_name='products', batch_size=1000,
+                        max_retries=3, retry_delay=1.0, dry_run=False, columns=None, engine=None):
+    """
+    Pushes the updated prices straight into the database, upserting on ID.
+    Each batch runs in its own transaction and is retried with exponential backoff
+    if it fails. Only rows that are new or whose values differ are written.
+    With dry_run, nothing is written and the counts report what would change.
+    Returns the run metrics, including throughput in rows inserted and updated per second.
+    """
+    engine = engine or create_database_engine(url)
+    table = Table(table_name, MetaData(), autoload_with=engine)
+
+    # Only the columns the table has are written, always including the key
+    columns = [column for column in (columns or final_update.columns) if column in table.c]
+    if UPSERT_KEY not in columns:
+        columns.insert(0, UPSERT_KEY)
+    data = final_update[columns].drop_duplicates(subset=[UPSERT_KEY], keep='last')
+
+    metrics = {
+        'rows': len(data), 'batches': 0, 'new': 0, 'changed': 0, 'unchanged': 0, 'written': 0,
+        'retries': 0, 'failed_batches': 0, 'failed_rows': 0, 'dry_run': dry_run,
+    }
+    start_time = time.perf_counter()
+
+    for start in range(0, len(data), batch_size):
+        batch = data.iloc[start:start + batch_size]
+        metrics['batches'] += 1
+        for attempt in range(max_retries + 1):
+            try:
+                with engine.begin() as connection:
+                    new_rows, changed_rows = _classify_batch(connection, table, batch, columns)
+                    if not dry_run:
+                        _write_batch(connection, table, new_rows, changed_rows, columns)
+                break
+            except DBAPIError as error:
+                if attempt == max_retries:
+                    print(f"Batch starting at row {start} failed after {max_retries + 1} attempts: {error}")
+                    metrics['failed_batches'] += 1
+                    metrics['failed_rows'] += len(batch)
+                    new_rows = changed_rows = batch.iloc[0:0]
+                    break
+                metrics['retries'] += 1
+                time.sleep(retry_delay * 2 ** attempt)
+
+        metrics['new'] += len(new_rows)
+        metrics['changed'] += len(changed_rows)
+        if not dry_run:
+            metrics['written'] += len(new_rows) + len(changed_rows)
+
+    metrics['unchanged'] = metrics['rows'] - metrics['new'] - metrics['changed'] - metrics['failed_rows']
+    metrics['seconds'] = time.perf_counter() - start_time
+    # Throughput counts the rows inserted and updated (or that would be), not the unchanged ones skipped
+    written = metrics['new'] + metrics['changed']
+    metrics['rows_per_second'] = written / metrics['seconds'] if metrics['seconds'] else 0.0
+
+    action = "Would write" if dry_run else "Wrote"
+    print(f"{action} {written} rows ({metrics['new']} new, {metrics['changed']} changed, "
+          f"{metrics['unchanged']} unchanged) in {metrics['seconds']:.2f}s, {metrics['rows_per_second']:.0f} rows/s")
+    return metrics
@@ -0,0 +1,140 @@
+import pandas as pd
+import numpy as np
+
+import utils as ut
+import basic_matching as bm
+from data_config import FINISHES
+from supplier_config import DEFAULT_CONFIG
+from match_context import MatchContext, config_for
+from data_loading import find_price_list_versions, filter_price_list
+from price_list_cache import load_clean_workbook
+from workbook_reader import close_workbook
+from pipeline import price_products
+from substring_automaton import SubstringAutomaton
+
+def keyed_sheet(sheet_df):
+    """
+    Normalized item key, original item and price of every row of a sheet.
+    The first row of a repeated key wins, as in the PriceIndex.
+    """
+    item_column = ut.get_item_column(sheet_df)
+    price_column = ut.get_price_column(sheet_df)
+    if item_column is None:
+        return pd.DataFrame(columns=['temp_match_col', 'ITEM', 'PRICE'])
+
+    sheet_df = sheet_df.dropna(subset=[item_column])
+    keyed = pd.DataFrame({
+        'temp_match_col': ut.prepare_data_for_matching(sheet_df[item_column]),
+        'ITEM': sheet_df[item_column],
+        'PRICE': pd.to_numeric(sheet_df[price_column], errors='coerce') if price_column else np.nan,
+    })
+    return keyed.drop_duplicates(subset=['temp_match_col'], keep='first')
+
+def diff_price_lists(old_price_list, new_price_list):
+    """
+    Compares two versions of the price list sheet by sheet, on normalized item key and price.
+    Returns one row per key that was 'added', 'removed' or 'changed', with both prices.
+    """
+    changes = []
+    sheet_names = list(new_price_list) + [name for name in old_price_list if name not in new_price_list]
+    for sheet_name in sheet_names:
+        old_keys = keyed_sheet(old_price_list.get(sheet_name, pd.DataFrame()))
+        new_keys = keyed_sheet(new_price_list.get(sheet_name, pd.DataFrame()))
+        merged = old_keys.merge(new_keys, on='temp_match_col', how='outer', suffixes=(' OLD', ' NEW'), indicator=True)
+
+        price_changed = ~(
+            (merged['PRICE OLD'] == merged['PRICE NEW'])
+            | (merged['PRICE OLD'].isna() & merged['PRICE NEW'].isna())
+        )
+        merged['CHANGE'] = np.select(
+            [merged['_merge'] == 'right_only', merged['_merge'] == 'left_only', price_changed],
+            ['added', 'removed', 'changed'],
+            default='',
+        )
+        merged = merged[merged['CHANGE'] != '']
+        merged['ITEM'] = merged['ITEM NEW'].fillna(merged['ITEM OLD'])
+        merged['SHEET'] = sheet_name
+        changes.append(merged[['SHEET', 'temp_match_col', 'ITEM', 'PRICE OLD', 'PRICE NEW', 'CHANGE']])
+
+    return pd.concat(changes, ignore_index=True) if changes else pd.DataFrame(
+        columns=['SHEET', 'temp_match_col', 'ITEM', 'PRICE OLD', 'PRICE NEW', 'CHANGE'])
+
+def find_affected_products(products, changes, product_keys=None, finishes=FINISHES):
+    """
+    Flags the products that any stage of the cascade could match to a changed item.
+    A product is affected when its normalized description contains the changed key,
+    the key without its finish, or the base part of a kit item (before the first '-').
+    This over-approximates the cascade, so re-pricing the flagged rows is enough.
+    """
+    items = changes['ITEM'].astype(str)
+    candidate_keys = pd.concat([
+        changes['temp_match_col'],
+        ut.vectorized_remove_finishes(changes['temp_match_col'], finishes),
+        ut.prepare_data_for_matching(items.str.split('-').str[0].str.strip()),
+    ])
+    candidate_keys = set(candidate_keys[candidate_keys != ''])
+
+    if product_keys is None:
+        product_keys = ut.prepare_data_for_matching(products[ut.get_dict_column(products)])
+    return SubstringAutomaton(candidate_keys).contains_any_series(product_keys)
+
+def drop_unchanged_prices(update, products):
+    """
+    Keeps only the updated rows whose price differs from the one currently in Eclipse.
+    """
+    current_prices = pd.to_numeric(products.set_index('ID')['LIST PRICE'], errors='coerce')
+    current_prices = current_prices[~current_prices.index.duplicated()]
+    old = current_prices.reindex(update['ID']).to_numpy()
+    new = pd.to_numeric(update['LIST PRICE'], errors='coerce').to_numpy()
+    unchanged = (old == new) | (np.isnan(old) & np.isnan(new))
+    return update[~unchanged]
+
+def delta_update(products, directory=None, sheet_workers=1, config=DEFAULT_CONFIG):
+    """
+    Re-prices only the products affected by the differences between the two most
+    recent price lists, with the sheets and tables of the supplier's config.
+    Returns the rows to update and the newly added items that are not created
+    in Eclipse yet. Returns None when there is no previous version.
+    """
+    versions = find_price_list_versions(directory)
+    if len(versions) < 2:
+        print("No previous 'Price List' to compare with, running a full update")
+        return None
+
+    old_price_list = load_clean_workbook(versions[-2], sheet_names=config.sheet_dict)
+    new_price_list = load_clean_workbook(versions[-1], sheet_names=config.sheet_dict)
+    context = MatchContext(products, new_price_list, sheet_workers, config=config)
+    try:
+        return reprice_changes(products, old_price_list, new_price_list, sheet_workers, context)
+    finally:
+        close_workbook(old_price_list)
+        close_workbook(new_price_list)
+
+def reprice_changes(products, old_price_list, new_price_list, sheet_workers=1, context=None):
+    """
+    Re-prices the products affected by the differences between two price lists already loaded.
+    With a MatchContext of the products, their keys are not derived again, and the sheets
+    and finishes are those of its supplier config.
+    Returns the rows to update and the newly added items that are not created in Eclipse yet.
+    """
+    changes = diff_price_lists(old_price_list, new_price_list)
+    for change, count in changes['CHANGE'].value_counts().items():
+        print(f"{change.capitalize()} keys: {count}")
+
+    config = config_for(context)
+    product_keys = context.keys if context is not None else None
+    affected = find_affected_products(products, changes, product_keys, config.finishes).to_numpy()
+    print(f"Products affected: {affected.sum()} of {len(products)}")
+    affected_context = context.derive(products[affected], new_price_list) if context is not None else None
+    update = price_products(products[affected], new_price_list, sheet_workers, affected_context)
+    update = drop_unchanged_prices(update, products)
+
+    # Only the added items can be new to Eclipse
+    added = changes[changes['CHANGE'] == 'added']
+    added_price_list = {
+        sheet_name: sheet_df[ut.prepare_data_for_matching(sheet_df[ut.get_item_column(sheet_df)]).isin(
+            added.loc[added['SHEET'] == sheet_name, 'temp_match_col'])]
+        for sheet_name, sheet_df in filter_price_list(new_price_list, 'individual', config.sheet_dict).items()
+    }
+    uncreated_items = bm.collect_uncreated_items(products, added_price_list, context=context)
+    return update, uncreated_items
@@ -0,0 +1,142 @@
+import os
+import gzip
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+from price_list_cache import file_hash
+
+# Output formats and the extension of their files
+EXPORT_FORMATS = {'csv': '.csv', 'gzip': '.csv.gz', 'zstd': '.csv.zst', 'parquet': '.parquet'}
+# Rows formatted at a time, and rows per Parquet row group
+CHUNK_ROWS = 20_000
+MANIFEST_FILE = 'manifest.json'
+
+
+def project_columns(df, columns=None):
+    """
+    The columns of 'df' to export, in the order given, or every column with None.
+    """
+    if columns is None:
+        return df
+    missing = [column for column in columns if column not in df.columns]
+    if missing:
+        raise ValueError(f"Columns {missing} are not in the export, expected some of {list(df.columns)}")
+    return df[list(columns)]
+
+def _compressor(file_format):
+    """
+    A function compressing one chunk of CSV bytes into a self-contained gzip member or
+    zstd frame, so that the compressed chunks can be concatenated into one valid file.
+    Both release the GIL while they compress.
+    """
+    if file_format == 'gzip':
+        return lambda data: gzip.compress(data, compresslevel=6)
+    if file_format == 'zstd':
+        import pyarrow as pa
+        codec = pa.Codec('zstd')
+        return lambda data: codec.compress(data, asbytes=True)
+    return None
+
+def _write_csv(df, path, file_format, chunk_rows, index, executor, max_pending):
+    """
+    Streams a frame to a CSV file chunk by chunk. Each chunk is formatted by pandas, the
+    same way to_csv formats the whole frame, and compressed on the thread pool while the
+    next ones are formatted; the chunks are written in order, at most max_pending of them
+    waiting in memory.
+    """
+    compress = _compressor(file_format)
+    pending = deque()
+    with open(path, 'wb') as file:
+        def write_ready(limit):
+            while len(pending) > limit:
+                data = pending.popleft()
+                file.write(data.result() if compress else data)
+
+        # An empty frame still gets its header
+        for start in range(0, max(len(df), 1), chunk_rows):
+            text = df.iloc[start:start + chunk_rows].to_csv(index=index, header=start == 0).encode()
+            pending.append(executor.submit(compress, text) if compress else text)
+            write_ready(max_pending)
+        write_ready(0)
+
+def _arrow_table(df, index):
+    import pyarrow as pa
+    try:
+        return pa.Table.from_pandas(df, preserve_index=index)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Text columns holding numbers as well are written as text
+        mixed = df.select_dtypes(include='object').columns
+        df = df.assign(**{column: df[column].map(lambda value: value if pd.isna(value) else str(value))
+                          for column in mixed})
+        return pa.Table.from_pandas(df, preserve_index=index)
+
+def _write_parquet(df, path, chunk_rows, index):
+    import pyarrow.parquet as pq
+    pq.write_table(_arrow_table(df, index), path, row_group_size=chunk_rows, compression='zstd')
+
+def _manifest_entry(df, path):
+    """
+    Describes a written batch file for the manifest.
+    """
+    entry = {'file': os.path.basename(path), 'rows': len(df), 'bytes': os.path.getsize(path), 'sha256': file_hash(path)}
+    if 'ID' in df.columns and len(df):
+        entry['first_id'], entry['last_id'] = df['ID'].iloc[0].item(), df['ID'].iloc[-1].item()
+    return entry
+
+def export_frame(df, name, directory='.', file_format='csv', columns=None, batch_rows=None, index=True,
+                 chunk_rows=CHUNK_ROWS, max_workers=None):
+    """
+    Exports a frame as CSV, gzip or zstd compressed CSV, or Parquet, keeping only 'columns'
+    when given. Without batch_rows, writes a single '<name><extension>' file. With batch_rows,
+    writes a '<name>' folder of files of at most that many rows each, for importers that
+    limit the size of an upload, and a manifest.json listing them in order with their rows,
+    size, SHA-256 and first and last ID. Compression runs on a pool of max_workers threads.
+    Returns the paths written: the file, or the batch files followed by the manifest.
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"file_format must be one of {list(EXPORT_FORMATS)}, got '{file_format}'")
+    df = project_columns(df, columns)
+    extension = EXPORT_FORMATS[file_format]
+
+    max_workers = max_workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if not batch_rows:
+            path = os.path.join(directory, f'{name}{extension}')
+            if file_format == 'parquet':
+                _write_parquet(df, path, chunk_rows, index)
+            else:
+                _write_csv(df, path, file_format, chunk_rows, index, executor, 2 * max_workers)
+            return [path]
+
+        folder = os.path.join(directory, name)
+        os.makedirs(folder, exist_ok=True)
+        batches = [
+            (df.iloc[start:start + batch_rows], os.path.join(folder, f'part-{number:04d}{extension}'))
+            for number, start in enumerate(range(0, max(len(df), 1), batch_rows), start=1)
+        ]
+        if file_format == 'parquet':
+            # pyarrow encodes and compresses outside the GIL, so the batches are written side by side
+            futures = [executor.submit(_write_parquet, batch, path, chunk_rows, index) for batch, path in batches]
+            for future in futures:
+                future.result()
+        else:
+            for batch, path in batches:
+                _write_csv(batch, path, file_format, chunk_rows, index, executor, 2 * max_workers)
+        files = [_manifest_entry(batch, path) for batch, path in batches]
+
+    manifest_path = os.path.join(folder, MANIFEST_FILE)
+    with open(manifest_path, 'w') as file:
+        json.dump({
+            'name': name,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'format': file_format,
+            'columns': list(df.columns),
+            'index': index,
+            'rows': len(df),
+            'batch_rows': batch_rows,
+            'files': files,
+        }, file, indent=2)
+    return [path for _, path in batches] + [manifest_path]
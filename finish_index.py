@@ -0,0 +1,71 @@
+import pandas as pd
+import utils as ut
+from data_config import FINISHES
+from backends import get_backend
+
+
+class FinishPriceIndex:
+    """
+    An index of base item -> {finish: price} over every sheet of a price list, e.g.
+    'PR205TL' -> {'PN': 120.0, 'SN': 110.0}. Items are normalized and split into base
+    and finish once, so later stages probe a dictionary instead of rewriting strings.
+    Items listed without a finish are kept under the finish None.
+    The items are normalized and split with 'backend', the pandas backend by default.
+    """
+
+    def __init__(self, price_list_dict, finishes=FINISHES, backend=None):
+        backend = get_backend(backend or 'pandas')
+        entries = []
+        for sheet_name, sheet_df in price_list_dict.items():
+            item_column = ut.get_item_column(sheet_df)
+            price_column = ut.get_price_column(sheet_df)
+            if item_column and price_column:
+                sheet_df = sheet_df.dropna(subset=[item_column])
+                parts = backend.split_finishes(backend.normalize(sheet_df[item_column]), finishes)
+                entries.append(pd.DataFrame({
+                    'BASE': parts['base'],
+                    'FINISH': parts['finish'],
+                    'PRICE': pd.to_numeric(sheet_df[price_column], errors='coerce'),
+                    'SHEET': sheet_name,
+                }))
+
+        # Entries stay in workbook order: sheet order, then row order
+        if entries:
+            self.entries = pd.concat(entries, ignore_index=True)
+        else:
+            self.entries = pd.DataFrame(columns=['BASE', 'FINISH', 'PRICE', 'SHEET'])
+
+        self._finish_prices = {}
+        for base, finish, price in zip(self.entries['BASE'], self.entries['FINISH'], self.entries['PRICE']):
+            # The first row listing a base item in a finish sets its price
+            self._finish_prices.setdefault(base, {}).setdefault(finish, price)
+
+    def __len__(self):
+        return len(self._finish_prices)
+
+    def __contains__(self, base):
+        return base in self._finish_prices
+
+    @property
+    def bases(self):
+        """
+        The base items of the price list, as a set.
+        """
+        return set(self._finish_prices)
+
+    def finish_prices(self, base):
+        """
+        Returns the {finish: price} dictionary of a base item, empty if it is not listed.
+        """
+        return self._finish_prices.get(base, {})
+
+    def price(self, base, finish):
+        return self.finish_prices(base).get(finish)
+
+    def base_prices(self, keep='first'):
+        """
+        One price per base item, regardless of its finish. With keep='first' the
+        first row listing the base item in workbook order wins, with keep='last' the last one.
+        """
+        entries = self.entries.drop_duplicates(subset=['BASE'], keep=keep)
+        return pd.Series(entries['PRICE'].to_numpy(dtype=float), index=pd.Index(entries['BASE'], dtype=object))
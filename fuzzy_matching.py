@@ -0,0 +1,159 @@
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+
+import pandas as pd
+import numpy as np
+import utils as ut
+from parallel_matching import keys_for_sheet
+
+# Length of the character n-grams indexed
+NGRAM_SIZE = 3
+# Candidates scored per product, and the suggestions kept for it
+TOP_K = 20
+MAX_SUGGESTIONS = 3
+# Suggestions scoring below this similarity are dropped
+MIN_SIMILARITY = 0.6
+# N-grams found in more than this share of the keys are too common to tell keys apart and are not indexed
+MAX_POSTING_SHARE = 0.05
+
+SUGGESTION_COLUMNS = ['ID', 'DESCRIPTION', 'RANK', 'SUGGESTED ITEM', 'SHEET', 'SIMILARITY', 'SUGGESTED PRICE']
+
+
+def ngrams(key, n=NGRAM_SIZE):
+    """
+    The set of character n-grams of a key, with '^' and '$' marking its start and end
+    so that keys sharing a beginning or an ending score higher.
+    """
+    padded = f'^{key}$'
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class NgramIndex:
+    """
+    An inverted index from character n-grams to the normalized price list keys containing them.
+    Candidates for a description are the keys sharing the most n-grams with it, found from the
+    postings of its own n-grams only, so a lookup never walks every key of the price list.
+    Only the top candidates by Dice similarity of their n-gram sets are scored more closely.
+    """
+
+    def __init__(self, entries, n=NGRAM_SIZE, max_posting_share=MAX_POSTING_SHARE):
+        self.n = n
+        self.entries = entries.reset_index(drop=True)
+        self._gram_counts = np.zeros(len(self.entries), dtype=int)
+
+        postings = defaultdict(list)
+        for position, key in enumerate(self.entries['KEY']):
+            grams = ngrams(key, n)
+            self._gram_counts[position] = len(grams)
+            for gram in grams:
+                postings[gram].append(position)
+
+        max_posting = max(1, int(len(self.entries) * max_posting_share))
+        self._postings = {gram: positions for gram, positions in postings.items() if len(positions) <= max_posting}
+
+    @classmethod
+    def from_price_list(cls, price_list_dict, sheet_keys=None, **kwargs):
+        """
+        Indexes the normalized items of every sheet, keeping the first row of a repeated key.
+        """
+        entries = []
+        for sheet_name, sheet_df in price_list_dict.items():
+            item_column = ut.get_item_column(sheet_df)
+            price_column = ut.get_price_column(sheet_df)
+            if not (item_column and price_column):
+                continue
+            if sheet_keys is not None:
+                keys = keys_for_sheet(sheet_keys, sheet_name)['temp_match_col']
+            else:
+                keys = ut.prepare_data_for_matching(sheet_df[item_column])
+            entries.append(pd.DataFrame({
+                'KEY': keys,
+                'ITEM': sheet_df[item_column],
+                'SHEET': sheet_name,
+                'PRICE': pd.to_numeric(sheet_df[price_column], errors='coerce'),
+            }).dropna(subset=['ITEM']))
+
+        if not entries:
+            return cls(pd.DataFrame(columns=['KEY', 'ITEM', 'SHEET', 'PRICE']), **kwargs)
+        entries = pd.concat(entries, ignore_index=True)
+        entries = entries[entries['KEY'] != ''].drop_duplicates(subset=['KEY'], keep='first')
+        return cls(entries, **kwargs)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def candidates(self, key, top_k=TOP_K):
+        """
+        Returns the positions and Dice similarities of the top_k keys closest to 'key', best first.
+        """
+        grams = ngrams(key, self.n)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+        if not shared:
+            return np.empty(0, dtype=int), np.empty(0)
+
+        positions = np.fromiter(shared.keys(), dtype=int, count=len(shared))
+        counts = np.fromiter(shared.values(), dtype=int, count=len(shared))
+        similarity = 2 * counts / (len(grams) + self._gram_counts[positions])
+        best = np.argsort(-similarity, kind='stable')[:top_k]
+        return positions[best], similarity[best]
+
+    def score(self, key, positions, min_similarity=0.0):
+        """
+        Similarity between 'key' and the keys at 'positions', from 0 to 1. It counts the
+        characters the keys share in order, so typos and transposed segments still score high.
+        Keys whose length alone already bounds the score below min_similarity score 0.
+        """
+        keys = self.entries['KEY'].to_numpy()
+        # The matcher caches what it learns about its second sequence, so the key goes there
+        matcher = SequenceMatcher(None, autojunk=False)
+        matcher.set_seq2(key)
+        scores = np.zeros(len(positions))
+        for i, position in enumerate(positions):
+            matcher.set_seq1(keys[position])
+            if matcher.real_quick_ratio() >= min_similarity:
+                scores[i] = matcher.ratio()
+        return scores
+
+
+def suggest_matches(unmatched_df, index, keys=None, max_suggestions=MAX_SUGGESTIONS,
+                    min_similarity=MIN_SIMILARITY, top_k=TOP_K):
+    """
+    Ranks price list items as suggestions for every product still unmatched.
+    Each distinct normalized description is looked up once. Returns one row per
+    suggestion for someone to review by hand: the products with the closest
+    suggestions come first, and each product's suggestions are ranked best first.
+    """
+    desc_column = ut.get_dict_column(unmatched_df)
+    if keys is None:
+        keys = ut.prepare_data_for_matching(unmatched_df[desc_column])
+
+    suggestions = []
+    for key in keys[keys != ''].unique():
+        positions, dice = index.candidates(key, top_k)
+        # Candidates sharing too few n-grams are not worth a closer look
+        positions = positions[dice >= min_similarity / 2]
+        similarity = index.score(key, positions, min_similarity)
+        best = np.argsort(-similarity, kind='stable')
+        best = best[similarity[best] >= min_similarity][:max_suggestions]
+        positions, similarity = positions[best], similarity[best]
+        for rank, (position, score) in enumerate(zip(positions, similarity), start=1):
+            suggestions.append((key, rank, position, score))
+
+    if not suggestions or len(index) == 0:
+        return pd.DataFrame(columns=SUGGESTION_COLUMNS)
+
+    suggestions = pd.DataFrame(suggestions, columns=['KEY', 'RANK', 'POSITION', 'SIMILARITY'])
+    matched = index.entries.iloc[suggestions['POSITION']].reset_index(drop=True)
+    suggestions = suggestions.assign(
+        **{'SUGGESTED ITEM': matched['ITEM'], 'SHEET': matched['SHEET'], 'SUGGESTED PRICE': matched['PRICE']}
+    )
+    products = pd.DataFrame({'ID': unmatched_df['ID'], 'DESCRIPTION': unmatched_df[desc_column], 'KEY': keys})
+    result = products.merge(suggestions, on='KEY', how='inner')
+    result['SIMILARITY'] = result['SIMILARITY'].round(3)
+    result['BEST'] = result.groupby('ID')['SIMILARITY'].transform('max')
+    result = result.sort_values(['BEST', 'ID', 'RANK'], ascending=[False, True, True], kind='stable')
+    return result[SUGGESTION_COLUMNS].reset_index(drop=True)
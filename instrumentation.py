@@ -0,0 +1,274 @@
+import os
+import sys
+import json
+import time
+import inspect
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+# Set to the folder the metrics are written to ('1' for the current folder) to profile a run
+PROFILE_ENV = 'PRICING_PROFILE'
+# Set to '1' to also track the peak memory of every call, which slows the run down
+PROFILE_MEMORY_ENV = 'PRICING_PROFILE_MEMORY'
+# Values of these variables that turn an option off, or on (in the current folder for PRICING_PROFILE)
+OFF_VALUES = ('', '0', 'false', 'no', 'off')
+ON_VALUES = ('1', 'true', 'yes', 'on')
+INSTRUMENTED_MODULES = ('utils', 'basic_matching', 'kit_matching', 'data_loading')
+METRICS_FILE = 'run_metrics.json'
+STACKS_FILE = 'run_stacks.folded'
+
+
+def _rows(value):
+    """
+    Rows held by a frame, a series, a dictionary of frames or a tuple of them, or None for anything else.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, dict) and value and all(isinstance(item, pd.DataFrame) for item in value.values()):
+        return sum(len(item) for item in value.values())
+    if isinstance(value, tuple):
+        counts = [_rows(item) for item in value]
+        counts = [count for count in counts if count is not None]
+        return sum(counts) if counts else None
+    return None
+
+def _cache_counters():
+    """
+    Hit and miss counters of the memoized steps, read from their lru_cache statistics.
+    """
+    from normalizer import DEFAULT_NORMALIZER
+    from sku_parser import DEFAULT_PARSER
+    import utils as ut
+
+    return {
+        'normalizer': DEFAULT_NORMALIZER.cache_info(),
+        'sku_parser': DEFAULT_PARSER.cache_info(),
+        'finish_pattern': ut.compile_finish_pattern.cache_info(),
+    }
+
+
+class _Frame:
+    __slots__ = ('name', 'started', 'children', 'memory', 'peak')
+
+    def __init__(self, name, started, memory):
+        self.name = name
+        self.started = started
+        self.children = 0.0
+        self.memory = memory
+        self.peak = memory
+
+
+class Profiler:
+    """
+    Call counts, cumulative and self time, rows in and out and, with track_memory, the peak
+    memory growth of every public function of the instrumented modules. The functions are
+    swapped for timing wrappers by start() and put back by stop(), including the references
+    other modules imported by name, so nothing is wrapped while profiling is off.
+    Stages run on threads, so every thread keeps its own call stack. The memory peak is
+    process-wide: calls overlapping on other threads add to it.
+    """
+
+    def __init__(self, modules=INSTRUMENTED_MODULES, track_memory=False):
+        self.modules = modules
+        self.track_memory = track_memory
+        self.stats = {}
+        self.stacks = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._originals = {}
+        self._rebound = []
+        self._started = None
+        self._seconds = None
+        self._caches = {}
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _wrap(self, name, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            stack = self._stack()
+            memory = 0
+            if self.track_memory:
+                memory, peak = tracemalloc.get_traced_memory()
+                # The peak is reset for this call, so the caller keeps what it reached so far
+                if stack:
+                    stack[-1].peak = max(stack[-1].peak, peak)
+                tracemalloc.reset_peak()
+            frame = _Frame(name, time.perf_counter(), memory)
+            stack.append(frame)
+            result = None
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                stack.pop()
+                self._record(frame, stack, args, kwargs, result)
+            return result
+        return wrapper
+
+    def _record(self, frame, stack, args, kwargs, result):
+        elapsed = time.perf_counter() - frame.started
+        if stack:
+            stack[-1].children += elapsed
+        peak_growth = None
+        if self.track_memory:
+            frame.peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+            peak_growth = frame.peak - frame.memory
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, frame.peak)
+
+        rows_in = next((count for count in map(_rows, (*args, *kwargs.values())) if count is not None), None)
+        rows_out = _rows(result)
+        self_seconds = elapsed - frame.children
+        path = ';'.join([caller.name for caller in stack] + [frame.name])
+        # A recursive call is already inside its own cumulative time
+        recursive = any(caller.name == frame.name for caller in stack)
+        with self._lock:
+            entry = self.stats.setdefault(frame.name, {
+                'calls': 0, 'cumulative_seconds': 0.0, 'self_seconds': 0.0,
+                'rows_in': 0, 'rows_out': 0, 'peak_memory_mb': None,
+            })
+            entry['calls'] += 1
+            entry['self_seconds'] += self_seconds
+            if not recursive:
+                entry['cumulative_seconds'] += elapsed
+            entry['rows_in'] += rows_in or 0
+            entry['rows_out'] += rows_out or 0
+            if peak_growth is not None:
+                entry['peak_memory_mb'] = max(entry['peak_memory_mb'] or 0.0, peak_growth / (1 << 20))
+            self.stacks[path] = self.stacks.get(path, 0.0) + self_seconds
+
+    def _targets(self):
+        """
+        The functions to wrap: every public function defined in the instrumented modules,
+        except generators, whose work happens after they return.
+        """
+        targets = {}
+        for module_name in self.modules:
+            module = __import__(module_name)
+            for name, func in vars(module).items():
+                if (inspect.isfunction(func) and func.__module__ == module_name and not name.startswith('_')
+                        and not inspect.isgeneratorfunction(func)):
+                    targets[func] = f'{module_name}.{name}'
+        return targets
+
+    def start(self):
+        if self._originals:
+            return self
+        targets = self._targets()
+        wrappers = {func: self._wrap(name, func) for func, name in targets.items()}
+        # Modules that did 'from module import function' hold their own reference, rebound here as well
+        for module in list(sys.modules.values()):
+            namespace = getattr(module, '__dict__', None)
+            if not namespace or namespace.get('__name__') == __name__:
+                continue
+            for attribute, value in list(namespace.items()):
+                if inspect.isfunction(value) and value in wrappers:
+                    namespace[attribute] = wrappers[value]
+                    self._rebound.append((namespace, attribute, value))
+        self._originals = wrappers
+        self._caches = _cache_counters()
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._started = time.perf_counter()
+        return self
+
+    def stop(self):
+        if not self._originals:
+            return self
+        self._seconds = time.perf_counter() - self._started
+        for namespace, attribute, value in self._rebound:
+            namespace[attribute] = value
+        self._rebound = []
+        self._originals = {}
+        if self.track_memory:
+            tracemalloc.stop()
+        # Only what the caches did while profiling is reported
+        self._caches = {
+            name: (info.hits - self._caches[name].hits, info.misses - self._caches[name].misses)
+            for name, info in _cache_counters().items()
+        }
+        return self
+
+    def metrics(self):
+        """
+        The metrics of the profiled run as a dictionary, functions by cumulative time.
+        """
+        functions = sorted(self.stats.items(), key=lambda item: item[1]['cumulative_seconds'], reverse=True)
+        caches = {
+            name: {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses) if hits + misses else None}
+            for name, (hits, misses) in self._caches.items()
+        } if self._seconds is not None else {}
+        return {
+            'wall_seconds': self._seconds,
+            'memory_tracked': self.track_memory,
+            'functions': {name: entry for name, entry in functions},
+            'caches': caches,
+        }
+
+    def write(self, directory='.'):
+        """
+        Writes the metrics as JSON and the self time of every call stack in the collapsed
+        format flamegraph tools read ('caller;callee <microseconds>' per line).
+        Returns the paths of both files.
+        """
+        os.makedirs(directory, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        metrics_path = os.path.join(directory, f'{timestamp}_{METRICS_FILE}')
+        stacks_path = os.path.join(directory, f'{timestamp}_{STACKS_FILE}')
+        with open(metrics_path, 'w') as file:
+            json.dump(self.metrics(), file, indent=2)
+        with open(stacks_path, 'w') as file:
+            for path, seconds in sorted(self.stacks.items()):
+                microseconds = round(seconds * 1_000_000)
+                if microseconds > 0:
+                    file.write(f'{path} {microseconds}\n')
+        return metrics_path, stacks_path
+
+
+def profile_directory(directory=None):
+    """
+    The folder to write the metrics to: the one given, else the one in PRICING_PROFILE, or None
+    when profiling is off, as it is when PRICING_PROFILE is unset, empty, '0', 'false' or 'no'.
+    """
+    directory = directory or os.environ.get(PROFILE_ENV, '').strip()
+    if directory.lower() in OFF_VALUES:
+        return None
+    if directory.lower() in ON_VALUES:
+        return '.'
+    return directory
+
+def _memory_tracking(track_memory=None):
+    if track_memory is None:
+        return os.environ.get(PROFILE_MEMORY_ENV, '').strip().lower() in ON_VALUES
+    return track_memory
+
+@contextmanager
+def profiled(directory=None, track_memory=None, modules=INSTRUMENTED_MODULES):
+    """
+    Profiles the enclosed code when a folder is given or PRICING_PROFILE is set, and
+    writes the metrics there at the end, even if the code fails. Otherwise does nothing.
+    Yields the Profiler, or None when profiling is off.
+    """
+    directory = profile_directory(directory)
+    track_memory = _memory_tracking(track_memory)
+    if directory is None:
+        if track_memory:
+            print(f"Memory is only tracked while profiling: pass --profile or set {PROFILE_ENV}")
+        yield None
+        return
+    profiler = Profiler(modules, track_memory).start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        metrics_path, stacks_path = profiler.write(directory)
+        print(f"Run metrics saved: {metrics_path}, {stacks_path}")
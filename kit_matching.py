@@ -1,108 +1,133 @@
-import pandas as pd
-import utils as ut
-from data_config import REVIVAL_SHEETS, FINISHES, MORTISE_TYPES
-
-def find_and_update_revival_kits(products_df, kit_sheets):
-    """
-    Runs though Eclipse's Database and finds all products categorized
-    by the 'Revival' line. These items are categorized by their special
-    Nomenclature. 'PR205TL-HL101-PN' is an example. Uses custom logic
-    """
-    df = products_df.copy()
-    desc_column = ut.get_dict_column(df)
-    price_copy = {key: df.copy() for key, df in kit_sheets.items()}
-    # Add columns to help with matching
-    
-    df['left_part'] = df[desc_column].str.extract(r'^([^-\s]+)') # Extract everything before the first '-'
-    df['finish'] = df[desc_column].str.extract(r'([^-\s]+)$') # Extract everything after the last '-'
-    matched_rows = pd.DataFrame()
-
-    for sheet_name, sheet_df in price_copy.items():
-        if sheet_name in REVIVAL_SHEETS:
-            item_column = ut.get_item_column(sheet_df)
-            sheet_df['left_part'] = sheet_df[item_column].str.split('-').str[0].str.strip()
-            sheet_df['finish'] = sheet_df[item_column].str.split('-').str[1].str.strip()
-
-            # Merge on common parts to find matches
-            merged_df = df.merge(sheet_df, on=['left_part', 'finish'], how='inner')
-            matched_rows = pd.concat([matched_rows, merged_df])
-        
-    matched_rows = ut.update_price_columns(matched_rows)
-    matched_rows = matched_rows[products_df.columns]
-    third_unmatched_rows = ut.drop_matching_rows_by_id(df, matched_rows)
-    return matched_rows, third_unmatched_rows
-
-def map_metro_items(metro_dict_dfs):
-    """
-    Creates a consolidated dataframe of all the metro items and strips away the finish.
-    In Hamilton's 'Metro' program, upgrading the finish does not merit an upcharge
-    """
-    mappings = pd.DataFrame(columns=['temp_match_col', 'Updated List Price'])
-    metro_price_list = {key: df.copy() for key, df in metro_dict_dfs.items()}
-    for _, sheet_df in metro_price_list.items():
-        item_column = ut.get_item_column(sheet_df)
-        price_column = ut.get_price_column(sheet_df)
-        if item_column and price_column:
-            sheet_df = sheet_df.dropna(subset=[item_column])
-            # Prepare data for matching and remove finishes
-            sheet_df['prepared_column'] = ut.prepare_data_for_matching(sheet_df[item_column])
-            sheet_df['temp_match_col'] = ut.vectorized_remove_finishes(sheet_df['prepared_column'], FINISHES)
-            # Keep only the necessary columns for merging
-            temp_df = sheet_df[['temp_match_col', price_column]].rename(columns={price_column: 'Updated List Price'})
-            mappings = pd.concat([mappings, temp_df], ignore_index=True)
-    # Drop all the duplicates
-    mappings = mappings.drop_duplicates(subset=['temp_match_col'])
-    return mappings
-
-def categorize_metro_items(metro_df, types_dict):
-    """
-    Creates a dictionary of dataframes that categorizes metro items
-    by function. Each dataframe would contain the price of every skew
-    per function. Hamilton has two broad categories: 'Metro' and 'Tubular'
-    """
-    df = metro_df.copy()
-    sorted_keys = sorted(types_dict.keys(), key=len, reverse=True)
-    categorized_dict = {}
-
-    for key in sorted_keys:
-        # Filter rows containing each key
-        condition = df['temp_match_col'].str.contains(key, na=False)
-        matched_rows = df[condition]
-        if not matched_rows.empty:
-            categorized_dict[types_dict[key]] = matched_rows
-            # Remove matched rows 
-            df = df[~matched_rows]
-    return categorized_dict
-
-def merge_and_update_patterns_based_on_description(metro_dict_of_dfs, products_df, col_to_split, mechanism_type):
-    """
-    This function merges two dataframes and updates them based on common matching patterns found.
-    """
-    dict_of_dfs = {key: df.copy() for key, df in metro_dict_of_dfs.items()}
-    df = products_df.copy()
-    df['temp_match_col'] = ut.prepare_data_for_matching(df['temp_match_col'])
-    matched_data = pd.DataFrame()
-    for _, sheet_df in dict_of_dfs.items():
-        temp_df = ut.split_kit_descriptor(sheet_df, col_to_split, mechanism_type)
-        price_column = ut.get_price_column(sheet_df)
-        temp_df['Updated List Price'] = sheet_df[price_column].values
-        # Merge on substrings
-        temp_merged = ut.merge_on_patterns(temp_df, df, 'prefix', 'numeric', 'suffix', target_col = 'temp_match_col')
-        matched_data = pd.concat([matched_data, temp_merged], ignore_index=True)
-    # Update price columns and remove duplicates
-    final_data = ut.update_price_columns(matched_data)
-    final_data = ut.drop_duplicates_by_price(final_data)
-    # Ensure the result has the same columns as the target_data DataFrame
-    final_data = final_data[df.columns]
-    return final_data
-
-
-
-
-
-
-
-
-
-    
-
+import pandas as pd
+import utils as ut
+from data_config import REVIVAL_SHEETS, FINISHES
+from sku_parser import DEFAULT_PARSER
+from match_context import components_for, config_for, parser_for
+from pattern_index import PatternIndex
+from substring_automaton import SubstringAutomaton
+from finish_index import FinishPriceIndex
+from residual_tracker import SOURCE_COLUMN
+
+def revival_kit_prices(kit_sheets, revival_sheets=REVIVAL_SHEETS, parser=DEFAULT_PARSER):
+    """
+    The kits of the Revival sheets keyed by 'left_part' and 'finish', e.g. 'PR205TL' and 'PN'
+    for 'PR205TL-PN', with their price and sheet. A kit listed on several sheets takes the price of the first one.
+    """
+    sheet_keys = []
+    for sheet_name, sheet_df in kit_sheets.items():
+        item_column = ut.get_item_column(sheet_df)
+        price_column = ut.get_price_column(sheet_df)
+        if sheet_name in revival_sheets and item_column and price_column:
+            sheet_df = sheet_df.dropna(subset=[item_column])
+            sheet_components = parser.parse_series(sheet_df[item_column].astype(str).str.strip())
+            sheet_keys.append(pd.DataFrame({
+                'left_part': sheet_components['left_part'],
+                'finish': sheet_components['finish'],
+                'Updated List Price': pd.to_numeric(sheet_df[price_column], errors='coerce'),
+                'kit_sheet': sheet_name,
+            }))
+
+    if not sheet_keys:
+        return pd.DataFrame(columns=['left_part', 'finish', 'Updated List Price', 'kit_sheet'])
+
+    # Items without a finish token are not kits. Keeping the first sheet's
+    # price for a repeated kit means each product matches it once
+    kit_items = pd.concat(sheet_keys, ignore_index=True).dropna(subset=['left_part', 'finish'])
+    return kit_items.drop_duplicates(subset=['left_part', 'finish'], keep='first')
+
+def find_and_update_revival_kits(products_df, kit_sheets, context=None):
+    """
+    Runs though Eclipse's Database and finds all products categorized
+    by the 'Revival' line. These items are categorized by their special
+    Nomenclature. 'PR205TL-HL101-PN' is an example. Uses custom logic.
+    Returns the matched products, with the kit that priced them in 'PRICE SOURCE'.
+    """
+    # Descriptions and items are tokenized once; the kits are found with an equality join
+    components = components_for(products_df, context)
+    df = products_df.assign(left_part=components['left_part'], finish=components['finish'])
+
+    config = config_for(context)
+    kit_items = revival_kit_prices(kit_sheets, config.revival_sheets, parser_for(context))
+    kit_items = kit_items.set_index(['left_part', 'finish'])
+    # Join on common parts to find matches; the matched rows keep the index of the products
+    matched_rows = df.join(kit_items, on=['left_part', 'finish'], how='inner')
+    matched_rows = ut.update_price_columns(matched_rows)
+    matched_rows[SOURCE_COLUMN] = matched_rows['left_part'] + '-' + matched_rows['finish']
+    return matched_rows[[*products_df.columns, SOURCE_COLUMN]]
+
+def map_metro_items(metro_dict_dfs, finishes=FINISHES):
+    """
+    Creates a consolidated dataframe of all the metro items and strips away the finish.
+    In Hamilton's 'Metro' program, upgrading the finish does not merit an upcharge
+    """
+    # Items are keyed by their base item; the first price listed for it is kept
+    base_prices = FinishPriceIndex(metro_dict_dfs, finishes).base_prices(keep='first')
+    mappings = pd.DataFrame({'temp_match_col': base_prices.index, 'Updated List Price': base_prices.to_numpy()})
+    return mappings
+
+def classify_mechanisms(keys, types_dict):
+    """
+    Labels every key with the mechanism type of the longest code found in the
+    suffix after its numeric body, so a code is never shadowed by a shorter code
+    it contains. Equally long codes go by their order in types_dict.
+    All codes are compiled into one automaton, so each distinct suffix is scanned once.
+    Returns a categorical series, NaN where no code is found.
+    """
+    codes = list(types_dict)
+    # Longer codes score higher; among equal lengths, earlier codes do
+    scores = {code: len(code) * len(codes) + (len(codes) - position) for position, code in enumerate(codes)}
+    types_by_score = {score: types_dict[code] for code, score in scores.items()}
+    automaton = SubstringAutomaton(scores)
+
+    suffixes = ut.split_kit_descriptor(keys.to_frame(name='key'), 'key')['suffix']
+    best = automaton.max_contained_series(suffixes)
+    categories = list(dict.fromkeys(types_dict.values()))
+    return pd.Series(pd.Categorical(best.map(types_by_score), categories=categories), index=keys.index)
+
+def categorize_metro_items(metro_df, types_dict):
+    """
+    Creates a dictionary of dataframes that categorizes metro items
+    by function. Each dataframe would contain the price of every skew
+    per function. Hamilton has two broad categories: 'Metro' and 'Tubular'
+    """
+    df = metro_df.copy()
+    df['mechanism'] = classify_mechanisms(df['temp_match_col'], types_dict)
+    return {mechanism: rows for mechanism, rows in df.groupby('mechanism', observed=True, sort=False)}
+
+def metro_kit_rows(metro_dict_of_dfs, col_to_split, mechanism_type):
+    """
+    The categorized Metro items as one frame of split keys, e.g. 'MTK', '123' and 'PA'
+    for 'MTK123PA', with the item key itself and its price.
+    """
+    kit_rows = []
+    for _, sheet_df in metro_dict_of_dfs.items():
+        temp_df = ut.split_kit_descriptor(sheet_df, col_to_split, mechanism_type)
+        price_column = ut.get_price_column(sheet_df)
+        temp_df['key'] = sheet_df[col_to_split].values
+        temp_df['Updated List Price'] = pd.to_numeric(sheet_df[price_column], errors='coerce').values
+        kit_rows.append(temp_df)
+    if not kit_rows:
+        return pd.DataFrame(columns=['prefix', 'numeric', 'suffix', 'key', 'Updated List Price'])
+    return pd.concat(kit_rows, ignore_index=True)
+
+def merge_and_update_patterns_based_on_description(metro_dict_of_dfs, products_df, col_to_split, mechanism_type,
+                                                   context=None):
+    """
+    This function matches the products to the categorized Metro items on the prefix,
+    numeric body and suffix of their keys, and updates the matched products' prices.
+    The Metro item each price came from is kept in the 'PRICE SOURCE' column.
+    """
+    df = products_df
+    kit_df = metro_kit_rows(metro_dict_of_dfs, col_to_split, mechanism_type)
+    if kit_df.empty:
+        return df.iloc[0:0].assign(**{SOURCE_COLUMN: None})
+
+    # The products are indexed once and every Metro row probes the index
+    pattern_index = PatternIndex(components_for(df, context), config_for(context).finishes)
+    product_positions, kit_positions = pattern_index.match(kit_df)
+    final_data = df.iloc[product_positions].copy()
+    final_data['Updated List Price'] = kit_df['Updated List Price'].to_numpy()[kit_positions]
+    final_data = ut.update_price_columns(final_data)
+    final_data[SOURCE_COLUMN] = kit_df['key'].to_numpy()[kit_positions]
+    # Ensure the result has the same columns as the target_data DataFrame, and the matched kit
+    return final_data[[*df.columns, SOURCE_COLUMN]]
@@ -1,88 +1,159 @@
-import os
-from datetime import datetime
-import pandas as pd
-
-from data_loading import (
-    clean_eclipse_products, load_eclipse_products,
-    clean_price_list, load_price_list, filter_price_list
-)
-import basic_matching as bm
-import kit_matching as km
-from data_config import (
-    METRO_SHEET_NAMES, MORTISE_TYPES, TUBULAR_TYPES,
-    FINISHES
-)
-from utils import (
-    drop_matching_rows_by_id, vectorized_remove_finishes
-)
-
-def main():
-
-    # Load and clean the products DataFrame
-    products = clean_eclipse_products(load_eclipse_products())
-
-    # Load and clean the price list dictionary of DataFrames
-    price_list = clean_price_list(load_price_list())
-
-    # Filter the price_list dictionary of dataframes
-    non_kit_price_list = filter_price_list(price_list, 'individual')
-    kit_price_list = filter_price_list(price_list, 'kit')
-
-    # The first update isolates direct matches between Eclipse's 
-    # Database and the price list, directly feeding in the updated 
-    # price.
-    first_update = bm.match_and_update_price(products, price_list)
-
-    # Process custom finishes
-    unmatched_rows = bm.find_unmatched_rows(products, price_list)
-    custom_finished_matches = bm.find_matches_with_custom_finishes(unmatched_rows, non_kit_price_list)
-    custom_finished_products = bm.price_custom_finishes(custom_finished_matches, non_kit_price_list)
-    second_update = pd.concat([first_update, custom_finished_products], ignore_index=True)
-    second_unmatched_rows = drop_matching_rows_by_id(unmatched_rows, second_update)
-
-    # Add 'Revival' Kits and the third set of unmatched rows
-    revival_kits, third_unmatched_rows = km.find_and_update_revival_kits(second_unmatched_rows, kit_price_list)
-    third_update = pd.concat([second_update, revival_kits], ignore_index=True)
-
-    # Adding 'Metro' Kits
-    metro_sheets = {name: kit_price_list[name] for name in METRO_SHEET_NAMES}
-    # A map of 'Metro' items, that shows item without finish and the price
-    metro_items = km.map_metro_items(metro_sheets)
-    # Split Metro Mortise items into a dictionary of dataframes
-    metro_mortise_categorized = km.categorize_metro_items(metro_items, MORTISE_TYPES)
-    # Update Metro Mortise sets and update the main df
-    metro_mortise_sets = km.merge_and_update_patterns_based_on_description(
-        metro_mortise_categorized, third_unmatched_rows, 'temp_match_col', MORTISE_TYPES)
-    
-    fourth_update = pd.concat(third_update, metro_mortise_sets, ignore_index=True)
-    fourth_unmatched_rows = drop_matching_rows_by_id(third_unmatched_rows, fourth_update)
-    # Metro Tubular Kits
-    metro_tubular_categorized = km.categorize_metro_items(metro_items, TUBULAR_TYPES)
-    metro_tubular_df = kit_price_list['Metro Tubular']
-    metro_tubular_df['temp_match_col'] = vectorized_remove_finishes(metro_tubular_df['temp_match_col'], FINISHES)
-    metro_tubular_updated = km.merge_and_update_patterns_based_on_description(
-    metro_tubular_categorized,  # Dictionary of DataFrames for tubular items
-    fourth_unmatched_rows,  # DataFrame to match against
-    'temp_match_col',  # Column to split in the dictionary of DataFrames
-    TUBULAR_TYPES  # Mechanism type dictionary for splitting
-)
-    fifth_update = pd.concat([fourth_update, metro_tubular_updated], ignore_index=True)
-    #REMOVE DPAMS
-    mask = ~fifth_update['Desc1'].str.contains('DPAM', na=False)
-    final_update = fifth_update[mask]
-    # Items not created yet from the price list (individual sheets only)
-    uncreated_items = bm.collect_uncreated_items(products, non_kit_price_list)
-
-    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-    new_filename = f"Updated Prices to be uploaded_{timestamp}.csv"
-    final_update.to_csv(new_filename)
-    create_file = f"Create these Products_{timestamp}.csv"
-    uncreated_items.to_csv(create_file)
-
-    print("Script completed and files saved.")
-
-
-if __name__ == '__main__':
-    main()
-
-
+import os
+import argparse
+from datetime import datetime
+
+from data_loading import load_clean_eclipse_products
+from price_list_cache import load_clean_price_list
+from workbook_reader import close_workbook
+from pipeline import run_pipeline, STAGE_NAMES
+from resolution_cache import RESOLUTION_CACHE_FILE
+from delta_pricing import delta_update
+from watch_mode import watch, POLL_INTERVAL
+from backends import BACKENDS
+from instrumentation import profiled
+from export_writer import export_frame, EXPORT_FORMATS
+from batch_mode import batch, combined_update
+
+def save_outputs(final_update, uncreated_items, label='', fuzzy_suggestions=None, file_format='csv',
+                 batch_rows=None, update_columns=None, create_columns=None, directory='.'):
+    # A file projected to chosen columns is written without the row index
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    export_frame(final_update, f"Updated Prices to be uploaded{label}_{timestamp}", directory, file_format,
+                 columns=update_columns, batch_rows=batch_rows, index=update_columns is None)
+    export_frame(uncreated_items, f"Create these Products{label}_{timestamp}", directory, file_format,
+                 columns=create_columns, batch_rows=batch_rows, index=create_columns is None)
+    if fuzzy_suggestions is not None:
+        fuzzy_suggestions.to_csv(os.path.join(directory, f"Review these Suggestions{label}_{timestamp}.csv"), index=False)
+
+def write_to_database(final_update, database_url, batch_size, dry_run):
+    # SQLAlchemy is only needed when writing straight to a database
+    from db_writer import write_price_updates
+    write_price_updates(final_update, database_url, batch_size=batch_size, dry_run=dry_run)
+
+def watch_directory(database_url=None, batch_size=1000, dry_run=False, workers=1, interval=POLL_INTERVAL,
+                    export=None):
+    # Every new price list or products export is processed against the products kept in memory
+    def on_outputs(final_update, uncreated_items):
+        save_outputs(final_update, uncreated_items, label=' (watch)', **(export or {}))
+        if database_url:
+            write_to_database(final_update, database_url, batch_size, dry_run)
+        print("Files saved, watching for the next change.")
+
+    watch(on_outputs, interval=interval, sheet_workers=workers)
+
+def batch_suppliers(manifest_path, database_url=None, batch_size=1000, dry_run=False, workers=1, backend='pandas',
+                    export=None, resolution_cache=True):
+    # Every supplier's files are saved in its own folder, as soon as its run finishes
+    updates = {}
+    def on_outputs(supplier, outputs):
+        save_outputs(outputs['final_update'], outputs['uncreated_items'], fuzzy_suggestions=outputs['fuzzy_suggestions'],
+                     directory=supplier.directory, **(export or {}))
+        updates[supplier.name] = outputs['final_update']
+        print(f"Files saved for '{supplier.name}'")
+
+    summary = batch(manifest_path, on_outputs, sheet_workers=workers, backend=backend, resolution_cache=resolution_cache)
+    # The summary is saved first, so a database that fails does not lose it
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    summary_path = os.path.join(os.path.dirname(os.path.abspath(manifest_path)), f"Batch Summary_{timestamp}.csv")
+    summary.to_csv(summary_path, index=False)
+    print(summary.to_string(index=False))
+    # The database is written once every supplier is done, the first supplier of the manifest
+    # winning a product several of them priced, so the result never depends on which run finished first
+    if database_url and updates:
+        update = combined_update(updates[name] for name in summary['SUPPLIER'] if name in updates)
+        write_to_database(update, database_url, batch_size, dry_run)
+
+def main(delta=False, database_url=None, batch_size=1000, dry_run=False, resume_from=None, workers=1,
+         resolution_cache=RESOLUTION_CACHE_FILE, backend='pandas', export=None):
+
+    # Load and clean the products DataFrame
+    products = load_clean_eclipse_products()
+
+    # In delta mode only the products affected by the latest price list revision are re-priced
+    if delta:
+        outputs = delta_update(products, sheet_workers=workers)
+        if outputs is not None:
+            save_outputs(*outputs, label=' (delta)', **(export or {}))
+            if database_url:
+                write_to_database(outputs[0], database_url, batch_size, dry_run)
+            print("Script completed and files saved.")
+            return
+
+    # Load and clean the price list dictionary of DataFrames
+    price_list = load_clean_price_list()
+
+    # Run the matching cascade and collect the items not created yet, checkpointing every stage.
+    # Products resolved in earlier runs are repriced from the resolution cache
+    try:
+        outputs = run_pipeline(
+            products, price_list,
+            targets=('final_update', 'uncreated_items', 'fuzzy_suggestions', 'stored_resolutions'),
+            resume_from=resume_from, sheet_workers=workers, resolution_cache=resolution_cache, backend=backend,
+        )
+    finally:
+        close_workbook(price_list)
+    final_update, uncreated_items = outputs['final_update'], outputs['uncreated_items']
+
+    save_outputs(final_update, uncreated_items, fuzzy_suggestions=outputs['fuzzy_suggestions'], **(export or {}))
+    if database_url:
+        write_to_database(final_update, database_url, batch_size, dry_run)
+
+    print("Script completed and files saved.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Update Eclipse prices from the latest supplier price list")
+    parser.add_argument('--delta', action='store_true',
+                        help="only re-price products affected by changes since the previous price list")
+    parser.add_argument('--database-url',
+                        help="SQLAlchemy URL of the database to write the updated prices to, e.g. sqlite:///eclipse.db")
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help="rows per upsert batch when writing to the database")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="report how many database rows would change without writing them")
+    parser.add_argument('--resume-from', choices=STAGE_NAMES,
+                        help="re-run from this stage, reusing the checkpoints of earlier stages whose inputs are unchanged")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes used to normalize and match the price list sheets")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep running, and re-price as soon as a new price list or products export lands")
+    parser.add_argument('--interval', type=float, default=POLL_INTERVAL,
+                        help="seconds between two looks at the directory in watch mode")
+    parser.add_argument('--resolution-cache', default=RESOLUTION_CACHE_FILE,
+                        help="SQLite file of the match resolutions reused across runs")
+    parser.add_argument('--no-resolution-cache', action='store_true',
+                        help="resolve every product through the full cascade without reading or updating the cache")
+    parser.add_argument('--backend', choices=BACKENDS, default='pandas',
+                        help="run normalization, finish stripping and the key lookups on pandas or on Arrow")
+    parser.add_argument('--profile', nargs='?', const='.', metavar='DIRECTORY',
+                        help="time the matching functions and write run metrics and a flamegraph stack file "
+                             "to this folder (the current one by default); PRICING_PROFILE does the same")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help="also track the peak memory of every profiled call, at the cost of a slower run")
+    parser.add_argument('--export-format', choices=list(EXPORT_FORMATS), default='csv',
+                        help="format of the update and create files: CSV, gzip or zstd compressed CSV, or Parquet")
+    parser.add_argument('--batch-rows', type=int,
+                        help="split the update and create files into folders of files of at most this many rows, "
+                             "with a manifest.json")
+    parser.add_argument('--update-columns', nargs='+', metavar='COLUMN',
+                        help="only write these columns to the update file, e.g. ID 'LIST PRICE'")
+    parser.add_argument('--create-columns', nargs='+', metavar='COLUMN',
+                        help="only write these columns to the create file")
+    parser.add_argument('--batch', metavar='MANIFEST',
+                        help="price the products against every supplier listed in this JSON manifest, side by side")
+    args = parser.parse_args()
+    export = {'file_format': args.export_format, 'batch_rows': args.batch_rows,
+              'update_columns': args.update_columns, 'create_columns': args.create_columns}
+    with profiled(args.profile, track_memory=args.profile_memory or None):
+        if args.batch:
+            batch_suppliers(args.batch, database_url=args.database_url, batch_size=args.batch_size,
+                            dry_run=args.dry_run, workers=args.workers, backend=args.backend, export=export,
+                            resolution_cache=not args.no_resolution_cache)
+        elif args.watch:
+            watch_directory(database_url=args.database_url, batch_size=args.batch_size, dry_run=args.dry_run,
+                            workers=args.workers, interval=args.interval, export=export)
+        else:
+            main(delta=args.delta, database_url=args.database_url, batch_size=args.batch_size, dry_run=args.dry_run,
+                 resume_from=args.resume_from, workers=args.workers,
+                 resolution_cache=None if args.no_resolution_cache else args.resolution_cache, backend=args.backend,
+                 export=export)
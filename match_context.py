@@ -0,0 +1,196 @@
+import threading
+from functools import wraps
+
+import numpy as np
+import utils as ut
+from data_loading import filter_price_list
+from finish_index import FinishPriceIndex
+from parallel_matching import build_sheet_keys
+from price_index import PriceIndex
+from sku_parser import DEFAULT_PARSER, parser_with_finishes
+from backends import get_backend
+from supplier_config import DEFAULT_CONFIG
+
+
+def _computed_once(method):
+    """
+    Like functools.cached_property, but the value is computed by one thread only: the stages
+    of a run read the context from several threads, and the others wait for the first one.
+    The value is kept in the instance dictionary, under the name of the method.
+    """
+    name = method.__name__
+
+    @wraps(method)
+    def getter(self):
+        if name not in self.__dict__:
+            with self._lock_for(name):
+                if name not in self.__dict__:
+                    self.__dict__[name] = method(self)
+        return self.__dict__[name]
+    return property(getter)
+
+
+class MatchContext:
+    """
+    Everything derived from the products and the price list of one run, computed once.
+    The products frame is never modified. Its normalized keys, finish-stripped keys
+    and parsed SKU components are columns aligned to it, and every stage reads the
+    slice of them that matches the rows it was given instead of deriving them again.
+    The sheets are not modified either; their keys and indexes live here as well.
+    'resolution_cache' is the ResolutionCache of the run, or None to resolve every product afresh.
+    'backend' runs the string operations behind the keys and lookups ('pandas' or 'arrow').
+    'config' is the SupplierConfig of the price list: its sheets, finishes and kit tables.
+    'residuals' is the ResidualTracker the stages of a run claim their products on, set by run_pipeline.
+    """
+
+    def __init__(self, products, price_list, sheet_workers=1, resolution_cache=None, backend='pandas',
+                 config=DEFAULT_CONFIG):
+        self.products = products
+        self.price_list = price_list
+        self.sheet_workers = sheet_workers
+        self.resolution_cache = resolution_cache
+        self.backend = get_backend(backend)
+        self.config = config
+        self.residuals = None
+        self.parser = parser_with_finishes(config.finishes)
+        self.desc_column = ut.get_dict_column(products)
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock_for(self, name):
+        # One lock per derived value, so building one does not wait for another
+        with self._locks_lock:
+            return self._locks.setdefault(name, threading.Lock())
+
+    @_computed_once
+    def keys(self):
+        """
+        Normalized product descriptions.
+        """
+        return self.backend.normalize(self.products[self.desc_column])
+
+    @_computed_once
+    def base_keys(self):
+        """
+        Normalized product descriptions without their finish.
+        """
+        return self.backend.remove_finishes(self.keys, self.config.finishes)
+
+    @_computed_once
+    def components(self):
+        """
+        Parsed SKU components of the product descriptions.
+        """
+        return self.parser.parse_series(self.products[self.desc_column])
+
+    @_computed_once
+    def sheet_keys(self):
+        return build_sheet_keys(
+            self.products, self.price_list, self.sheet_workers, product_keys=self.keys, backend=self.backend.name
+        )
+
+    def seed_sheet_keys(self, sheet_keys):
+        """
+        Uses sheet keys built elsewhere, e.g. loaded from a checkpoint, unless the context has its own already.
+        """
+        with self._lock_for('sheet_keys'):
+            self.__dict__.setdefault('sheet_keys', sheet_keys)
+
+    @_computed_once
+    def price_index(self):
+        return PriceIndex(self.price_list, sheet_keys=self.sheet_keys, backend=self.backend)
+
+    @_computed_once
+    def individual_finish_index(self):
+        individual = filter_price_list(self.price_list, 'individual', self.config.sheet_dict)
+        return FinishPriceIndex(individual, self.config.finishes, backend=self.backend)
+
+    @_computed_once
+    def resolution_tables(self):
+        # Imported here, as the resolution cache itself reads the keys of the context
+        from resolution_cache import ResolutionTables
+        return ResolutionTables(self.price_list, self.individual_finish_index, self.config)
+
+    def derive(self, products=None, price_list=None, config=None):
+        """
+        A context for some of these products, or for another price list or supplier config,
+        that reuses the product keys already derived here instead of deriving them again.
+        The keys without finish and the components are only reused for the same finishes.
+        """
+        products = self.products if products is None else products
+        price_list = self.price_list if price_list is None else price_list
+        config = self.config if config is None else config
+        derived = MatchContext(products, price_list, self.sheet_workers, self.resolution_cache, self.backend, config)
+        positions = self.positions(products)
+        reused = ('keys', 'base_keys', 'components') if tuple(config.finishes) == tuple(self.config.finishes) else ('keys',)
+        if positions is not None:
+            for name in reused:
+                if name in self.__dict__:
+                    derived.__dict__[name] = self.aligned(self.__dict__[name], products)
+        if price_list is self.price_list and products is self.products and config == self.config:
+            derived.__dict__.update(
+                {name: value for name, value in self.__dict__.items() if name not in ('_locks', '_locks_lock')})
+        return derived
+
+    def positions(self, frame):
+        """
+        Row positions in the products frame of the rows of 'frame', or None if
+        some of its rows are not products of this context.
+        """
+        positions = self.products.index.get_indexer(frame.index)
+        return None if (positions < 0).any() else positions
+
+    def rows(self, positions):
+        """
+        The products at the given row positions.
+        """
+        return self.products.iloc[np.asarray(positions, dtype=int)]
+
+    def aligned(self, derived, frame):
+        """
+        The slice of a derived column or frame (keys, base_keys, components) for the rows
+        of 'frame', indexed like it. Returns None when 'frame' holds rows of other products.
+        """
+        positions = self.positions(frame)
+        if positions is None:
+            return None
+        sliced = derived.iloc[positions]
+        sliced.index = frame.index
+        return sliced
+
+
+def backend_for(context=None):
+    """
+    The backend of the context, or the pandas backend without one.
+    """
+    return context.backend if context is not None else get_backend('pandas')
+
+def config_for(context=None):
+    """
+    The supplier config of the context, or the tables of data_config without one.
+    """
+    return context.config if context is not None else DEFAULT_CONFIG
+
+def parser_for(context=None):
+    """
+    The SKU parser of the context, or the default parser without one.
+    """
+    return context.parser if context is not None else DEFAULT_PARSER
+
+def keys_for(frame, context=None):
+    """
+    Normalized descriptions of 'frame', read from the context when it holds these rows.
+    """
+    keys = context.aligned(context.keys, frame) if context is not None else None
+    if keys is None:
+        keys = ut.prepare_data_for_matching(frame[ut.get_dict_column(frame)])
+    return keys
+
+def components_for(frame, context=None):
+    """
+    Parsed SKU components of the descriptions of 'frame', read from the context when it holds these rows.
+    """
+    components = context.aligned(context.components, frame) if context is not None else None
+    if components is None:
+        components = DEFAULT_PARSER.parse_series(frame[ut.get_dict_column(frame)])
+    return components
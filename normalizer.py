@@ -0,0 +1,147 @@
+import re
+import time
+from functools import lru_cache
+
+import pandas as pd
+import numpy as np
+
+# Rules applied by the normalizer, compiled once at import time
+_REMOVED_CHARACTERS = str.maketrans('', '', '.-')
+_PH206R_HANDEDNESS = re.compile('PH206R(R|L)(?![a-zA-Z])')
+_PRESERVE = re.compile('(RRR|PRM|PR|HL|ML|PH206R|NL|OL)')
+_HL_HANDEDNESS = re.compile(r'^(HL[^LR]*)(L|R)')
+_HANDEDNESS_CONDITION = re.compile('HK|HL|PH|ML')
+_HANDEDNESS_INDICATORS = re.compile('LHR|RHR|RL|RR')
+_RESTORE = re.compile(r"__(.*?)__")
+
+
+def normalize_sku(value):
+    """
+    Standardizes a single item or description. Applies the same rules, in the
+    same order, as the column-wise prepare_data_for_matching, so the keys are identical.
+    """
+    # Extract and remove 'BTB', then remove '.' and '-' characters
+    has_btb = 'BTB' in value
+    value = value.replace('BTB', '').translate(_REMOVED_CHARACTERS)
+
+    # 'PH206RR' and 'PH206RL' fold into 'PH206R'
+    if 'PH206R' in value:
+        value = _PH206R_HANDEDNESS.sub('PH206R', value)
+
+    # Mark preserves, drop handedness indicators and restore the marked preserves
+    marked = _PRESERVE.sub(r"__\1__", value)
+    marked = _HL_HANDEDNESS.sub(r'\1', marked)
+    if _HANDEDNESS_CONDITION.search(marked):
+        marked = _HANDEDNESS_INDICATORS.sub('', marked)
+    value = _RESTORE.sub(r"\1", marked)
+
+    # Append 'BTB' back to the end where it was extracted
+    return value + 'BTB' if has_btb else value
+
+def normalize_arrow(values):
+    """
+    Applies the rules of normalize_sku to a pyarrow string array with pyarrow.compute kernels.
+    RE2 has no lookahead, so the character after 'PH206RR' or 'PH206RL' is matched and put back.
+    Missing values stay missing.
+    """
+    import pyarrow.compute as pc
+
+    has_btb = pc.match_substring(values, 'BTB')
+    values = pc.replace_substring(values, 'BTB', '')
+    values = pc.replace_substring_regex(values, '[.-]', '')
+    values = pc.replace_substring_regex(values, 'PH206R(R|L)([^a-zA-Z]|$)', r'PH206R\2')
+
+    marked = pc.replace_substring_regex(values, '(RRR|PRM|PR|HL|ML|PH206R|NL|OL)', r'__\1__')
+    marked = pc.replace_substring_regex(marked, '^(HL[^LR]*)(L|R)', r'\1')
+    marked = pc.if_else(
+        pc.match_substring_regex(marked, 'HK|HL|PH|ML'),
+        pc.replace_substring_regex(marked, 'LHR|RHR|RL|RR', ''),
+        marked,
+    )
+    values = pc.replace_substring_regex(marked, '__(.*?)__', r'\1')
+    return pc.if_else(has_btb, pc.binary_join_element_wise(values, 'BTB', ''), values)
+
+
+class SkuNormalizer:
+    """
+    Memoized normalizer. Keys are cached by raw value in a bounded LRU, so the
+    same descriptions and items are only normalized once per run, no matter
+    how many stages ask for them.
+    """
+
+    def __init__(self, maxsize=1_000_000):
+        self._normalize = lru_cache(maxsize=maxsize)(normalize_sku)
+
+    def normalize(self, value):
+        """
+        Normalizes a single value. Missing values are treated as empty strings
+        and any other non-string value has no key (NaN).
+        """
+        if value is None or value is pd.NA or (isinstance(value, float) and np.isnan(value)):
+            value = ''
+        if not isinstance(value, str):
+            return np.nan
+        return self._normalize(value)
+
+    def normalize_series(self, series):
+        """
+        Batch API. Only the unique values of the series are normalized, and
+        the keys are then mapped back onto every row.
+        """
+        codes, uniques = pd.factorize(series, use_na_sentinel=False)
+        keys = np.empty(len(uniques), dtype=object)
+        keys[:] = [self.normalize(value) for value in uniques]
+        return pd.Series(keys[codes], index=series.index, dtype='object', name=series.name)
+
+    def cache_info(self):
+        return self._normalize.cache_info()
+
+    def cache_clear(self):
+        self._normalize.cache_clear()
+
+
+DEFAULT_NORMALIZER = SkuNormalizer()
+
+
+def benchmark(rows=1_000_000, unique_values=50_000, seed=0):
+    """
+    Times the chained column-wise normalization against the normalizer on a
+    synthetic column and checks that both produce the same keys.
+    """
+    from utils import chained_prepare_data_for_matching
+
+    rng = np.random.default_rng(seed)
+    prefixes = np.array(['PR', 'HL', 'ML', 'PH206R', 'NL', 'OL', 'RRR', 'PRM', 'HK', 'AP', 'CK'])
+    suffixes = np.array(['', 'RR', 'RL', 'LHR', 'RHR', '-PN', '.SN', 'BTB', '-AB', 'L', 'R'])
+    bodies = rng.integers(100, 999, size=unique_values).astype(str)
+    pool = (
+        prefixes[rng.integers(0, len(prefixes), size=unique_values)].astype(object)
+        + bodies.astype(object)
+        + suffixes[rng.integers(0, len(suffixes), size=unique_values)].astype(object)
+    )
+    series = pd.Series(pool[rng.integers(0, unique_values, size=rows)], dtype='object')
+
+    start = time.perf_counter()
+    expected = chained_prepare_data_for_matching(series)
+    chained_seconds = time.perf_counter() - start
+
+    normalizer = SkuNormalizer()
+    start = time.perf_counter()
+    result = normalizer.normalize_series(series)
+    cold_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    normalizer.normalize_series(series)
+    warm_seconds = time.perf_counter() - start
+
+    if not expected.equals(result):
+        raise AssertionError("Normalizer keys differ from prepare_data_for_matching")
+
+    print(f"Rows: {rows:,}  Unique values: {unique_values:,}")
+    print(f"Chained str.replace passes: {chained_seconds:.3f}s")
+    print(f"Normalizer (cold cache):    {cold_seconds:.3f}s  ({chained_seconds / cold_seconds:.1f}x)")
+    print(f"Normalizer (warm cache):    {warm_seconds:.3f}s  ({chained_seconds / warm_seconds:.1f}x)")
+
+
+if __name__ == '__main__':
+    benchmark()
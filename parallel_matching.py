@@ -0,0 +1,92 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import utils as ut
+from backends import get_backend
+
+# Columns of the sheet keys table: the sheet, the row label in that sheet, the normalized
+# item and whether any product description normalizes to the same key
+SHEET_KEY_COLUMNS = ['SHEET', 'ROW', 'temp_match_col', 'IN_PRODUCTS']
+KEYS_FILE = 'product_keys.arrow'
+
+
+def publish_keys(keys, path):
+    """
+    Writes the normalized product keys once as an Arrow IPC file. Workers memory-map
+    it instead of receiving a pickled copy of the keys each.
+    """
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    table = pa.table({'key': pa.array(keys, type=pa.string(), from_pandas=True)})
+    with pa.OSFile(path, 'wb') as sink, ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return path
+
+def _sheet_keys(sheet_name, items, is_product_key, backend='pandas'):
+    keys = get_backend(backend).normalize(items)
+    return pd.DataFrame({
+        'SHEET': sheet_name,
+        'ROW': items.index,
+        'temp_match_col': keys.to_numpy(dtype=object),
+        'IN_PRODUCTS': is_product_key(keys),
+    })
+
+def _sheet_keys_from_published(sheet_name, items, keys_path, backend='pandas'):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc as ipc
+
+    with pa.memory_map(keys_path) as source:
+        product_keys = ipc.open_file(source).read_all().column('key')
+
+        def is_product_key(keys):
+            keys = pa.array(keys, type=pa.string(), from_pandas=True)
+            return pc.is_in(keys, value_set=product_keys).to_numpy(zero_copy_only=False)
+
+        return _sheet_keys(sheet_name, items, is_product_key, backend)
+
+def build_sheet_keys(products_df, price_list_dict, max_workers=1, product_keys=None, backend='pandas'):
+    """
+    Normalizes the items of every sheet and flags the ones some product matches exactly.
+    With max_workers above 1 the sheets are spread over a process pool; the product keys
+    are published once through Arrow IPC and the sheets are returned in workbook order,
+    so the table is the same whatever the number of workers.
+    Product keys normalized already can be passed in as 'product_keys'. 'backend' names the
+    backend that normalizes the items; workers receive the name and build their own.
+    """
+    string_backend = get_backend(backend)
+    if product_keys is None:
+        product_keys = string_backend.normalize(products_df[ut.get_dict_column(products_df)])
+    sheets = [
+        (sheet_name, sheet_df[ut.get_item_column(sheet_df)])
+        for sheet_name, sheet_df in price_list_dict.items() if ut.get_item_column(sheet_df)
+    ]
+    if not sheets:
+        return pd.DataFrame(columns=SHEET_KEY_COLUMNS)
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(sheets))
+    if max_workers <= 1:
+        product_key_index = pd.Index(product_keys.unique())
+        tables = [_sheet_keys(name, items, lambda keys: string_backend.is_in(keys, product_key_index), string_backend)
+                  for name, items in sheets]
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            keys_path = publish_keys(product_keys, os.path.join(directory, KEYS_FILE))
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                tables = list(executor.map(
+                    _sheet_keys_from_published, *zip(*sheets), [keys_path] * len(sheets), [string_backend.name] * len(sheets)
+                ))
+
+    sheet_keys = pd.concat(tables, ignore_index=True)
+    sheet_keys['SHEET'] = pd.Categorical(sheet_keys['SHEET'], categories=[name for name, _ in sheets])
+    return sheet_keys
+
+def keys_for_sheet(sheet_keys, sheet_name):
+    """
+    The rows of the sheet keys table for one sheet, indexed by the sheet's row labels.
+    """
+    rows = sheet_keys[sheet_keys['SHEET'] == sheet_name]
+    return rows.set_index('ROW')
@@ -0,0 +1,92 @@
+import pandas as pd
+import numpy as np
+from data_config import FINISHES
+
+
+class PatternIndex:
+    """
+    An index of parsed product descriptions (see SkuParser) by the (prefix, numeric) of their key, e.g.
+    ('MTK', '123') for 'MTK123PA-SN'. Kit rows probe the index with their own prefix and
+    numeric body, and only the products found that way have their suffix checked, so
+    matching grows with products + kit rows instead of their cross product.
+    A product's suffix matches a kit's suffix when it is the same, or the kit's suffix followed
+    by one of 'finishes'; any other extra part makes it a different item.
+    """
+
+    def __init__(self, components, finishes=FINISHES):
+        self.finishes = frozenset(finishes)
+        # Keys without a numeric body can't identify a set
+        has_key = (components['numeric'] != '').to_numpy()
+        self._rows = np.flatnonzero(has_key)
+
+        codes, uniques = pd.factorize(
+            components['prefix'][has_key] + ' ' + components['numeric'][has_key]
+        )
+        self._keys = pd.Index(uniques, dtype=object)
+        # Rows grouped by key: the rows of key k are _members[_offsets[k]:_offsets[k + 1]]
+        order = np.argsort(codes, kind='stable')
+        self._members = self._rows[order]
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(uniques)))])
+        self._suffixes = components['suffix'].to_numpy(dtype=object)
+
+    def candidates(self, prefixes, numerics):
+        """
+        Returns the (product position, kit position) pairs that share a prefix and numeric body.
+        """
+        keys = pd.Index(np.asarray(prefixes, dtype=object) + ' ' + np.asarray(numerics, dtype=object))
+        positions = self._keys.get_indexer(keys)
+        found = np.flatnonzero(positions >= 0)
+        starts = self._offsets[positions[found]]
+        counts = self._offsets[positions[found] + 1] - starts
+
+        kit_positions = np.repeat(found, counts)
+        # Position of every candidate inside its group of members
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        product_positions = self._members[np.repeat(starts, counts) + within]
+        return product_positions, kit_positions
+
+    def verified(self, kit_df, prefix='prefix', numeric='numeric', suffix='suffix'):
+        """
+        Returns every (product position, kit position) pair where the product shares the kit's
+        prefix and numeric body and the product's suffix is the kit's suffix, or the kit's suffix
+        followed by a finish code.
+        """
+        product_positions, kit_positions = self.candidates(kit_df[prefix], kit_df[numeric])
+        kit_suffixes = kit_df[suffix].to_numpy(dtype=object)
+
+        # Suffixes repeat a lot, so each distinct pair of suffixes is checked once
+        product_codes, product_uniques = pd.factorize(self._suffixes[product_positions])
+        kit_codes, kit_uniques = pd.factorize(kit_suffixes[kit_positions])
+        pairs, pair_codes = np.unique(
+            np.stack([product_codes, kit_codes], axis=1).reshape(-1, 2), axis=0, return_inverse=True)
+        verified = np.array(
+            [self._suffix_matches(product_uniques[p], kit_uniques[k]) for p, k in pairs], dtype=bool
+        )
+        keep = verified[pair_codes.reshape(-1)] if len(pairs) else np.zeros(0, dtype=bool)
+        return product_positions[keep], kit_positions[keep]
+
+    def _suffix_matches(self, product_suffix, kit_suffix):
+        if product_suffix == kit_suffix:
+            return True
+        return product_suffix.startswith(kit_suffix) and product_suffix[len(kit_suffix):] in self.finishes
+
+    def match(self, kit_df, prefix='prefix', numeric='numeric', suffix='suffix', price='Updated List Price'):
+        """
+        Matches the kit rows to the indexed products. A candidate is kept when the
+        product's suffix is the kit's suffix, alone or followed by a finish code. A product matching several kits
+        keeps the one with the longest suffix, then the highest price, then the first row,
+        all resolved in the same sort. Returns (product positions, kit positions).
+        """
+        product_positions, kit_positions = self.verified(kit_df, prefix, numeric, suffix)
+        kit_suffixes = kit_df[suffix].to_numpy(dtype=object)
+
+        suffix_lengths = np.fromiter((len(s) for s in kit_suffixes), dtype=int, count=len(kit_suffixes))
+        prices = pd.to_numeric(kit_df[price], errors='coerce').to_numpy(dtype=float)
+        # Missing prices rank below every real price
+        ranked_prices = np.where(np.isnan(prices), -np.inf, prices)
+        order = np.lexsort((
+            kit_positions, -ranked_prices[kit_positions], -suffix_lengths[kit_positions], product_positions,
+        ))
+        product_positions, kit_positions = product_positions[order], kit_positions[order]
+        _, first = np.unique(product_positions, return_index=True)
+        return product_positions[first], kit_positions[first]
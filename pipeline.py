@@ -0,0 +1,415 @@
+import os
+import json
+import hashlib
+from collections import namedtuple
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as pd
+
+from data_loading import filter_price_list
+import basic_matching as bm
+from price_index import PriceIndex
+from parallel_matching import build_sheet_keys
+from match_context import MatchContext, keys_for, backend_for, config_for
+from fuzzy_matching import NgramIndex, suggest_matches
+from residual_tracker import ResidualTracker, SOURCE_COLUMN
+from resolution_cache import ResolutionCache
+from finish_index import FinishPriceIndex
+from workbook_reader import StreamingPriceList
+import kit_matching as km
+
+CHECKPOINT_DIRECTORY = '.pipeline_checkpoints'
+MANIFEST_FILE = 'stage.json'
+
+# A named step of the matching cascade, with the artifacts it reads and the ones it produces,
+# and for the stages that price products, the output holding the products they claimed
+Stage = namedtuple('Stage', ['name', 'func', 'inputs', 'outputs', 'claims'], defaults=(None,))
+
+
+# Stages of the matching cascade
+
+# Every stage takes the MatchContext of the run, so the product keys are derived once
+
+# The pricing stages match the unmatched rows of the stage before them, the input the DAG
+# declares, and claim the ones they price on the ResidualTracker of the run. Their own unmatched
+# rows are the rows of their input still unclaimed. A stage run on its own tracks its input alone
+def _tracker(context, products):
+    tracker = context.residuals if context is not None else None
+    return tracker if tracker is not None else ResidualTracker(products)
+
+def _claim_matches(tracker, stage_name, matches):
+    # A product an earlier stage priced already makes the claim fail, before anything uses the matches
+    tracker.claim(stage_name, matches, sources=matches.get(SOURCE_COLUMN))
+
+def _claim(tracker, stage_name, matches, unmatched):
+    _claim_matches(tracker, stage_name, matches)
+    return matches, tracker.residual(unmatched)
+
+def sheet_keys_stage(products, price_list, context=None):
+    # Every sheet is normalized once, over a process pool when there are workers to spare
+    if context is not None:
+        return context.sheet_keys
+    return build_sheet_keys(products, price_list)
+
+def exact_match_stage(products, price_list, sheet_keys, context=None):
+    # Direct matches between Eclipse's Database and the price list, directly feeding in the updated price.
+    # The context's index is the one the rest of the run reads, built with its backend
+    if context is not None:
+        # Sheet keys loaded from a checkpoint are not built again for the index
+        context.seed_sheet_keys(sheet_keys)
+    price_index = context.price_index if context is not None else PriceIndex(price_list, sheet_keys=sheet_keys)
+    tracker = _tracker(context, products)
+    exact_matches = bm.match_and_update_price(products, price_list, price_index, context)
+    return _claim(tracker, 'exact_match', exact_matches, products)
+
+def cached_resolutions_stage(exact_unmatched, price_list, context=None):
+    # Products resolved in an earlier run are repriced from their cached resolution and skip the cascade
+    tracker = _tracker(context, exact_unmatched)
+    cache = context.resolution_cache if context is not None else None
+    if cache is None:
+        return _claim(tracker, 'cached_resolutions', exact_unmatched.iloc[0:0], exact_unmatched)
+    cached_matches = cache.reprice(exact_unmatched, context.resolution_tables, keys_for(exact_unmatched, context))
+    return _claim(tracker, 'cached_resolutions', cached_matches, exact_unmatched)
+
+def custom_finish_stage(cache_unmatched, price_list, context=None):
+    tracker = _tracker(context, cache_unmatched)
+    config = config_for(context)
+    non_kit_price_list = filter_price_list(price_list, 'individual', config.sheet_dict)
+    # Both steps probe the same base item -> finish index
+    if context is not None:
+        finish_index = context.individual_finish_index
+    else:
+        finish_index = FinishPriceIndex(non_kit_price_list, config.finishes)
+    custom_finished_matches = bm.find_matches_with_custom_finishes(
+        cache_unmatched, non_kit_price_list, finish_index, context)
+    custom_finished_products = bm.price_custom_finishes(
+        custom_finished_matches, non_kit_price_list, finish_index, context)
+    return _claim(tracker, 'custom_finishes', custom_finished_products, cache_unmatched)
+
+def revival_kit_stage(custom_finish_unmatched, price_list, context=None):
+    tracker = _tracker(context, custom_finish_unmatched)
+    kit_price_list = filter_price_list(price_list, 'kit', config_for(context).sheet_dict)
+    revival_matches = km.find_and_update_revival_kits(custom_finish_unmatched, kit_price_list, context)
+    return _claim(tracker, 'revival_kits', revival_matches, custom_finish_unmatched)
+
+def metro_items_stage(price_list, context=None):
+    # A map of 'Metro' items, that shows item without finish and the price
+    config = config_for(context)
+    kit_price_list = filter_price_list(price_list, 'kit', config.sheet_dict)
+    # A supplier without some of the Metro sheets has none of their items
+    metro_sheets = {name: kit_price_list[name] for name in config.metro_sheet_names if name in kit_price_list}
+    return km.map_metro_items(metro_sheets, config.finishes)
+
+def metro_mortise_stage(revival_unmatched, metro_items, context=None):
+    # Split Metro Mortise items into a dictionary of dataframes and match the sets
+    tracker = _tracker(context, revival_unmatched)
+    mortise_types = config_for(context).mortise_types
+    if not mortise_types:
+        print("Metro mortise sets are not matched: no mortise mechanism codes are configured")
+        no_matches = revival_unmatched.iloc[0:0].assign(**{SOURCE_COLUMN: None})
+        return _claim(tracker, 'metro_mortise', no_matches, revival_unmatched)
+    metro_mortise_categorized = km.categorize_metro_items(metro_items, mortise_types)
+    metro_mortise_sets = km.merge_and_update_patterns_based_on_description(
+        metro_mortise_categorized, revival_unmatched, 'temp_match_col', mortise_types, context)
+    return _claim(tracker, 'metro_mortise', metro_mortise_sets, revival_unmatched)
+
+def metro_tubular_stage(metro_mortise_unmatched, metro_items, context=None):
+    tracker = _tracker(context, metro_mortise_unmatched)
+    tubular_types = config_for(context).tubular_types
+    if not tubular_types:
+        print("Metro tubular sets are not matched: no tubular mechanism codes are configured")
+        no_matches = metro_mortise_unmatched.iloc[0:0].assign(**{SOURCE_COLUMN: None})
+        return _claim(tracker, 'metro_tubular', no_matches, metro_mortise_unmatched)
+    metro_tubular_categorized = km.categorize_metro_items(metro_items, tubular_types)
+    metro_tubular_sets = km.merge_and_update_patterns_based_on_description(
+        metro_tubular_categorized, metro_mortise_unmatched, 'temp_match_col', tubular_types, context)
+    return _claim(tracker, 'metro_tubular', metro_tubular_sets, metro_mortise_unmatched)
+
+def final_update_stage(products, exact_matches, cached_matches, custom_finish_matches, revival_matches,
+                       metro_mortise_matches, metro_tubular_matches, context=None):
+    # The stages claimed their products as they ran; without the run's tracker they are claimed here
+    tracker = context.residuals if context is not None else None
+    if tracker is None:
+        tracker = ResidualTracker(products)
+        stage_matches = (exact_matches, cached_matches, custom_finish_matches, revival_matches,
+                         metro_mortise_matches, metro_tubular_matches)
+        for stage_name, matches in zip(CASCADE_STAGES, stage_matches):
+            _claim_matches(tracker, stage_name, matches)
+    for stage_name, count in tracker.claim_counts().items():
+        print(f"Products priced by '{stage_name}': {count}")
+    print(f"Products left unmatched: {len(tracker.residual())}")
+
+    update = tracker.materialize(with_provenance=True)
+    #REMOVE DPAMS
+    mask = ~backend_for(context).contains(update['Desc1'], 'DPAM')
+    update = update[mask]
+    # Which stage priced every product of the update, and from which item
+    return update.drop(columns=['STAGE', SOURCE_COLUMN]), update[['ID', 'STAGE', SOURCE_COLUMN]]
+
+def store_resolutions_stage(custom_finish_matches, revival_matches, metro_mortise_matches, metro_tubular_matches,
+                            context=None):
+    # The products the cascade resolved this run are cached for the next one
+    cache = context.resolution_cache if context is not None else None
+    if cache is None:
+        return pd.DataFrame(columns=['STAGE', 'STORED'])
+    return cache.store({
+        'custom_finishes': custom_finish_matches,
+        'revival_kits': revival_matches,
+        'metro_mortise': metro_mortise_matches,
+        'metro_tubular': metro_tubular_matches,
+    }, context.resolution_tables, context)
+
+def fuzzy_suggestions_stage(metro_tubular_unmatched, price_list, sheet_keys, context=None):
+    # Whatever no stage matched gets ranked suggestions from an n-gram index of the price list
+    index = NgramIndex.from_price_list(price_list, sheet_keys)
+    return suggest_matches(metro_tubular_unmatched, index, keys_for(metro_tubular_unmatched, context))
+
+def uncreated_items_stage(products, price_list, sheet_keys, context=None):
+    return collect_new_items(products, price_list, sheet_keys, context)
+
+
+STAGES = (
+    Stage('sheet_keys', sheet_keys_stage, ('products', 'price_list'), ('sheet_keys',)),
+    Stage('exact_match', exact_match_stage, ('products', 'price_list', 'sheet_keys'),
+          ('exact_matches', 'exact_unmatched'), 'exact_matches'),
+    Stage('cached_resolutions', cached_resolutions_stage, ('exact_unmatched', 'price_list'),
+          ('cached_matches', 'cache_unmatched'), 'cached_matches'),
+    Stage('custom_finishes', custom_finish_stage, ('cache_unmatched', 'price_list'),
+          ('custom_finish_matches', 'custom_finish_unmatched'), 'custom_finish_matches'),
+    Stage('revival_kits', revival_kit_stage, ('custom_finish_unmatched', 'price_list'),
+          ('revival_matches', 'revival_unmatched'), 'revival_matches'),
+    Stage('metro_items', metro_items_stage, ('price_list',), ('metro_items',)),
+    Stage('metro_mortise', metro_mortise_stage, ('revival_unmatched', 'metro_items'),
+          ('metro_mortise_matches', 'metro_mortise_unmatched'), 'metro_mortise_matches'),
+    Stage('metro_tubular', metro_tubular_stage, ('metro_mortise_unmatched', 'metro_items'),
+          ('metro_tubular_matches', 'metro_tubular_unmatched'), 'metro_tubular_matches'),
+    Stage('final_update', final_update_stage,
+          ('products', 'exact_matches', 'cached_matches', 'custom_finish_matches', 'revival_matches',
+           'metro_mortise_matches', 'metro_tubular_matches'),
+          ('final_update', 'price_provenance')),
+    Stage('store_resolutions', store_resolutions_stage,
+          ('custom_finish_matches', 'revival_matches', 'metro_mortise_matches', 'metro_tubular_matches'),
+          ('stored_resolutions',)),
+    Stage('fuzzy_suggestions', fuzzy_suggestions_stage, ('metro_tubular_unmatched', 'price_list', 'sheet_keys'),
+          ('fuzzy_suggestions',)),
+    Stage('uncreated_items', uncreated_items_stage, ('products', 'price_list', 'sheet_keys'), ('uncreated_items',)),
+)
+
+STAGE_NAMES = tuple(stage.name for stage in STAGES)
+# The stages that price products, in the order they claim them
+CASCADE_STAGES = tuple(stage.name for stage in STAGES if stage.claims is not None)
+
+
+# Checkpoints
+
+def fingerprint(value):
+    """
+    Content hash of a DataFrame, or of a dictionary of DataFrames. A streamed workbook is
+    hashed from its path, modification time and size, so no sheet is parsed to hash it.
+    """
+    digest = hashlib.sha256()
+    if isinstance(value, StreamingPriceList):
+        digest.update(repr(value.signature()).encode())
+    elif isinstance(value, Mapping):
+        for key, item in value.items():
+            digest.update(str(key).encode())
+            digest.update(fingerprint(item).encode())
+    else:
+        digest.update(repr(list(value.columns)).encode())
+        digest.update(repr([str(dtype) for dtype in value.dtypes]).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def _save_frame(df, path_without_extension):
+    """
+    Stores a DataFrame as Parquet, or pickles it when its columns mix types Arrow cannot hold.
+    """
+    try:
+        df.to_parquet(path_without_extension + '.parquet')
+        return path_without_extension + '.parquet'
+    except (ImportError, ValueError, TypeError, NotImplementedError):
+        df.to_pickle(path_without_extension + '.pkl')
+        return path_without_extension + '.pkl'
+
+def _load_frame(path):
+    return pd.read_parquet(path) if path.endswith('.parquet') else pd.read_pickle(path)
+
+def save_checkpoint(checkpoint_dir, stage, input_fingerprints, outputs):
+    """
+    Writes the outputs of a stage, then the manifest recording which inputs produced them.
+    Returns the fingerprints of the outputs.
+    """
+    stage_directory = os.path.join(checkpoint_dir, stage.name)
+    os.makedirs(stage_directory, exist_ok=True)
+    manifest = {'inputs': input_fingerprints, 'outputs': {}}
+    for name, value in outputs.items():
+        path = _save_frame(value, os.path.join(stage_directory, name))
+        manifest['outputs'][name] = {'file': os.path.basename(path), 'fingerprint': fingerprint(value)}
+
+    temp_path = os.path.join(stage_directory, MANIFEST_FILE + '.tmp')
+    with open(temp_path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temp_path, os.path.join(stage_directory, MANIFEST_FILE))
+    return {name: output['fingerprint'] for name, output in manifest['outputs'].items()}
+
+def load_checkpoint(checkpoint_dir, stage, input_fingerprints):
+    """
+    Returns the stored outputs of a stage and their fingerprints, or None if there is
+    no checkpoint or it was produced from different inputs.
+    """
+    stage_directory = os.path.join(checkpoint_dir, stage.name)
+    try:
+        with open(os.path.join(stage_directory, MANIFEST_FILE)) as file:
+            manifest = json.load(file)
+        if manifest['inputs'] != input_fingerprints:
+            return None
+        outputs = {
+            name: _load_frame(os.path.join(stage_directory, output['file']))
+            for name, output in manifest['outputs'].items()
+        }
+    except (OSError, ValueError, KeyError, ImportError):
+        return None
+    return outputs, {name: output['fingerprint'] for name, output in manifest['outputs'].items()}
+
+
+# Runner
+
+def _stages_for(targets):
+    """
+    The stages needed to produce the target artifacts, in declaration order.
+    """
+    producers = {output: stage for stage in STAGES for output in stage.outputs}
+    needed, pending = set(), list(targets)
+    while pending:
+        artifact = pending.pop()
+        stage = producers.get(artifact)
+        if stage is not None and stage.name not in needed:
+            needed.add(stage.name)
+            pending.extend(stage.inputs)
+    return [stage for stage in STAGES if stage.name in needed]
+
+def _downstream_of(stage_name, stages):
+    """
+    Names of the stage and of every stage that depends on its outputs, directly or not.
+    """
+    downstream, produced = {stage_name}, set()
+    for stage in stages:
+        if stage.name in downstream or produced.intersection(stage.inputs):
+            downstream.add(stage.name)
+            produced.update(stage.outputs)
+    return downstream
+
+def _run_stage(stage, artifacts, context):
+    # Stages never modify their inputs, so they all share the same frames
+    results = stage.func(*[artifacts[name] for name in stage.inputs], context=context)
+    if len(stage.outputs) == 1:
+        results = (results,)
+    return dict(zip(stage.outputs, results))
+
+def run_pipeline(products, price_list, targets=('final_update', 'uncreated_items'),
+                 checkpoint_dir=CHECKPOINT_DIRECTORY, resume_from=None, max_workers=4, sheet_workers=1,
+                 resolution_cache=None, context=None, backend='pandas'):
+    """
+    Runs the stages needed for the targets, concurrently wherever their inputs allow.
+    The per-sheet normalization is spread over 'sheet_workers' processes; its result
+    does not depend on the number of workers.
+    With a resolution_cache path, products resolved in earlier runs are repriced from the cache
+    and the stages only resolve the rest; the new resolutions are stored when 'store_resolutions' runs.
+    A MatchContext of these products and price list can be passed to reuse the keys already derived in it.
+    'backend' runs the string-heavy steps on pandas or on Arrow; both give the same outputs.
+    Each pricing stage matches the unmatched rows of the stage before it and claims the products
+    it prices on one ResidualTracker per run; a stage re-pricing a claimed product fails. 'price_provenance'
+    records the stage and the item that priced every product of the update.
+    The outputs of every stage, including the residual unmatched rows, are checkpointed.
+    With resume_from, the stages before it are loaded from their checkpoints when
+    these were produced from the same inputs; that stage and everything after it run again.
+    Returns a dictionary of all the artifacts produced.
+    """
+    stages = _stages_for(targets)
+    if resume_from is not None and resume_from not in [stage.name for stage in stages]:
+        raise ValueError(f"Unknown stage '{resume_from}', expected one of {[stage.name for stage in stages]}")
+    rerun = _downstream_of(resume_from, stages) if resume_from else {stage.name for stage in stages}
+
+    artifacts = {'products': products, 'price_list': price_list}
+    if context is None:
+        context = MatchContext(products, price_list, sheet_workers, backend=backend)
+    # The cached resolutions hold for the tables of the run's supplier config only
+    cache = ResolutionCache(resolution_cache, context.config) if resolution_cache else None
+    if cache is not None:
+        context.resolution_cache = cache
+    # Every run claims the products afresh, whether the context is new or not
+    context.residuals = ResidualTracker(products)
+    fingerprints = {}
+
+    def input_fingerprints(stage):
+        for name in stage.inputs:
+            if name not in fingerprints:
+                fingerprints[name] = fingerprint(artifacts[name])
+        return {name: fingerprints[name] for name in stage.inputs}
+
+    waiting = list(stages)
+    running = {}
+    failure = None
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while running or (waiting and failure is None):
+            ready = [stage for stage in waiting if all(name in artifacts for name in stage.inputs)]
+            if failure is None and not ready and not running:
+                raise RuntimeError(f"Stages {[stage.name for stage in waiting]} have inputs no stage produces")
+            for stage in ready if failure is None else []:
+                waiting.remove(stage)
+                if checkpoint_dir and stage.name not in rerun:
+                    checkpoint = load_checkpoint(checkpoint_dir, stage, input_fingerprints(stage))
+                    if checkpoint is not None:
+                        outputs, output_fingerprints = checkpoint
+                        if stage.claims is not None:
+                            # The products of a stage loaded from its checkpoint are claimed as if it had run
+                            _claim_matches(context.residuals, stage.name, outputs[stage.claims])
+                        artifacts.update(outputs)
+                        fingerprints.update(output_fingerprints)
+                        print(f"Stage '{stage.name}' loaded from checkpoint")
+                        continue
+                running[executor.submit(_run_stage, stage, artifacts, context)] = stage
+
+            if not running:
+                # Everything ready was loaded from checkpoints; look for newly ready stages
+                continue
+
+            # When a stage fails, the ones already running still finish and are checkpointed
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    outputs = future.result()
+                except Exception as error:
+                    print(f"Stage '{stage.name}' failed: {error!r}")
+                    failure = failure or error
+                    continue
+                if checkpoint_dir:
+                    fingerprints.update(save_checkpoint(checkpoint_dir, stage, input_fingerprints(stage), outputs))
+                artifacts.update(outputs)
+                print(f"Stage '{stage.name}' completed")
+
+    if cache is not None:
+        cache.close()
+    if failure is not None:
+        raise failure
+    return artifacts
+
+def price_products(products, price_list, sheet_workers=1, context=None):
+    """
+    Runs the matching cascade over the products and returns the rows to update
+    with their new price: exact matches, custom finishes, Revival kits,
+    Metro mortise and Metro tubular sets, without DPAMs.
+    """
+    return run_pipeline(
+        products, price_list, targets=('final_update',), checkpoint_dir=None, sheet_workers=sheet_workers,
+        context=context,
+    )['final_update']
+
+def collect_new_items(products, price_list, sheet_keys=None, context=None):
+    """
+    Items of the price list not created in Eclipse yet (individual sheets only)
+    """
+    individual = filter_price_list(price_list, 'individual', config_for(context).sheet_dict)
+    return bm.collect_uncreated_items(products, individual, sheet_keys, context)
@@ -0,0 +1,94 @@
+import pandas as pd
+import numpy as np
+import utils as ut
+from parallel_matching import keys_for_sheet
+from backends import get_backend
+
+# Rules for choosing a price when the same key appears in more than one row
+DUPLICATE_RULES = ('first', 'last', 'max', 'min')
+
+
+class PriceIndex:
+    """
+    A single hash index over the normalized item keys of every sheet in the price list.
+    Each key resolves to one price, the sheet it came from and the original item.
+    When a key appears more than once, 'duplicate_rule' decides which row wins:
+    'first' and 'last' follow workbook order (sheet order, then row order),
+    'max' and 'min' pick by price and fall back to workbook order on ties.
+    Sheet keys already built by build_sheet_keys are reused instead of normalizing the sheets again.
+    Keys are normalized and probed with 'backend', the pandas backend by default.
+    """
+
+    def __init__(self, price_list_dict, duplicate_rule='first', sheet_keys=None, backend=None):
+        if duplicate_rule not in DUPLICATE_RULES:
+            raise ValueError(f"duplicate_rule must be one of {DUPLICATE_RULES}, got '{duplicate_rule}'")
+        self._backend = get_backend(backend or 'pandas')
+
+        entries = []
+        for sheet_name, sheet_df in price_list_dict.items():
+            item_column = ut.get_item_column(sheet_df)
+            price_column = ut.get_price_column(sheet_df)
+            if item_column is None:
+                continue
+            # The sheets themselves are left untouched
+            if sheet_keys is not None:
+                keys = keys_for_sheet(sheet_keys, sheet_name)['temp_match_col']
+            else:
+                keys = self._backend.normalize(sheet_df[item_column])
+            has_item = sheet_df[item_column].notna()
+            prices = pd.to_numeric(sheet_df[price_column], errors='coerce') if price_column else np.nan
+            entries.append(pd.DataFrame({
+                'temp_match_col': keys,
+                'PRICE': prices,
+                'SHEET': sheet_name,
+                'ITEM': sheet_df[item_column],
+            })[has_item])
+
+        if entries:
+            entries = pd.concat(entries, ignore_index=True)
+        else:
+            entries = pd.DataFrame(columns=['temp_match_col', 'PRICE', 'SHEET', 'ITEM'])
+
+        if duplicate_rule == 'last':
+            entries = entries.iloc[::-1]
+        elif duplicate_rule in ('max', 'min'):
+            entries = entries.sort_values('PRICE', ascending=duplicate_rule == 'min', kind='stable', na_position='last')
+        entries = entries.drop_duplicates(subset=['temp_match_col'], keep='first')
+
+        # Every array carries a trailing sentinel so that the -1 returned for
+        # missing keys reads NaN without any extra masking
+        self.duplicate_rule = duplicate_rule
+        self._keys = pd.Index(entries['temp_match_col'].to_numpy(dtype=object))
+        self._prices = np.append(entries['PRICE'].to_numpy(dtype=float), np.nan)
+        self._items = np.append(entries['ITEM'].to_numpy(dtype=object), None)
+        self._sheet_names = list(price_list_dict.keys())
+        self._sheet_codes = np.append(
+            pd.Categorical(entries['SHEET'], categories=self._sheet_names).codes, -1
+        )
+
+    def __len__(self):
+        return len(self._keys)
+
+    def positions(self, keys):
+        """
+        Returns the index position of every key, or -1 where the key is not in the index.
+        """
+        return self._backend.positions(keys, self._keys)
+
+    def contains(self, keys):
+        """
+        Returns a boolean array that flags the keys present in the index.
+        """
+        return self.positions(keys) >= 0
+
+    def lookup(self, keys):
+        """
+        Vectorized lookup of a series of keys. Returns a DataFrame aligned to the
+        series with the matched price, source sheet and item, NaN where unmatched.
+        """
+        positions = self.positions(keys)
+        sheets = pd.Categorical.from_codes(self._sheet_codes[positions], categories=self._sheet_names)
+        return pd.DataFrame(
+            {'PRICE': self._prices[positions], 'SHEET': sheets, 'ITEM': self._items[positions]},
+            index=keys.index,
+        )
@@ -0,0 +1,196 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from data_loading import clean_price_list, find_latest_price_list
+from data_config import SHEET_DICT
+from workbook_reader import read_workbook_streaming
+
+CACHE_DIRECTORY = '.price_list_cache'
+MANIFEST_FILE = 'manifest.json'
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """
+    Computes the SHA-256 of a file's contents, reading it in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cache_directory_for(workbook_path):
+    """
+    The cache for a workbook lives next to it, in a folder named after the workbook.
+    """
+    directory, filename = os.path.split(os.path.abspath(workbook_path))
+    return os.path.join(directory, CACHE_DIRECTORY, filename)
+
+def _read_manifest(cache_directory):
+    try:
+        with open(os.path.join(cache_directory, MANIFEST_FILE)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def _write_manifest(cache_directory, manifest):
+    temp_path = os.path.join(cache_directory, MANIFEST_FILE + '.tmp')
+    with open(temp_path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temp_path, os.path.join(cache_directory, MANIFEST_FILE))
+
+def load_cached_sheets(workbook_path, sheet_names=SHEET_DICT):
+    """
+    Returns the cleaned sheets stored for this workbook, or None if the cache
+    is missing or stale. The modification time and size are checked first; the
+    content hash is only computed when they differ, and a matching hash refreshes them.
+    Sheets stored for another selection of sheet names are stale as well.
+    """
+    cache_directory = cache_directory_for(workbook_path)
+    manifest = _read_manifest(cache_directory)
+    if manifest is None:
+        return None
+    # Caches written before the selection was recorded hold the sheets of SHEET_DICT
+    if manifest.get('sheet_names', sorted(SHEET_DICT)) != sorted(sheet_names):
+        return None
+
+    stat = os.stat(workbook_path)
+    if manifest.get('mtime') != stat.st_mtime or manifest.get('size') != stat.st_size:
+        if manifest.get('sha256') != file_hash(workbook_path):
+            return None
+        manifest['mtime'], manifest['size'] = stat.st_mtime, stat.st_size
+        _write_manifest(cache_directory, manifest)
+
+    try:
+        return {
+            sheet['name']: pd.read_parquet(os.path.join(cache_directory, sheet['file']))
+            for sheet in manifest['sheets']
+        }
+    except (OSError, ValueError, ImportError):
+        return None
+
+def _new_manifest(workbook_path, sheet_names):
+    stat = os.stat(workbook_path)
+    return {
+        'workbook': os.path.basename(workbook_path),
+        'sha256': file_hash(workbook_path),
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'sheet_names': sorted(sheet_names),
+        'sheets': [],
+    }
+
+def store_cached_sheets(workbook_path, dict_of_dfs, sheet_names=SHEET_DICT):
+    """
+    Writes every cleaned sheet to Parquet, then the manifest that makes them valid
+    for the selection of sheet names they were read with.
+    Returns False if the sheets could not be stored (e.g. pyarrow is not installed).
+    """
+    cache_directory = cache_directory_for(workbook_path)
+    os.makedirs(cache_directory, exist_ok=True)
+    manifest = _new_manifest(workbook_path, sheet_names)
+
+    try:
+        for position, (sheet_name, sheet_df) in enumerate(dict_of_dfs.items()):
+            filename = f"sheet_{position:03d}.parquet"
+            sheet_df.to_parquet(os.path.join(cache_directory, filename))
+            manifest['sheets'].append({'name': sheet_name, 'file': filename})
+    except (ImportError, ValueError, TypeError, NotImplementedError) as error:
+        print(f"Price list cache not written: {error}")
+        return False
+
+    _write_manifest(cache_directory, manifest)
+    return True
+
+def store_sheets_as_loaded(workbook_path, price_list, sheet_names=SHEET_DICT):
+    """
+    Stores the sheets of a StreamingPriceList to Parquet one at a time, as the run parses them,
+    so the workbook is still only read as far as it is used. The manifest that makes them
+    valid is written with the last sheet; a run that leaves a sheet unread leaves no cache.
+    """
+    if not len(price_list):
+        return store_cached_sheets(workbook_path, {}, sheet_names)
+    cache_directory = cache_directory_for(workbook_path)
+    os.makedirs(cache_directory, exist_ok=True)
+    manifest = _new_manifest(workbook_path, sheet_names)
+    # Sheets of an earlier cache are overwritten below, so its manifest goes first
+    try:
+        os.remove(os.path.join(cache_directory, MANIFEST_FILE))
+    except FileNotFoundError:
+        pass
+    positions = {sheet_name: position for position, sheet_name in enumerate(price_list)}
+    stored = {}
+
+    def store(sheet_name, sheet_df):
+        filename = f"sheet_{positions[sheet_name]:03d}.parquet"
+        try:
+            sheet_df.to_parquet(os.path.join(cache_directory, filename))
+        except (ImportError, ValueError, TypeError, NotImplementedError) as error:
+            print(f"Price list cache not written: {error}")
+            price_list.on_load = None
+            return
+        stored[sheet_name] = filename
+        if len(stored) == len(positions):
+            manifest['sheets'] = [{'name': name, 'file': stored[name]} for name in positions]
+            _write_manifest(cache_directory, manifest)
+
+    price_list.on_load = store
+    return True
+
+def _read_sheet(workbook_path, sheet_name):
+    return pd.read_excel(workbook_path, sheet_name=sheet_name)
+
+def read_workbook_parallel(workbook_path, max_workers=None):
+    """
+    Parses every sheet of a workbook, one sheet per worker process.
+    Sheets are returned in workbook order.
+    """
+    with pd.ExcelFile(workbook_path) as workbook:
+        sheet_names = workbook.sheet_names
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(sheet_names))
+    if max_workers <= 1:
+        return pd.read_excel(workbook_path, sheet_name=None)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        sheets = executor.map(_read_sheet, [workbook_path] * len(sheet_names), sheet_names)
+        return dict(zip(sheet_names, sheets))
+
+def load_clean_workbook(workbook_path, use_cache=True, max_workers=None, streaming=True, sheet_names=SHEET_DICT):
+    """
+    Loads one price list workbook already cleaned. Reads it from the Parquet cache
+    when the workbook is unchanged. Otherwise the sheets named in 'sheet_names' are
+    streamed, each one parsed and stored to the cache when first used, or with
+    streaming=False every sheet is parsed in parallel, cleaned and stored at once.
+    """
+    if use_cache:
+        cached_sheets = load_cached_sheets(workbook_path, sheet_names)
+        if cached_sheets is not None:
+            print(f"Loaded file from cache: {os.path.basename(workbook_path)}")
+            return cached_sheets
+
+    if streaming:
+        price_list = read_workbook_streaming(workbook_path, sheet_names)
+    else:
+        price_list = clean_price_list(read_workbook_parallel(workbook_path, max_workers))
+    print(f"Loaded file: {os.path.basename(workbook_path)}")
+
+    if use_cache and streaming:
+        store_sheets_as_loaded(workbook_path, price_list, sheet_names)
+    elif use_cache:
+        store_cached_sheets(workbook_path, price_list, sheet_names)
+    return price_list
+
+def load_clean_price_list(directory=None, use_cache=True, max_workers=None, streaming=True):
+    """
+    Loads the latest price list in the directory, already cleaned.
+    """
+    workbook_path = find_latest_price_list(directory)
+    if workbook_path is None:
+        print("No 'Price List' file was found with a valid date, please follow file naming conventions")
+        return None
+    return load_clean_workbook(workbook_path, use_cache, max_workers, streaming)
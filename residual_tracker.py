@@ -0,0 +1,119 @@
+import pandas as pd
+import numpy as np
+
+# What claim() does when a stage claims a product an earlier stage already priced
+CONFLICT_RULES = ('raise', 'keep')
+# Column of the matches of a stage holding the item each price came from
+SOURCE_COLUMN = 'PRICE SOURCE'
+
+
+class ResidualTracker:
+    """
+    Tracks which products the stages of the cascade have priced. Every product row has a
+    slot in preallocated arrays: whether it is claimed, by which stage, at what price and
+    from which source, and in which order. A stage claims rows by ID; the products no stage
+    claimed yet are the residual. The update is materialized once, in claim order.
+    """
+
+    def __init__(self, products, price_column='LIST PRICE'):
+        self.products = products
+        self.price_column = price_column
+        self.stages = []
+        self._ids = pd.Index(products['ID'])
+        if not self._ids.is_unique:
+            raise ValueError("Product IDs must be unique to track them")
+
+        size = len(products)
+        self._claimed = np.zeros(size, dtype=bool)
+        self._stage_codes = np.full(size, -1, dtype=np.int16)
+        self._prices = np.full(size, np.nan)
+        self._sources = np.full(size, None, dtype=object)
+        self._order = np.full(size, -1, dtype=np.int64)
+        self._claims = 0
+        self._conflicts = {}
+
+    def positions(self, ids):
+        """
+        Row positions of the given IDs. Raises ValueError for IDs that are not products.
+        """
+        positions = self._ids.get_indexer(pd.Index(ids))
+        if (positions < 0).any():
+            unknown = pd.Index(ids)[positions < 0]
+            raise ValueError(f"Unknown product IDs: {list(unknown[:10])}")
+        return positions
+
+    def claim(self, stage_name, matches, sources=None, on_conflict='raise'):
+        """
+        Claims the products of 'matches' for a stage, at the price in their price column.
+        'sources' optionally records where each price came from, e.g. the matched item.
+        A product claimed by an earlier stage is never re-priced: with on_conflict='raise'
+        a ValueError is raised, with 'keep' the earlier claim stands and the conflict is counted.
+        Returns the number of products claimed.
+        """
+        if on_conflict not in CONFLICT_RULES:
+            raise ValueError(f"on_conflict must be one of {CONFLICT_RULES}, got '{on_conflict}'")
+        if stage_name in self.stages:
+            raise ValueError(f"Stage '{stage_name}' has already claimed its products")
+
+        positions = self.positions(matches['ID'])
+        if len(np.unique(positions)) != len(positions):
+            raise ValueError(f"Stage '{stage_name}' claims some products more than once")
+
+        taken = self._claimed[positions]
+        if taken.any():
+            if on_conflict == 'raise':
+                earlier = sorted({self.stages[code] for code in self._stage_codes[positions[taken]]})
+                raise ValueError(
+                    f"Stage '{stage_name}' would re-price {taken.sum()} products already claimed by {earlier}"
+                )
+            self._conflicts[stage_name] = int(taken.sum())
+
+        self.stages.append(stage_name)
+        new = ~taken
+        claimed = positions[new]
+        self._claimed[claimed] = True
+        self._stage_codes[claimed] = len(self.stages) - 1
+        self._prices[claimed] = pd.to_numeric(matches[self.price_column], errors='coerce').to_numpy(dtype=float)[new]
+        if sources is not None:
+            self._sources[claimed] = np.asarray(sources, dtype=object)[new]
+        self._order[claimed] = np.arange(self._claims, self._claims + len(claimed))
+        self._claims += len(claimed)
+        return len(claimed)
+
+    def is_claimed(self, ids):
+        return self._claimed[self.positions(ids)]
+
+    def residual(self, products=None):
+        """
+        The products no stage has claimed yet, or the rows of 'products' no stage has claimed.
+        """
+        if products is None:
+            return self.products[~self._claimed]
+        return products[~self.is_claimed(products['ID'])]
+
+    def claim_counts(self):
+        """
+        Number of products claimed by each stage, in stage order.
+        """
+        counts = np.bincount(self._stage_codes[self._claimed], minlength=len(self.stages))
+        return dict(zip(self.stages, counts.tolist()))
+
+    def conflicts(self):
+        """
+        Number of products each stage tried to claim after an earlier stage, with on_conflict='keep'.
+        """
+        return dict(self._conflicts)
+
+    def materialize(self, with_provenance=False):
+        """
+        Builds the update once: the claimed products in claim order, with their new price.
+        With provenance, 'STAGE' and 'PRICE SOURCE' columns record how each price was found.
+        """
+        positions = np.flatnonzero(self._claimed)
+        positions = positions[np.argsort(self._order[positions], kind='stable')]
+        update = self.products.iloc[positions].copy()
+        update[self.price_column] = self._prices[positions]
+        if with_provenance:
+            update['STAGE'] = pd.Categorical.from_codes(self._stage_codes[positions], categories=self.stages)
+            update[SOURCE_COLUMN] = self._sources[positions]
+        return update.reset_index(drop=True)
@@ -0,0 +1,318 @@
+import json
+import hashlib
+import sqlite3
+import threading
+
+import pandas as pd
+import numpy as np
+import utils as ut
+import kit_matching as km
+from data_loading import filter_price_list
+from finish_index import FinishPriceIndex
+from custom_finish_pricing import CustomFinishPricer, CUSTOM_FINISH_UPCHARGE
+from pattern_index import PatternIndex
+from sku_parser import parser_with_finishes
+from match_context import keys_for, components_for, config_for
+from residual_tracker import SOURCE_COLUMN
+from supplier_config import DEFAULT_CONFIG
+
+RESOLUTION_CACHE_FILE = '.match_resolutions.sqlite'
+# Bumped whenever the layout of the cache or the meaning of its candidates changes
+CACHE_FORMAT = 2
+# Bumped whenever a change to the normalizer, the SKU parser or a matching stage changes how a
+# description resolves. Edits that keep every resolution, like comments, leave the cache in place
+RULES_VERSION = 1
+
+# The cached stages in cascade order, and the SupplierConfig field of the mechanism types of the Metro ones
+CACHED_STAGES = ('custom_finishes', 'revival_kits', 'metro_mortise', 'metro_tubular')
+METRO_STAGE_TYPES = {'metro_mortise': 'mortise_types', 'metro_tubular': 'tubular_types'}
+
+RESOLUTION_COLUMNS = ['ID', 'KEY', 'STAGE', 'SHEET', 'ITEM', 'CANDIDATES']
+
+
+def rule_version(config=DEFAULT_CONFIG):
+    """
+    Hash of everything that decides how a description resolves: the version of the matching
+    rules, the finish pattern and the finish, sheet and mechanism tables of the supplier config.
+    """
+    digest = hashlib.sha256()
+    digest.update(f'{CACHE_FORMAT}:{RULES_VERSION}'.encode())
+    digest.update(ut.compile_finish_pattern(tuple(config.finishes)).pattern.encode())
+    for table in config:
+        # A table hashes the same whether it was given as a list or a tuple
+        digest.update(repr(list(table.items()) if isinstance(table, dict) else list(table)).encode())
+    digest.update(repr(CUSTOM_FINISH_UPCHARGE).encode())
+    return digest.hexdigest()
+
+def _key_set_fingerprint(*columns):
+    """
+    Hash of the distinct rows of the given columns, whatever their order.
+    """
+    keys = pd.DataFrame({i: pd.Series(column, dtype=object).to_numpy() for i, column in enumerate(columns)})
+    keys = keys.drop_duplicates().sort_values(list(keys.columns), kind='stable')
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(keys, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class ResolutionTables:
+    """
+    The price list tables of one run that cached resolutions are checked against and
+    repriced from, with a fingerprint per cached stage. A stage's fingerprint covers
+    what decides which products it matches, not its prices: a new price list with the
+    same items keeps every resolution valid and only changes the prices they are given.
+    The sheets, finishes and kit tables are those of the supplier's config.
+    """
+
+    def __init__(self, price_list, finish_index=None, config=DEFAULT_CONFIG):
+        self.config = config
+        individual = filter_price_list(price_list, 'individual', config.sheet_dict)
+        kits = filter_price_list(price_list, 'kit', config.sheet_dict)
+
+        # Custom finishes: base item -> price, the last row in workbook order winning
+        if finish_index is None:
+            finish_index = FinishPriceIndex(individual, config.finishes)
+        self.finish_index = finish_index
+        self.custom_prices = self.finish_index.base_prices(keep='last')
+        self._custom_prices = self.custom_prices.to_dict()
+        self._custom_sheets = _base_sheets(self.finish_index, keep='last')
+
+        # Revival kits: (left part, finish) -> price and sheet
+        revival_kits = km.revival_kit_prices(kits, config.revival_sheets, parser_with_finishes(config.finishes))
+        self._revival_kits = {
+            (left_part, finish): (price, sheet)
+            for left_part, finish, price, sheet in zip(
+                revival_kits['left_part'], revival_kits['finish'],
+                revival_kits['Updated List Price'], revival_kits['kit_sheet'])
+        }
+
+        # Metro items: base item -> price, the first row in workbook order winning
+        metro_index = FinishPriceIndex(
+            {name: kits[name] for name in config.metro_sheet_names if name in kits}, config.finishes)
+        self.metro_prices = metro_index.base_prices(keep='first')
+        self._metro_prices = self.metro_prices.to_dict()
+        self._metro_sheets = _base_sheets(metro_index, keep='first')
+        self.metro_items = pd.DataFrame({
+            'temp_match_col': self.metro_prices.index, 'Updated List Price': self.metro_prices.to_numpy(),
+        })
+
+        self.fingerprints = {
+            # A missing price decides whether a custom finish is priced at all, so it is part of the match
+            'custom_finishes': _key_set_fingerprint(self.custom_prices.index, self.custom_prices.isna()),
+            'revival_kits': _key_set_fingerprint(revival_kits['left_part'], revival_kits['finish']),
+            'metro_mortise': _key_set_fingerprint(self.metro_prices.index),
+            'metro_tubular': _key_set_fingerprint(self.metro_prices.index),
+        }
+
+    def metro_kit_rows(self, stage):
+        types_dict = getattr(self.config, METRO_STAGE_TYPES[stage])
+        categorized = km.categorize_metro_items(self.metro_items, types_dict)
+        return km.metro_kit_rows(categorized, 'temp_match_col', types_dict)
+
+    def resolve(self, stage, key, candidates):
+        """
+        Chooses among the cached candidates of a product the way its stage would, with the
+        prices of this price list. Returns (price, sheet, item); the price is NaN when none is listed.
+        """
+        if stage == 'custom_finishes':
+            if key.endswith('XX'):
+                return self._custom_prices.get(key, np.nan), self._custom_sheets.get(key), key
+            return _best(candidates, self._custom_prices, self._custom_sheets, CUSTOM_FINISH_UPCHARGE)
+        if stage == 'revival_kits':
+            left_part, finish = candidates
+            price, sheet = self._revival_kits.get((left_part, finish), (np.nan, None))
+            return price, sheet, f'{left_part}-{finish}' if sheet is not None else None
+        # Metro sets keep the kit with the longest suffix, then the highest price, then the first one
+        item = None
+        for candidate in candidates:
+            if item is None or _metro_rank(candidate, self._metro_prices) > _metro_rank(item, self._metro_prices):
+                item = candidate
+        return self._metro_prices.get(item, np.nan), self._metro_sheets.get(item), item
+
+
+def _base_sheets(finish_index, keep):
+    entries = finish_index.entries.drop_duplicates(subset=['BASE'], keep=keep)
+    return dict(zip(entries['BASE'], entries['SHEET']))
+
+def _metro_rank(item, prices):
+    # Missing prices rank below every real price
+    price = prices.get(item, np.nan)
+    return len(ut.split_key(item)[2]), -np.inf if np.isnan(price) else price
+
+def _best(candidates, prices, sheets, upcharge):
+    best, best_price = None, np.nan
+    for candidate in candidates:
+        price = prices.get(candidate, np.nan)
+        if not np.isnan(price) and (np.isnan(best_price) or price > best_price):
+            best, best_price = candidate, price
+    return best_price * upcharge, sheets.get(best), best
+
+
+class ResolutionCache:
+    """
+    A persistent SQLite store of how every product was resolved in earlier runs: its normalized
+    key, the stage that priced it, the matched item and sheet, and the candidates the stage
+    chose from, under the rule version they were found with. On the next run a product whose
+    key and stage are still valid is repriced from its candidates instead of going through the
+    substring and pattern stages again. Changing the rules drops the whole cache; changing the
+    items a stage matches against drops the resolutions of that stage and of every later one.
+    The rules are RULES_VERSION and the tables of the supplier config the cache is opened with.
+    """
+
+    def __init__(self, path=RESOLUTION_CACHE_FILE, config=DEFAULT_CONFIG):
+        self.path = path
+        self.rule_version = rule_version(config)
+        # Stages run on worker threads, one at a time against the cache
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS resolutions (id TEXT PRIMARY KEY, key TEXT, stage TEXT, "
+                "sheet TEXT, item TEXT, candidates TEXT, rule_version TEXT)"
+            )
+            stored = connection.execute("SELECT value FROM meta WHERE name = 'rule_version'").fetchone()
+            if stored is None or stored[0] != self.rule_version:
+                connection.execute("DELETE FROM resolutions")
+                connection.execute("DELETE FROM meta")
+                connection.execute("INSERT INTO meta VALUES ('rule_version', ?)", (self.rule_version,))
+
+    def close(self):
+        self._connection.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM resolutions").fetchone()[0]
+
+    def valid_stages(self, fingerprints):
+        """
+        The cached stages whose fingerprint, and the fingerprint of every earlier stage, is unchanged.
+        """
+        with self._lock:
+            stored = dict(self._connection.execute("SELECT name, value FROM meta WHERE name LIKE 'stage:%'"))
+        valid = []
+        for stage in CACHED_STAGES:
+            if stored.get(f'stage:{stage}') != fingerprints[stage]:
+                break
+            valid.append(stage)
+        return valid
+
+    def lookup(self, ids, stages):
+        """
+        The cached resolutions of the given product IDs in the given stages, one row per ID found.
+        """
+        if not stages:
+            return pd.DataFrame(columns=RESOLUTION_COLUMNS)
+        placeholders = ', '.join('?' * len(stages))
+        # The cache only holds resolved products, so reading a stage whole beats sending every ID
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, key, stage, sheet, item, candidates FROM resolutions "
+                f"WHERE stage IN ({placeholders}) AND rule_version = ?",
+                (*stages, self.rule_version),
+            ).fetchall()
+        resolutions = pd.DataFrame(rows, columns=RESOLUTION_COLUMNS)
+        return resolutions[resolutions['ID'].isin(pd.Index(ids).astype(str))].reset_index(drop=True)
+
+    def reprice(self, products_df, tables, keys=None):
+        """
+        The products with a valid cached resolution, priced from it with the current price list,
+        with the item chosen in their 'PRICE SOURCE' column.
+        A product is only taken when its normalized key is the one it was resolved from and
+        its stage would still price it; every other product goes through the cascade.
+        """
+        if keys is None:
+            keys = ut.prepare_data_for_matching(products_df[ut.get_dict_column(products_df)])
+        resolutions = self.lookup(products_df['ID'], self.valid_stages(tables.fingerprints))
+        resolutions = resolutions.set_index('ID').reindex(products_df['ID'].astype(str).to_numpy())
+
+        stages = resolutions['STAGE'].to_numpy(dtype=object)
+        cached_keys = resolutions['KEY'].to_numpy(dtype=object)
+        candidates = resolutions['CANDIDATES'].to_numpy(dtype=object)
+        found = cached_keys == keys.to_numpy(dtype=object)
+
+        # Many products share a resolution, so each distinct one is priced once
+        prices = np.full(len(products_df), np.nan)
+        items = np.full(len(products_df), None, dtype=object)
+        resolved = {}
+        for position in np.flatnonzero(found):
+            resolution = (stages[position], cached_keys[position], candidates[position])
+            if resolution not in resolved:
+                price, _, item = tables.resolve(resolution[0], resolution[1], json.loads(resolution[2]))
+                resolved[resolution] = price, item
+            prices[position], items[position] = resolved[resolution]
+
+        # A custom finish without a price is not priced by its stage; kits keep their price instead
+        found &= ~((stages == 'custom_finishes') & np.isnan(prices))
+        df = products_df[found].assign(**{'Updated LIST PRICE': prices[found]})
+        df = ut.update_price_columns(df)
+        df[SOURCE_COLUMN] = items[found]
+        for stage, count in pd.Series(stages[found]).value_counts(sort=False).items():
+            print(f"Cached resolutions reused for '{stage}': {count}")
+        return df.drop(columns=['Updated LIST PRICE'])
+
+    def store(self, stage_matches, tables, context=None):
+        """
+        Records the resolutions of the products each stage matched in this run, replacing their
+        earlier ones, and drops the resolutions of the stages this price list invalidated.
+        Returns the number of resolutions stored per stage.
+        """
+        valid = set(self.valid_stages(tables.fingerprints))
+        records = [_resolutions(stage, matches, tables, context) for stage, matches in stage_matches.items()]
+        records = [resolutions for resolutions in records if not resolutions.empty]
+        records = pd.concat(records, ignore_index=True) if records else pd.DataFrame(columns=RESOLUTION_COLUMNS)
+
+        with self._lock, self._connection as connection:
+            invalid = [stage for stage in CACHED_STAGES if stage not in valid]
+            connection.executemany("DELETE FROM resolutions WHERE stage = ?", ((stage,) for stage in invalid))
+            connection.executemany(
+                "INSERT OR REPLACE INTO resolutions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (*record, self.rule_version)
+                    for record in records[RESOLUTION_COLUMNS].itertuples(index=False, name=None)
+                ),
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                ((f'stage:{stage}', fingerprint) for stage, fingerprint in tables.fingerprints.items()),
+            )
+
+        counts = records['STAGE'].value_counts(sort=False)
+        return pd.DataFrame({'STAGE': list(stage_matches), 'STORED': [int(counts.get(stage, 0)) for stage in stage_matches]})
+
+
+def _resolutions(stage, matches, tables, context=None):
+    """
+    The candidates each matched product of a stage was chosen from, with the item and sheet chosen.
+    """
+    if matches.empty:
+        return pd.DataFrame(columns=RESOLUTION_COLUMNS)
+    keys = keys_for(matches, context)
+
+    if stage == 'custom_finishes':
+        candidates = CustomFinishPricer(tables.custom_prices).candidates(keys)
+    elif stage == 'revival_kits':
+        components = components_for(matches, context)
+        candidates = pd.Series(
+            [[left_part, finish] for left_part, finish in zip(components['left_part'], components['finish'])],
+            index=matches.index, dtype=object,
+        )
+    else:
+        kit_df = tables.metro_kit_rows(stage)
+        pattern_index = PatternIndex(components_for(matches, context), config_for(context).finishes)
+        product_positions, kit_positions = pattern_index.verified(kit_df)
+        kit_keys = kit_df['key'].to_numpy(dtype=object)
+        grouped = [[] for _ in range(len(matches))]
+        for product_position, kit_position in zip(product_positions, kit_positions):
+            grouped[product_position].append(kit_keys[kit_position])
+        candidates = pd.Series(grouped, index=matches.index, dtype=object)
+
+    resolved = [tables.resolve(stage, key, found) for key, found in zip(keys, candidates)]
+    return pd.DataFrame({
+        'ID': matches['ID'].astype(str).to_numpy(),
+        'KEY': keys.to_numpy(dtype=object),
+        'STAGE': stage,
+        'SHEET': [sheet for _, sheet, _ in resolved],
+        'ITEM': [item for _, _, item in resolved],
+        'CANDIDATES': [json.dumps(found) for found in candidates],
+    })
@@ -0,0 +1,105 @@
+import re
+from functools import lru_cache, partial
+
+import pandas as pd
+
+from data_config import FINISHES
+from normalizer import DEFAULT_NORMALIZER
+
+# Columns produced by the parser, in order
+SKU_COMPONENTS = ['sku_key', 'base_key', 'left_part', 'finish', 'prefix', 'numeric', 'suffix', 'handedness', 'btb']
+
+_TOKEN_SEPARATORS = re.compile(r'[-\s]+')
+_FIRST_TOKEN = re.compile(r'^([^-\s]+)')
+_LAST_TOKEN = re.compile(r'([^-\s]+)$')
+_KEY_COMPONENTS = re.compile(r'^([A-Z]*)(\d+)(.*)$')
+_PH206R_HANDEDNESS = re.compile(r'PH206R([RL])(?![a-zA-Z])')
+_HANDEDNESS_TOKENS = {'LH': 'L', 'RH': 'R', 'LHR': 'L', 'RHR': 'R'}
+_FINISHES = frozenset(FINISHES)
+
+
+def split_key(key):
+    """
+    Splits a normalized key into its series prefix, numeric body and suffix,
+    e.g. 'MTK123PA' into ('MTK', '123', 'PA'). Keys without digits are all prefix.
+    """
+    match = _KEY_COMPONENTS.match(key)
+    if match is None:
+        return key, '', ''
+    return match.groups()
+
+def parse_sku(raw, finishes=_FINISHES):
+    """
+    Tokenizes an item or description once into its components:
+    - sku_key: the normalized key used for exact matching
+    - base_key: the normalized key without its trailing finish
+    - left_part and finish: the first and last '-' or space separated tokens,
+      e.g. 'PR205TL' and 'PN' for the Revival kit 'PR205TL-HL101-PN'
+    - prefix, numeric and suffix of the base key
+    - handedness ('L', 'R' or None) and whether the item is back to back (BTB)
+    """
+    first_token = _FIRST_TOKEN.search(raw)
+    last_token = _LAST_TOKEN.search(raw)
+    tokens = [token for token in _TOKEN_SEPARATORS.split(raw) if token]
+
+    left_part = first_token.group(1) if first_token else None
+    finish = last_token.group(1) if last_token and len(tokens) > 1 else None
+
+    # Only a known finish code is stripped to get the base item
+    base_raw = raw
+    if finish in finishes:
+        base_raw = raw[:last_token.start()].rstrip('- ')
+
+    base_key = DEFAULT_NORMALIZER.normalize(base_raw)
+    prefix, numeric, suffix = split_key(base_key)
+
+    handedness = None
+    ph206r = _PH206R_HANDEDNESS.search(raw)
+    if ph206r:
+        handedness = ph206r.group(1)
+    else:
+        handedness = next((_HANDEDNESS_TOKENS[token] for token in tokens if token in _HANDEDNESS_TOKENS), None)
+
+    return (
+        DEFAULT_NORMALIZER.normalize(raw), base_key, left_part, finish,
+        prefix, numeric, suffix, handedness, 'BTB' in raw,
+    )
+
+
+class SkuParser:
+    """
+    Memoized SKU parser. Every distinct item or description is parsed once per run
+    and the components are returned as columns, ready for equality joins.
+    'finishes' are the finish codes stripped from the base key.
+    """
+
+    def __init__(self, maxsize=1_000_000, finishes=FINISHES):
+        self.finishes = tuple(finishes)
+        self._parse = lru_cache(maxsize=maxsize)(partial(parse_sku, finishes=frozenset(finishes)))
+
+    def parse_series(self, series):
+        """
+        Parses a series into a DataFrame of components aligned with it. Only the unique
+        values are parsed; missing values parse as empty strings.
+        """
+        codes, uniques = pd.factorize(series.fillna(''), use_na_sentinel=False)
+        parsed = pd.DataFrame(
+            [self._parse(value if isinstance(value, str) else str(value)) for value in uniques],
+            columns=SKU_COMPONENTS,
+        )
+        components = parsed.iloc[codes].set_index(series.index)
+        components['btb'] = components['btb'].astype(bool)
+        return components
+
+    def cache_info(self):
+        return self._parse.cache_info()
+
+
+DEFAULT_PARSER = SkuParser()
+
+
+def parser_with_finishes(finishes=FINISHES):
+    """
+    The default parser for the default finishes, otherwise a parser of its own.
+    """
+    return DEFAULT_PARSER if tuple(finishes) == DEFAULT_PARSER.finishes else SkuParser(finishes=finishes)
@@ -0,0 +1,145 @@
+import pandas as pd
+import numpy as np
+
+
+class SubstringAutomaton:
+    """
+    Aho-Corasick automaton over a fixed set of keys.
+    Answers "is any key contained in this string" and "what is the highest
+    value among the keys contained in this string" in a single left-to-right
+    scan of the string, regardless of how many keys were compiled.
+    """
+
+    def __init__(self, keys):
+        """
+        Builds the automaton. 'keys' is either an iterable of strings or a
+        dict mapping each string to a price. Non-numeric prices are treated as NaN.
+        """
+        if isinstance(keys, dict):
+            patterns = list(keys.keys())
+            values = pd.to_numeric(pd.Series(list(keys.values()), dtype='object'), errors='coerce').to_numpy(dtype=float)
+        else:
+            patterns = list(keys)
+            values = np.full(len(patterns), np.nan)
+
+        # Trie transitions, failure links and per-node outputs
+        self._goto = [{}]
+        self._fail = [0]
+        self._any = [False]
+        self._max = [np.nan]
+        self._key = [None]
+
+        for pattern, value in zip(patterns, values):
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._any.append(False)
+                    self._max.append(np.nan)
+                    self._key.append(None)
+                node = next_node
+            self._any[node] = True
+            self._key[node] = pattern
+            self._max[node] = _nan_max(self._max[node], value)
+
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        """
+        Breadth-first pass that links every node to its longest proper suffix
+        in the trie and folds the suffix outputs into the node's own outputs.
+        """
+        queue = list(self._goto[0].values())
+        for child in queue:
+            self._any[child] = self._any[child] or self._any[0]
+            self._max[child] = _nan_max(self._max[child], self._max[0])
+
+        position = 0
+        while position < len(queue):
+            node = queue[position]
+            position += 1
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                suffix = self._goto[fallback].get(char, 0)
+                self._fail[child] = suffix if suffix != child else 0
+                self._any[child] = self._any[child] or self._any[self._fail[child]]
+                self._max[child] = _nan_max(self._max[child], self._max[self._fail[child]])
+                queue.append(child)
+
+    def _step(self, state, char):
+        goto, fail = self._goto, self._fail
+        while state and char not in goto[state]:
+            state = fail[state]
+        return goto[state].get(char, 0)
+
+    def contains_any(self, text):
+        """
+        Returns True if at least one compiled key is a substring of 'text'.
+        """
+        if self._any[0]:
+            return True
+        state = 0
+        for char in text:
+            state = self._step(state, char)
+            if self._any[state]:
+                return True
+        return False
+
+    def max_contained(self, text):
+        """
+        Returns the highest value among the compiled keys contained in 'text',
+        or NaN if none of them is present or all of their values are NaN.
+        """
+        best = self._max[0]
+        state = 0
+        for char in text:
+            state = self._step(state, char)
+            best = _nan_max(best, self._max[state])
+        return best
+
+    def contained(self, text):
+        """
+        Returns the compiled keys contained in 'text', in the order they are first found.
+        """
+        found = {} if self._key[0] is None else {self._key[0]: None}
+        state = 0
+        for char in text:
+            state = self._step(state, char)
+            # Every key ending here is the key of this node or of one of its suffixes
+            suffix = state
+            while suffix:
+                if self._key[suffix] is not None:
+                    found.setdefault(self._key[suffix], None)
+                suffix = self._fail[suffix]
+        return list(found)
+
+    def contains_any_series(self, series):
+        """
+        Batched version of contains_any. Each distinct value is scanned once.
+        """
+        return _map_unique(series, self.contains_any, False).astype(bool)
+
+    def max_contained_series(self, series):
+        """
+        Batched version of max_contained. Each distinct value is scanned once.
+        """
+        return _map_unique(series, self.max_contained, np.nan).astype(float)
+
+
+def _nan_max(a, b):
+    if np.isnan(a):
+        return b
+    if np.isnan(b):
+        return a
+    return a if a >= b else b
+
+def _map_unique(series, func, default):
+    uniques = pd.unique(series)
+    lookup = {value: func(value) if isinstance(value, str) else default for value in uniques}
+    return series.map(lookup)
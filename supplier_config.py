@@ -0,0 +1,41 @@
+from collections import namedtuple
+
+from data_config import SHEET_DICT, FINISHES, REVIVAL_SHEETS, METRO_SHEET_NAMES, MORTISE_TYPES, TUBULAR_TYPES
+
+# The tables of data_config that describe one supplier's price list workbook
+SupplierConfig = namedtuple('SupplierConfig', [
+    'sheet_dict', 'finishes', 'revival_sheets', 'metro_sheet_names', 'mortise_types', 'tubular_types',
+])
+DEFAULT_CONFIG = SupplierConfig(SHEET_DICT, FINISHES, REVIVAL_SHEETS, METRO_SHEET_NAMES, MORTISE_TYPES, TUBULAR_TYPES)
+
+# Keys of a supplier entry in a batch manifest, and the field each one sets
+CONFIG_KEYS = {
+    'sheets': 'sheet_dict',
+    'finishes': 'finishes',
+    'revival_sheets': 'revival_sheets',
+    'metro_sheets': 'metro_sheet_names',
+    'mortise_types': 'mortise_types',
+    'tubular_types': 'tubular_types',
+}
+SHEET_CATEGORIES = ('individual', 'kit')
+
+
+def config_from_dict(entry, default=DEFAULT_CONFIG):
+    """
+    A SupplierConfig from the keys of a manifest entry: 'sheets' maps sheet names to
+    'individual' or 'kit', 'finishes', 'revival_sheets' and 'metro_sheets' are lists,
+    'mortise_types' and 'tubular_types' map codes to names. Missing keys keep the
+    default tables, and other keys of the entry are ignored.
+    """
+    fields = {}
+    for key, field in CONFIG_KEYS.items():
+        if key not in entry:
+            continue
+        value = entry[key]
+        fields[field] = dict(value) if isinstance(getattr(default, field), dict) else tuple(value)
+
+    sheet_dict = fields.get('sheet_dict', default.sheet_dict)
+    unknown = {category for category in sheet_dict.values() if category not in SHEET_CATEGORIES}
+    if unknown:
+        raise ValueError(f"Sheet categories must be one of {SHEET_CATEGORIES}, got {sorted(unknown)}")
+    return default._replace(**fields)
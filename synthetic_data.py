@@ -0,0 +1,157 @@
+import os
+
+import pandas as pd
+import numpy as np
+
+from data_config import SHEET_DICT, FINISHES, REVIVAL_SHEETS, METRO_SHEET_NAMES
+from supplier_config import DEFAULT_CONFIG
+
+# Item prefixes used for the synthetic items of each individual sheet
+SHEET_PREFIXES = {
+    'Cabinet Knobs': 'CK', 'Cabinet Pulls': 'CP', 'Appliance Pulls': 'AP',
+    'Back to Back Appliance Pulls': 'APBTB', 'Revival Components': 'PH',
+    'Revival Components Special Fin': 'PRC', 'Vents & Registers': 'VR',
+    'Artisan Door Pulls': 'AD', 'Bath Suites': 'BS', 'Accessories': 'AC',
+}
+
+# Mechanism codes of the synthetic Metro items. They are made up for the synthetic data only;
+# the real codes are not configured yet (see data_config.py), so runs on synthetic data pass
+# SYNTHETIC_CONFIG to match the Metro sets
+SYNTHETIC_MORTISE_TYPES = {'PA': 'Mortise Passage', 'PV': 'Mortise Privacy', 'DM': 'Mortise Dummy'}
+SYNTHETIC_TUBULAR_TYPES = {'TP': 'Tubular Passage', 'TV': 'Tubular Privacy', 'TD': 'Tubular Dummy'}
+SYNTHETIC_CONFIG = DEFAULT_CONFIG._replace(
+    mortise_types=SYNTHETIC_MORTISE_TYPES, tubular_types=SYNTHETIC_TUBULAR_TYPES)
+METRO_MECHANISMS = tuple(SYNTHETIC_MORTISE_TYPES) + tuple(SYNTHETIC_TUBULAR_TYPES)
+
+# Columns of the Eclipse export, in the order of the real file
+PRODUCT_EXPORT_COLUMNS = [
+    'ID', 'Desc1', 'Desc2', 'Desc3', 'Desc4', 'DESC', 'Sta', 'Buy Line', 'Price Line', 'LIST PRICE', 'REP COST',
+]
+
+
+def _choice(rng, values, size):
+    values = np.asarray(values, dtype=object)
+    return values[rng.integers(0, len(values), size=size)]
+
+def generate_price_list(items_per_sheet=500, seed=0):
+    """
+    Creates a dictionary of DataFrames shaped like the supplier's workbook, one per sheet of SHEET_DICT.
+    Individual sheets list '<prefix><number>-<finish>' items, including BTB and PH206RR/PH206RL
+    edge cases; Revival sheets list 'PR205TL-PN' style kit bases; Metro sheets list
+    '<series><number><mechanism>-<finish>' sets.
+    """
+    rng = np.random.default_rng(seed)
+    finishes = np.array(FINISHES, dtype=object)
+    price_list = {}
+
+    for position, sheet_name in enumerate(SHEET_DICT):
+        numbers = rng.integers(100, 999, size=items_per_sheet).astype(str).astype(object)
+        sheet_finishes = _choice(rng, finishes, items_per_sheet)
+
+        if sheet_name in REVIVAL_SHEETS:
+            series = _choice(rng, ['PR', 'PRM', 'HL'], items_per_sheet)
+            lever = _choice(rng, ['TL', 'TR', 'KN', 'ML'], items_per_sheet)
+            items = series + numbers + lever + '-' + sheet_finishes
+        elif sheet_name in METRO_SHEET_NAMES:
+            series = _choice(rng, ['MTK', 'MTL', 'MTP'], items_per_sheet)
+            mechanism = _choice(rng, METRO_MECHANISMS, items_per_sheet)
+            items = series + numbers + mechanism + '-' + sheet_finishes
+        elif sheet_name == 'Revival Components':
+            handedness = _choice(rng, ['', '', 'R', 'L'], items_per_sheet)
+            items = 'PH206R' + handedness + numbers + '-' + sheet_finishes
+        else:
+            items = SHEET_PREFIXES.get(sheet_name, 'IT') + numbers + '-' + sheet_finishes
+
+        prices = np.round(rng.uniform(5, 500, size=items_per_sheet), 2)
+        sheet_df = pd.DataFrame({
+            'ITEM': items,
+            'DESCRIPTION': [f'{sheet_name} item'] * items_per_sheet,
+            'PRICE': prices,
+            'CASE QTY': rng.integers(1, 25, size=items_per_sheet),
+        })
+        price_list[sheet_name] = sheet_df.drop_duplicates(subset=['ITEM'], ignore_index=True)
+
+    return price_list
+
+def generate_products(price_list, n_products=10_000, match_rate=0.7, seed=0):
+    """
+    Creates an Eclipse products DataFrame (after cleaning) against a synthetic price list.
+    A 'match_rate' share of the products is derived from price list items: exact items,
+    items in a custom finish, Revival kits like 'PR205TL-HL101-PN' and Metro sets.
+    The rest have descriptions that match nothing.
+    """
+    rng = np.random.default_rng(seed)
+    all_items = pd.concat(
+        [sheet_df.assign(SHEET=sheet_name) for sheet_name, sheet_df in price_list.items()], ignore_index=True
+    )
+    is_revival = all_items['SHEET'].isin(REVIVAL_SHEETS).to_numpy()
+
+    n_matching = int(n_products * match_rate)
+    picked = all_items.iloc[rng.integers(0, len(all_items), size=n_matching)]
+    descriptions = picked['ITEM'].to_numpy(dtype=object).copy()
+    base = picked['ITEM'].str.rsplit('-', n=1).str[0].to_numpy(dtype=object)
+    picked_revival = is_revival[picked.index.to_numpy()]
+    picked_metro = all_items['SHEET'].isin(METRO_SHEET_NAMES).to_numpy()[picked.index.to_numpy()]
+
+    # Revival items become kits, some Metro items become sets in another finish,
+    # and some of the others get a custom finish
+    kind = rng.random(n_matching)
+    kit_trim = _choice(rng, ['HL101', 'HL102', 'ML201'], n_matching)
+    descriptions[picked_revival] = (
+        base[picked_revival] + '-' + kit_trim[picked_revival] + '-'
+        + picked['ITEM'].str.rsplit('-', n=1).str[1].to_numpy(dtype=object)[picked_revival]
+    )
+    metro_set = picked_metro & (kind < 0.2)
+    descriptions[metro_set] = base[metro_set] + '-' + _choice(rng, FINISHES, n_matching)[metro_set]
+    custom = ~picked_revival & ~picked_metro & (kind < 0.2)
+    descriptions[custom] = base[custom] + '-' + _choice(rng, ['CUSTOM', 'XX', 'VB'], n_matching)[custom]
+
+    n_other = n_products - n_matching
+    others = 'ZZ' + rng.integers(10_000, 99_999, size=n_other).astype(str).astype(object)
+    descriptions = np.concatenate([descriptions, others])
+    rng.shuffle(descriptions)
+
+    return pd.DataFrame({
+        'ID': np.arange(1, n_products + 1),
+        'Desc1': descriptions,
+        'Desc2': _choice(rng, ['Satin', 'Polished', 'Knob 1^ dia', ''], n_products),
+        'Desc3': '', 'Desc4': '', 'Desc5': '',
+        'Status': rng.integers(0, 3, size=n_products),
+        'Buy Line': _choice(rng, ['HAMSIN', 'HAMMTR'], n_products),
+        'Price Line': _choice(rng, ['HS', 'HSK', 'HSM'], n_products),
+        'LIST PRICE': np.round(rng.uniform(5, 500, size=n_products), 2),
+        'REP COST': np.round(rng.uniform(2, 250, size=n_products), 2),
+    })
+
+def write_products_export(products, path):
+    """
+    Writes products in the layout of 'All products information.csv': eight report lines,
+    the header, and two rows that clean_eclipse_products drops.
+    """
+    export = products.rename(columns={'Desc5': 'DESC', 'Status': 'Sta'})[PRODUCT_EXPORT_COLUMNS]
+    with open(path, 'w', newline='') as file:
+        for line in range(8):
+            file.write(f'Synthetic Eclipse report line {line + 1}\n')
+        file.write(','.join(PRODUCT_EXPORT_COLUMNS) + '\n')
+        file.write(','.join(['-----'] * len(PRODUCT_EXPORT_COLUMNS)) + '\n')
+        file.write(','.join([''] * len(PRODUCT_EXPORT_COLUMNS)) + '\n')
+        export.to_csv(file, index=False, header=False)
+
+def write_price_list_workbook(price_list, path):
+    with pd.ExcelWriter(path) as writer:
+        for sheet_name, sheet_df in price_list.items():
+            sheet_df.to_excel(writer, sheet_name=sheet_name[:31], index=False)
+
+def generate_dataset(directory, n_products=10_000, match_rate=0.7, items_per_sheet=None, seed=0,
+                     workbook_name='Price List 2024-01-24.xlsx'):
+    """
+    Writes a products export and a price list workbook into 'directory', ready for main().
+    By default the price list grows with the products, about one item per 20 products.
+    """
+    os.makedirs(directory, exist_ok=True)
+    items_per_sheet = items_per_sheet or max(50, n_products // (20 * len(SHEET_DICT)))
+    price_list = generate_price_list(items_per_sheet, seed)
+    products = generate_products(price_list, n_products, match_rate, seed)
+    write_products_export(products, os.path.join(directory, "All products information.csv"))
+    write_price_list_workbook(price_list, os.path.join(directory, workbook_name))
+    return products, price_list
@@ -0,0 +1,25 @@
+import pandas as pd
+import pytest
+
+from backends import BACKENDS, check_parity, get_backend
+from synthetic_data import generate_price_list, generate_products
+
+pytest.importorskip('pyarrow')
+
+
+def test_backends_write_the_same_files(tmp_path):
+    price_list = generate_price_list(items_per_sheet=50, seed=1)
+    products = generate_products(price_list, n_products=2_000, seed=1)
+
+    check_parity(products, price_list, directory=tmp_path)
+
+    for target in ('final_update', 'uncreated_items'):
+        files = [(tmp_path / backend / f'{target}.csv').read_bytes() for backend in BACKENDS]
+        assert files[0] == files[1]
+        assert files[0].count(b'\n') > 1
+
+def test_keys_with_newlines_split_like_pandas():
+    keys = pd.Series(['BRN\n', 'SB\n', 'ABC-DB\n', 'ABC DB', 'ABC\xa0DB', 'ABCDB\x0b', None], dtype=object)
+    expected = get_backend('pandas').split_finishes(keys)
+    result = get_backend('arrow').split_finishes(keys)
+    pd.testing.assert_frame_equal(result, expected)
@@ -0,0 +1,48 @@
+import os
+import json
+
+import pytest
+
+pytest.importorskip('openpyxl')
+
+from main import batch_suppliers
+from synthetic_data import (
+    SYNTHETIC_MORTISE_TYPES, SYNTHETIC_TUBULAR_TYPES, generate_price_list, write_price_list_workbook, generate_dataset,
+)
+
+
+@pytest.fixture
+def manifest_path(tmp_path):
+    # Both suppliers list the synthetic Metro codes; the second prices its own workbook
+    generate_dataset(str(tmp_path / 'first'), n_products=500, items_per_sheet=20, seed=5)
+    os.makedirs(tmp_path / 'second')
+    write_price_list_workbook(generate_price_list(items_per_sheet=20, seed=6),
+                              str(tmp_path / 'second' / 'Price List 2024-02-01.xlsx'))
+    metro = {'mortise_types': SYNTHETIC_MORTISE_TYPES, 'tubular_types': SYNTHETIC_TUBULAR_TYPES}
+    path = tmp_path / 'suppliers.json'
+    path.write_text(json.dumps({
+        'products': 'first/All products information.csv',
+        'suppliers': [{'name': 'First', 'directory': 'first', **metro},
+                      {'name': 'Second', 'directory': 'second', **metro}],
+    }))
+    return str(path)
+
+def _summaries(manifest_path):
+    folder = os.path.dirname(manifest_path)
+    return [name for name in os.listdir(folder) if name.startswith('Batch Summary_')]
+
+def test_batch_keeps_a_resolution_cache_per_supplier(manifest_path):
+    batch_suppliers(manifest_path)
+
+    folder = os.path.dirname(manifest_path)
+    for supplier in ('first', 'second'):
+        assert os.path.exists(os.path.join(folder, supplier, '.match_resolutions.sqlite'))
+    assert len(_summaries(manifest_path)) == 1
+
+def test_summary_is_saved_when_the_database_write_fails(manifest_path, tmp_path):
+    sqlalchemy = pytest.importorskip('sqlalchemy')
+    # The database has no products table, so the write fails
+    database_url = f"sqlite:///{tmp_path / 'empty.db'}"
+    with pytest.raises(sqlalchemy.exc.NoSuchTableError):
+        batch_suppliers(manifest_path, database_url=database_url)
+    assert len(_summaries(manifest_path)) == 1
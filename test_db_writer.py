@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import StaticPool
+
+import db_writer
+from db_writer import write_price_updates
+
+
+@pytest.fixture
+def engine():
+    # One connection shared by the whole test, so the in-memory database outlives each transaction
+    engine = create_engine('sqlite://', poolclass=StaticPool)
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE products (ID INTEGER PRIMARY KEY, Desc1 TEXT, "LIST PRICE" REAL)'))
+        connection.execute(text(
+            "INSERT INTO products VALUES (1, 'CK100-SN', 10.0), (2, 'CP200-PN', 20.0), (3, 'AP300-BN', 30.0)"
+        ))
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def final_update():
+    # 1 is unchanged, 2 and 3 have a new price, 4 is new; 'Updated LIST PRICE' is not a table column
+    return pd.DataFrame({
+        'ID': [1, 2, 3, 4],
+        'Desc1': ['CK100-SN', 'CP200-PN', 'AP300-BN', 'VR400-AB'],
+        'LIST PRICE': [10.0, 25.0, 35.0, 40.0],
+        'Updated LIST PRICE': [10.0, 25.0, 35.0, 40.0],
+    })
+
+def _prices(engine):
+    with engine.connect() as connection:
+        return dict(connection.execute(text('SELECT ID, "LIST PRICE" FROM products ORDER BY ID')).fetchall())
+
+def test_upsert_classifies_and_writes_rows(engine, final_update):
+    metrics = write_price_updates(final_update, engine=engine, batch_size=2)
+
+    assert (metrics['new'], metrics['changed'], metrics['unchanged'], metrics['written']) == (1, 2, 1, 3)
+    assert metrics['batches'] == 2
+    assert _prices(engine) == {1: 10.0, 2: 25.0, 3: 35.0, 4: 40.0}
+
+    # Writing the same update again changes nothing
+    metrics = write_price_updates(final_update, engine=engine)
+    assert (metrics['new'], metrics['changed'], metrics['unchanged'], metrics['written']) == (0, 0, 4, 0)
+    assert metrics['rows_per_second'] == 0.0
+
+def test_dry_run_writes_nothing(engine, final_update):
+    metrics = write_price_updates(final_update, engine=engine, dry_run=True)
+
+    assert metrics['dry_run']
+    assert (metrics['new'], metrics['changed'], metrics['unchanged'], metrics['written']) == (1, 2, 1, 0)
+    assert _prices(engine) == {1: 10.0, 2: 20.0, 3: 30.0}
+
+def test_batch_is_retried_after_a_transient_error(engine, final_update, monkeypatch):
+    write_batch, calls = db_writer._write_batch, []
+
+    def locked_once(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise OperationalError('UPDATE products', {}, Exception('database is locked'))
+        return write_batch(*args)
+
+    monkeypatch.setattr(db_writer, '_write_batch', locked_once)
+    metrics = write_price_updates(final_update, engine=engine, retry_delay=0)
+
+    assert metrics['retries'] == 1
+    assert metrics['failed_batches'] == 0
+    assert metrics['written'] == 3
+    assert _prices(engine) == {1: 10.0, 2: 25.0, 3: 35.0, 4: 40.0}
+
+def test_batch_fails_after_the_last_retry(engine, final_update, monkeypatch):
+    def always_locked(*args):
+        raise OperationalError('UPDATE products', {}, Exception('database is locked'))
+
+    monkeypatch.setattr(db_writer, '_write_batch', always_locked)
+    metrics = write_price_updates(final_update, engine=engine, max_retries=2, retry_delay=0)
+
+    assert (metrics['retries'], metrics['failed_batches'], metrics['failed_rows']) == (2, 1, 4)
+    assert metrics['written'] == 0
+    # The failed transactions were rolled back
+    assert _prices(engine) == {1: 10.0, 2: 20.0, 3: 30.0}
@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+
+import delta_pricing
+from delta_pricing import diff_price_lists, find_affected_products, reprice_changes
+
+
+@pytest.fixture
+def old_price_list():
+    return {
+        'Cabinet Knobs': pd.DataFrame({'ITEM': ['CK100-SN', 'CK101-PN', 'CK102-BN'], 'PRICE': [10.0, 11.0, 12.0]}),
+        'Cabinet Pulls': pd.DataFrame({'ITEM': ['CP200-PN', 'CP201-SN'], 'PRICE': [20.0, 21.0]}),
+    }
+
+@pytest.fixture
+def new_price_list():
+    # CK100-SN costs more, CK102-BN is gone and CP202-AB is new; the rest is unchanged
+    return {
+        'Cabinet Knobs': pd.DataFrame({'ITEM': ['CK100-SN', 'CK101-PN'], 'PRICE': [15.0, 11.0]}),
+        'Cabinet Pulls': pd.DataFrame({'ITEM': ['CP200-PN', 'CP201-SN', 'CP202-AB'], 'PRICE': [20.0, 21.0, 22.0]}),
+    }
+
+@pytest.fixture
+def products():
+    return pd.DataFrame({
+        'ID': [1, 2, 3, 4, 5, 6],
+        'Desc1': ['CK100-SN', 'CK100-VB', 'CK101-PN', 'CK102-BN', 'CP200-PN', 'CP201-SN'],
+        'LIST PRICE': [10.0, 12.5, 11.0, 12.0, 20.0, 21.0],
+    })
+
+def test_diff_finds_changed_added_and_removed_items(old_price_list, new_price_list):
+    changes = diff_price_lists(old_price_list, new_price_list).set_index('ITEM')
+
+    assert changes['CHANGE'].to_dict() == {'CK100-SN': 'changed', 'CK102-BN': 'removed', 'CP202-AB': 'added'}
+    assert tuple(changes.loc['CK100-SN', ['PRICE OLD', 'PRICE NEW']]) == (10.0, 15.0)
+    assert changes.loc['CK102-BN', 'SHEET'] == 'Cabinet Knobs'
+    assert changes.loc['CP202-AB', 'SHEET'] == 'Cabinet Pulls'
+
+def test_only_products_of_changed_items_are_affected(old_price_list, new_price_list, products):
+    changes = diff_price_lists(old_price_list, new_price_list)
+    affected = find_affected_products(products, changes)
+
+    # The changed item in its own and in a custom finish, and the removed item
+    assert list(products.loc[affected.to_numpy(), 'ID']) == [1, 2, 4]
+
+def test_reprice_changes_prices_only_the_affected_products(old_price_list, new_price_list, products, monkeypatch):
+    priced = []
+    price_products = delta_pricing.price_products
+    def recording(products, *args):
+        priced.append(list(products['ID']))
+        return price_products(products, *args)
+    monkeypatch.setattr(delta_pricing, 'price_products', recording)
+
+    update, uncreated_items = reprice_changes(products, old_price_list, new_price_list)
+
+    assert priced == [[1, 2, 4]]
+
+    # Product 4 is affected, but its item is gone, so it has no new price
+    assert update.set_index('ID')['LIST PRICE'].to_dict() == {1: 15.0, 2: 18.0}
+    assert list(uncreated_items['ITEM']) == ['CP202-AB']
+
+def test_identical_price_lists_reprice_nothing(old_price_list, products):
+    update, uncreated_items = reprice_changes(products, old_price_list, old_price_list)
+    assert update.empty and uncreated_items.empty
@@ -0,0 +1,39 @@
+import os
+import gzip
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from export_writer import export_frame
+
+
+@pytest.fixture
+def update():
+    return pd.DataFrame({
+        'ID': np.arange(1, 251),
+        'Desc1': ['CK100-SN', 'Knob 1" dia, satin', 'PR205TL-HL101-PN', ''] * 62 + ['AP300-BN', None],
+        'LIST PRICE': [10.0, 12.5, 30.0, 7.25] * 62 + [40.0, np.nan],
+    }, index=np.arange(1000, 1250))
+
+@pytest.mark.parametrize('index', [True, False])
+def test_csv_is_written_like_to_csv(tmp_path, update, index):
+    [path] = export_frame(update, 'update', tmp_path, index=index, chunk_rows=64)
+    assert open(path, 'rb').read() == update.to_csv(index=index).encode()
+
+def test_projected_csv_is_written_like_to_csv(tmp_path, update):
+    [path] = export_frame(update, 'update', tmp_path, columns=['ID', 'LIST PRICE'], index=False, chunk_rows=64)
+    assert open(path, 'rb').read() == update[['ID', 'LIST PRICE']].to_csv(index=False).encode()
+
+def test_gzip_batches_and_manifest(tmp_path, update):
+    paths = export_frame(update, 'update', tmp_path, file_format='gzip', batch_rows=100, index=False, chunk_rows=64)
+
+    *parts, manifest_path = paths
+    assert [os.path.basename(part) for part in parts] == ['part-0001.csv.gz', 'part-0002.csv.gz', 'part-0003.csv.gz']
+    manifest = json.load(open(manifest_path))
+    assert [entry['rows'] for entry in manifest['files']] == [100, 100, 50]
+    assert (manifest['files'][0]['first_id'], manifest['files'][-1]['last_id']) == (1, 250)
+    for part, start in zip(parts, range(0, 250, 100)):
+        expected = update.iloc[start:start + 100].to_csv(index=False).encode()
+        assert gzip.decompress(open(part, 'rb').read()) == expected
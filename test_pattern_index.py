@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+
+from pattern_index import PatternIndex
+from sku_parser import DEFAULT_PARSER
+
+
+@pytest.fixture
+def kit_df():
+    return pd.DataFrame({
+        'prefix': ['MTK', 'MTK', 'MTL'],
+        'numeric': ['123', '123', '456'],
+        'suffix': ['PA', 'PAL', 'TP'],
+        'key': ['MTK123PA', 'MTK123PAL', 'MTL456TP'],
+        'Updated List Price': [100.0, 120.0, 80.0],
+    })
+
+def _match(descriptions, kit_df):
+    components = DEFAULT_PARSER.parse_series(pd.Series(descriptions))
+    product_positions, kit_positions = PatternIndex(components).match(kit_df)
+    return dict(zip(product_positions.tolist(), kit_df['key'].to_numpy()[kit_positions].tolist()))
+
+@pytest.mark.parametrize('description, key', [
+    # A bare kit suffix, and the same set with its finish after a separator
+    ('MTK123PA', 'MTK123PA'),
+    ('MTK123PA-SN', 'MTK123PA'),
+    # The kit suffix followed by a finish code in the same token
+    ('MTK123PASB', 'MTK123PA'),
+    ('MTL456TPORB', 'MTL456TP'),
+    # A longer kit suffix is preferred to a shorter one followed by a finish
+    ('MTK123PAL', 'MTK123PAL'),
+    ('MTK123PALBN', 'MTK123PAL'),
+])
+def test_suffix_is_accepted(kit_df, description, key):
+    assert _match([description], kit_df) == {0: key}
+
+@pytest.mark.parametrize('description', [
+    # Extra parts that are not a finish make another item
+    'MTK123PAX', 'MTK123PAXX', 'MTK123PAZZ', 'MTL456TPLH',
+    # A different body or prefix
+    'MTK124PA', 'MTX123PA', 'MTK123',
+])
+def test_suffix_with_something_else_is_rejected(kit_df, description):
+    assert _match([description], kit_df) == {}
+
+def test_finishes_come_from_the_index(kit_df):
+    components = DEFAULT_PARSER.parse_series(pd.Series(['MTK123PAXX', 'MTK123PASN']))
+    product_positions, _ = PatternIndex(components, finishes=('XX',)).match(kit_df)
+    assert product_positions.tolist() == [0]
@@ -0,0 +1,63 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from price_index import PriceIndex, DUPLICATE_RULES
+
+
+@pytest.fixture
+def price_list():
+    # 'CK100-SN' is listed three times: twice on the first sheet, once on the second
+    return {
+        'Cabinet Knobs': pd.DataFrame({
+            'ITEM': ['CK100-SN', 'CK101-PN', 'CK100SN', 'CK102-BN'],
+            'PRICE': [12.0, 8.0, 15.0, np.nan],
+        }),
+        'Cabinet Pulls': pd.DataFrame({
+            'ITEM': ['CK100-SN', 'CP200-PN', None],
+            'PRICE': [9.0, 20.0, 30.0],
+        }),
+    }
+
+@pytest.mark.parametrize('rule, price, sheet, item', [
+    ('first', 12.0, 'Cabinet Knobs', 'CK100-SN'),
+    ('last', 9.0, 'Cabinet Pulls', 'CK100-SN'),
+    ('max', 15.0, 'Cabinet Knobs', 'CK100SN'),
+    ('min', 9.0, 'Cabinet Pulls', 'CK100-SN'),
+])
+def test_duplicate_rules(price_list, rule, price, sheet, item):
+    index = PriceIndex(price_list, duplicate_rule=rule)
+
+    found = index.lookup(pd.Series(['CK100SN']))
+    assert found.loc[0, 'PRICE'] == price
+    assert found.loc[0, 'SHEET'] == sheet
+    assert found.loc[0, 'ITEM'] == item
+    # Every distinct key once; the row without an item is left out
+    assert len(index) == 4
+
+def test_max_and_min_fall_back_to_workbook_order_on_ties():
+    price_list = {
+        'Cabinet Knobs': pd.DataFrame({'ITEM': ['CK100-SN'], 'PRICE': [10.0]}),
+        'Cabinet Pulls': pd.DataFrame({'ITEM': ['CK100-SN'], 'PRICE': [10.0]}),
+    }
+    for rule in ('max', 'min'):
+        assert PriceIndex(price_list, duplicate_rule=rule).lookup(pd.Series(['CK100SN'])).loc[0, 'SHEET'] == 'Cabinet Knobs'
+
+def test_missing_keys_read_the_sentinel(price_list):
+    index = PriceIndex(price_list)
+    keys = pd.Series(['CP200PN', 'ZZ999', 'CK102BN'], index=[7, 8, 9])
+
+    assert list(index.positions(keys) >= 0) == [True, False, True]
+    assert list(index.contains(keys)) == [True, False, True]
+    found = index.lookup(keys)
+    assert list(found.index) == [7, 8, 9]
+    assert found.loc[7, 'PRICE'] == 20.0
+    # A missing key reads NaN, no sheet and no item; a listed item without a price reads NaN as well
+    assert np.isnan(found.loc[8, 'PRICE']) and pd.isna(found.loc[8, 'SHEET']) and found.loc[8, 'ITEM'] is None
+    assert np.isnan(found.loc[9, 'PRICE']) and found.loc[9, 'SHEET'] == 'Cabinet Knobs'
+
+def test_unknown_rule_is_rejected(price_list):
+    with pytest.raises(ValueError, match=re.escape(str(DUPLICATE_RULES))):
+        PriceIndex(price_list, duplicate_rule='mean')
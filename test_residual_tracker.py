@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+from residual_tracker import ResidualTracker, SOURCE_COLUMN
+
+
+@pytest.fixture
+def products():
+    return pd.DataFrame({
+        'ID': [10, 20, 30, 40],
+        'Desc1': ['CK100-SN', 'CP200-PN', 'PR205TL-HL101-PN', 'ZZ12345'],
+        'LIST PRICE': [1.0, 2.0, 3.0, 4.0],
+    })
+
+def _matches(products, ids, prices, sources=None):
+    matches = products[products['ID'].isin(ids)].copy()
+    matches['LIST PRICE'] = prices
+    if sources is not None:
+        matches[SOURCE_COLUMN] = sources
+    return matches
+
+def test_claim_raises_on_a_product_claimed_earlier(products):
+    tracker = ResidualTracker(products)
+    tracker.claim('exact_match', _matches(products, [10, 20], [11.0, 12.0]))
+
+    with pytest.raises(ValueError, match="already claimed by \\['exact_match'\\]"):
+        tracker.claim('custom_finishes', _matches(products, [20, 30], [22.0, 13.0]))
+    # The failed claim changed nothing
+    assert tracker.claim_counts() == {'exact_match': 2}
+    assert list(tracker.residual()['ID']) == [30, 40]
+
+def test_claim_keeps_the_earlier_price_on_conflict(products):
+    tracker = ResidualTracker(products)
+    tracker.claim('exact_match', _matches(products, [10, 20], [11.0, 12.0]))
+    claimed = tracker.claim('custom_finishes', _matches(products, [20, 30], [22.0, 13.0]), on_conflict='keep')
+
+    assert claimed == 1
+    assert tracker.conflicts() == {'custom_finishes': 1}
+    assert tracker.claim_counts() == {'exact_match': 2, 'custom_finishes': 1}
+    update = tracker.materialize()
+    assert update.set_index('ID')['LIST PRICE'].to_dict() == {10: 11.0, 20: 12.0, 30: 13.0}
+
+def test_claim_rejects_unknown_rules_and_repeated_stages(products):
+    tracker = ResidualTracker(products)
+    with pytest.raises(ValueError, match='on_conflict'):
+        tracker.claim('exact_match', _matches(products, [10], [11.0]), on_conflict='replace')
+    tracker.claim('exact_match', _matches(products, [10], [11.0]))
+    with pytest.raises(ValueError, match='already claimed its products'):
+        tracker.claim('exact_match', _matches(products, [20], [12.0]))
+
+def test_materialize_with_provenance(products):
+    tracker = ResidualTracker(products)
+    tracker.claim('revival_kits', _matches(products, [30], [33.0]), sources=['PR205TL-PN'])
+    tracker.claim('exact_match', _matches(products, [10, 20], [11.0, 22.0]))
+
+    update = tracker.materialize(with_provenance=True)
+
+    # Claim order, not product order
+    assert list(update['ID']) == [30, 10, 20]
+    assert list(update['LIST PRICE']) == [33.0, 11.0, 22.0]
+    assert list(update['STAGE']) == ['revival_kits', 'exact_match', 'exact_match']
+    assert list(update[SOURCE_COLUMN]) == ['PR205TL-PN', None, None]
+    assert 'STAGE' not in tracker.materialize().columns
+
+def test_residual_of_some_rows(products):
+    tracker = ResidualTracker(products)
+    tracker.claim('exact_match', _matches(products, [10, 30], [11.0, 13.0]))
+
+    assert list(tracker.residual()['ID']) == [20, 40]
+    assert list(tracker.residual(products.iloc[2:])['ID']) == [40]
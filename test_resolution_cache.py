@@ -0,0 +1,57 @@
+import pandas as pd
+
+from match_context import MatchContext
+from pipeline import run_pipeline
+from resolution_cache import ResolutionCache, ResolutionTables, rule_version
+from supplier_config import DEFAULT_CONFIG
+from synthetic_data import SYNTHETIC_CONFIG, generate_price_list, generate_products
+
+
+def _run(products, price_list, cache_path, config=SYNTHETIC_CONFIG):
+    context = MatchContext(products, price_list, config=config)
+    return run_pipeline(products, price_list, targets=('final_update', 'price_provenance', 'stored_resolutions'),
+                        checkpoint_dir=None, resolution_cache=cache_path, context=context)
+
+def test_second_run_reprices_from_the_cache(tmp_path):
+    price_list = generate_price_list(items_per_sheet=50, seed=3)
+    products = generate_products(price_list, n_products=3_000, seed=3)
+    cache_path = str(tmp_path / 'resolutions.sqlite')
+
+    first = _run(products, price_list, cache_path)
+    second = _run(products, price_list, cache_path)
+
+    stored = first['stored_resolutions'].set_index('STAGE')['STORED']
+    assert stored['revival_kits'] > 0 and stored['metro_mortise'] > 0
+    assert (second['price_provenance']['STAGE'] == 'cached_resolutions').sum() == stored.sum()
+    pd.testing.assert_frame_equal(
+        second['final_update'].sort_values('ID', ignore_index=True),
+        first['final_update'].sort_values('ID', ignore_index=True),
+    )
+
+def test_cache_opened_with_other_tables_starts_empty(tmp_path):
+    assert rule_version(SYNTHETIC_CONFIG) != rule_version(DEFAULT_CONFIG)
+    assert rule_version(DEFAULT_CONFIG) == rule_version(DEFAULT_CONFIG._replace(finishes=list(DEFAULT_CONFIG.finishes)))
+
+    price_list = generate_price_list(items_per_sheet=50, seed=3)
+    products = generate_products(price_list, n_products=1_000, seed=3)
+    cache_path = str(tmp_path / 'resolutions.sqlite')
+    _run(products, price_list, cache_path)
+
+    cache = ResolutionCache(cache_path, SYNTHETIC_CONFIG)
+    assert len(cache) > 0
+    cache.close()
+    cache = ResolutionCache(cache_path, DEFAULT_CONFIG)
+    assert len(cache) == 0
+    cache.close()
+
+def test_tables_read_the_sheets_of_the_config():
+    price_list = generate_price_list(items_per_sheet=20, seed=4)
+    renamed = {('Supplier Knobs' if name == 'Cabinet Knobs' else name): sheet for name, sheet in price_list.items()}
+    sheet_dict = {('Supplier Knobs' if name == 'Cabinet Knobs' else name): category
+                  for name, category in DEFAULT_CONFIG.sheet_dict.items()}
+
+    default_tables = ResolutionTables(renamed)
+    supplier_tables = ResolutionTables(renamed, config=DEFAULT_CONFIG._replace(sheet_dict=sheet_dict))
+
+    assert 'Supplier Knobs' not in set(default_tables.finish_index.entries['SHEET'])
+    assert 'Supplier Knobs' in set(supplier_tables.finish_index.entries['SHEET'])
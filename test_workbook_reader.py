@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip('openpyxl')
+
+from pipeline import fingerprint
+from workbook_reader import StreamingPriceList, close_workbook
+
+
+@pytest.fixture
+def workbook_path(tmp_path):
+    path = tmp_path / 'Price List 2024-01-24.xlsx'
+    # LIST holds whole numbers past the sample rows before its first decimal
+    knobs = pd.DataFrame({
+        'ITEM': [f'CK{number}-SN' for number in range(100, 180)],
+        'LIST': [float(number) for number in range(60)] + [12.5] * 20,
+        'DESCRIPTION': ['Cabinet knob'] * 80,
+    })
+    pulls = pd.DataFrame({'ITEM': ['CP200-PN', 'CP201-PN'], 'PRICE': [20.25, 21.5], 'CASE QTY': [10, 12]})
+    with pd.ExcelWriter(path) as writer:
+        knobs.to_excel(writer, sheet_name='Cabinet Knobs', index=False)
+        pulls.to_excel(writer, sheet_name='Cabinet Pulls', index=False)
+    return str(path)
+
+def test_price_is_picked_from_the_whole_column(workbook_path):
+    with StreamingPriceList(workbook_path, sample_rows=10) as price_list:
+        knobs = price_list['Cabinet Knobs']
+    assert list(knobs.columns) == ['ITEM', 'PRICE', 'DESCRIPTION']
+    assert knobs['PRICE'].iloc[-1] == 12.5
+
+def test_fingerprint_parses_no_sheet(workbook_path):
+    price_list = StreamingPriceList(workbook_path)
+    first = fingerprint(price_list)
+
+    assert price_list.loaded() == []
+    assert fingerprint(StreamingPriceList(workbook_path)) == first
+    close_workbook(price_list)
+
+def test_workbook_is_closed_and_opened_again_on_access(workbook_path):
+    price_list = StreamingPriceList(workbook_path)
+    price_list['Cabinet Knobs']
+    assert price_list._workbook is not None
+
+    close_workbook(price_list)
+    assert price_list._workbook is None
+    # The last sheet opens the file again, and closes it once every sheet is parsed
+    assert list(price_list['Cabinet Pulls']['PRICE']) == [20.25, 21.5]
+    assert price_list._workbook is None
+    close_workbook({'Cabinet Knobs': pd.DataFrame()})
@@ -0,0 +1,205 @@
+import os
+import time
+
+import pandas as pd
+
+from data_loading import load_clean_eclipse_products, find_latest_price_list
+from price_list_cache import load_clean_workbook
+from workbook_reader import close_workbook
+from match_context import MatchContext
+from delta_pricing import reprice_changes, drop_unchanged_prices
+from pipeline import price_products, collect_new_items
+
+PRODUCTS_FILE = "All products information.csv"
+# Seconds between two looks at the directory
+POLL_INTERVAL = 2.0
+
+
+def file_signature(path):
+    """
+    Modification time and size of a file, or None if it does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+def changed_products(old_products, new_products):
+    """
+    The rows of the new export that are new or differ from the old export, compared by ID.
+    """
+    def row_hashes(products):
+        return pd.Series(
+            pd.util.hash_pandas_object(products.astype(str), index=False).to_numpy(), index=products['ID'].to_numpy()
+        )
+    old_hashes = row_hashes(old_products)
+    old_hashes = old_hashes[~old_hashes.index.duplicated()]
+    new_hashes = row_hashes(new_products)
+    unchanged = old_hashes.reindex(new_hashes.index).to_numpy() == new_hashes.to_numpy()
+    return new_products[~unchanged]
+
+
+class WarmState:
+    """
+    The products export and the latest price list of a directory, kept in memory between
+    updates with the keys derived from them. Each poll looks for a newer dated workbook or a
+    changed export; a file is only read once its size and time stop changing between two polls,
+    so a file still being copied is left alone. A new workbook re-prices the products its
+    changes affect, and a new export re-prices the products that changed in it.
+    A file that fails to load or to price is reported and skipped until it changes again;
+    the state keeps the last files that were processed.
+    """
+
+    def __init__(self, directory=None, sheet_workers=1):
+        self.directory = directory or os.getcwd()
+        self.sheet_workers = sheet_workers
+        self.products = None
+        self.price_list = None
+        self.context = None
+        self._loaded = {}
+        self._pending = {}
+        self._failed = {}
+
+    def _ready(self, name, path):
+        """
+        True when the file changed since it was loaded and has stayed the same since the last poll.
+        """
+        signature = (path, file_signature(path)) if path else None
+        if signature is None or signature[1] is None or signature in (self._loaded.get(name), self._failed.get(name)):
+            self._pending.pop(name, None)
+            return False
+        if self._pending.get(name) != signature:
+            self._pending[name] = signature
+            return False
+        return True
+
+    def _mark_loaded(self, name, path):
+        self._loaded[name] = self._pending.pop(name, (path, file_signature(path)))
+        self._failed.pop(name, None)
+
+    def _process(self, name, path, process):
+        """
+        Runs process(path), or reports the error and marks this version of the file as failed.
+        """
+        try:
+            return process(path)
+        except Exception as error:
+            print(f"Could not process {os.path.basename(path)}: {error!r}")
+            self._failed[name] = self._pending.pop(name, (path, file_signature(path)))
+            return None
+
+    def load(self):
+        """
+        Loads both files and derives the product keys, without pricing anything.
+        """
+        products_path = os.path.join(self.directory, PRODUCTS_FILE)
+        workbook_path = find_latest_price_list(self.directory)
+        products = load_clean_eclipse_products(products_path)
+        price_list = self._process('price_list', workbook_path, load_clean_workbook) if workbook_path else None
+        context = self._warm(MatchContext(products, price_list or {}, self.sheet_workers))
+        self.products, self.price_list, self.context = products, price_list, context
+        self._mark_loaded('products', products_path)
+        close_workbook(price_list)
+        if price_list is not None:
+            self._mark_loaded('price_list', workbook_path)
+        print(f"Watching {self.directory} with {len(self.products)} products in memory")
+
+    def _warm(self, context):
+        # The product keys are derived now, so the next update starts from them
+        for name in ('keys', 'base_keys', 'components'):
+            getattr(context, name)
+        return context
+
+    def poll(self):
+        """
+        Looks at the directory once. Returns the rows to update and the items to create
+        when a new file was processed, otherwise None.
+        """
+        products_path = os.path.join(self.directory, PRODUCTS_FILE)
+        if self.products is None:
+            # Without the products nothing can be priced; a failed export is tried again once it changes
+            if self._failed.get('products') != (products_path, file_signature(products_path)):
+                self._process('products', products_path, lambda _: self.load())
+            return None
+
+        workbook_path = find_latest_price_list(self.directory)
+        if workbook_path and self._ready('price_list', workbook_path):
+            return self._process('price_list', workbook_path, self._new_price_list)
+
+        if self._ready('products', products_path):
+            return self._process('products', products_path, self._new_products)
+        return None
+
+    def _new_price_list(self, workbook_path):
+        started = time.perf_counter()
+        print(f"New price list: {os.path.basename(workbook_path)}")
+        new_price_list = load_clean_workbook(workbook_path)
+        new_context = self.context.derive(price_list=new_price_list)
+
+        # The workbooks are not held open between updates; a sheet read later opens its file again
+        try:
+            if self.price_list is None:
+                # Nothing to compare with, so every product is priced
+                update = price_products(self.products, new_price_list, self.sheet_workers, new_context)
+                outputs = drop_unchanged_prices(update, self.products), collect_new_items(
+                    self.products, new_price_list, context=new_context)
+            else:
+                outputs = reprice_changes(self.products, self.price_list, new_price_list, self.sheet_workers, new_context)
+        finally:
+            close_workbook(self.price_list)
+            close_workbook(new_price_list)
+
+        self.price_list, self.context = new_price_list, new_context
+        self._mark_loaded('price_list', workbook_path)
+        print(f"Price list processed in {time.perf_counter() - started:.1f}s")
+        return outputs
+
+    def _new_products(self, products_path):
+        started = time.perf_counter()
+        print("New products export")
+        new_products = load_clean_eclipse_products(products_path)
+        # Descriptions seen before are normalized from the normalizer's memo
+        new_context = self._warm(MatchContext(new_products, self.price_list or {}, self.sheet_workers))
+        changed = changed_products(self.products, new_products)
+        print(f"Products new or changed: {len(changed)} of {len(new_products)}")
+
+        if self.price_list is None:
+            outputs = None
+        else:
+            try:
+                update = price_products(changed, self.price_list, self.sheet_workers, new_context.derive(changed))
+                outputs = drop_unchanged_prices(update, new_products), collect_new_items(
+                    new_products, self.price_list, context=new_context)
+            finally:
+                close_workbook(self.price_list)
+
+        self.products, self.context = new_products, new_context
+        self._mark_loaded('products', products_path)
+        print(f"Products export processed in {time.perf_counter() - started:.1f}s")
+        return outputs
+
+
+def watch(on_outputs, directory=None, interval=POLL_INTERVAL, sheet_workers=1, max_polls=None):
+    """
+    Keeps the products and price list of a directory warm and calls on_outputs(update, uncreated_items)
+    whenever a new price list or products export has been processed. Runs until interrupted,
+    or for max_polls polls. A file that cannot be processed, or outputs that cannot be saved,
+    are reported and the directory is still watched.
+    """
+    state = WarmState(directory, sheet_workers)
+    polls = 0
+    try:
+        while max_polls is None or polls < max_polls:
+            outputs = state.poll()
+            if outputs is not None:
+                try:
+                    on_outputs(*outputs)
+                except Exception as error:
+                    print(f"Could not save the outputs: {error!r}")
+            polls += 1
+            if max_polls is None or polls < max_polls:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    return state
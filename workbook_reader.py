@@ -0,0 +1,256 @@
+import os
+import threading
+from collections.abc import Mapping
+from itertools import chain, islice
+from operator import itemgetter
+
+import pandas as pd
+import numpy as np
+from data_config import SHEET_DICT
+
+# Rows read ahead of the rest of a sheet to tell which text columns can be skipped. The price
+# column is not picked from them: a column of whole numbers can hold decimals further down, and
+# clean_price_list decides from the whole sheet, so the price is picked from the whole columns read
+SAMPLE_ROWS = 50
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def header_names(header):
+    """
+    Column names the way pandas reads them: a blank header becomes 'Unnamed: <position>'
+    and a repeated one gets a '.1', '.2'... suffix.
+    """
+    names, seen = [], {}
+    for position, name in enumerate(header):
+        name = f'Unnamed: {position}' if name is None else str(name)
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+def _column_kind(name, values):
+    """
+    The kind of a column from its cell values: 'decimal' for decimal numbers or numbers with
+    blanks, 'integer' for whole numbers, 'text' for anything else, and None for an unnamed
+    column with nothing in it.
+    """
+    present = [value for value in values if value is not None]
+    if not present:
+        return None if name.startswith('Unnamed: ') else 'text'
+    if all(_is_number(value) for value in present):
+        decimal = len(present) < len(values) or any(isinstance(value, float) and not value.is_integer()
+                                                    for value in present)
+        return 'decimal' if decimal else 'integer'
+    return 'text'
+
+def _kept_columns(kinds):
+    """
+    Picks the price among the columns of each kind and drops the columns clean_price_list drops.
+    """
+    price = next((name for name, kind in kinds.items() if kind == 'decimal'), None)
+    if price is None:
+        price = next((name for name, kind in kinds.items() if kind == 'integer' and 'price' in name.lower()), None)
+    if price is not None:
+        kinds[price] = 'price'
+    return {name: kind for name, kind in kinds.items() if kind in ('price', 'integer', 'text')}
+
+def detect_columns(names, rows):
+    """
+    Tells the columns of a sheet apart from its rows, as clean_price_list does from the
+    dtypes of the whole sheet. The first column of decimal numbers, or of numbers with blanks,
+    is the price; other such columns are dropped. Without one, the first numeric column named
+    like a price is taken. Unnamed columns with nothing in them are dropped as well.
+    Returns a dictionary of the kept columns -> 'price', 'integer' or 'text', in sheet order.
+    """
+    return _kept_columns({
+        name: _column_kind(name, [row[position] if position < len(row) else None for row in rows])
+        for position, name in enumerate(names)
+    })
+
+def _typed_column(values, kind):
+    """
+    Builds a column straight from the cell values: prices are floats, with NaN for anything
+    that is not a number, whole numbers are integers unless blanks make them floats, and
+    text stays as it is with NaN for blanks.
+    """
+    if kind == 'price':
+        return np.fromiter((value if _is_number(value) else np.nan for value in values), dtype=float, count=len(values))
+    if kind == 'integer' and all(_is_number(value) or value is None for value in values):
+        if None not in values and all(isinstance(value, int) for value in values):
+            return np.array(values, dtype=np.int64)
+        return np.array([np.nan if value is None else value for value in values], dtype=float)
+    return np.array([np.nan if value is None else value for value in values], dtype=object)
+
+def read_sheet(worksheet, columns=None, sample_rows=SAMPLE_ROWS):
+    """
+    Streams a worksheet of a read-only workbook into a DataFrame cleaned as clean_price_list
+    would clean it: the price column is named 'PRICE', other decimal columns are dropped, and
+    rows without a value in the first column or without a price are dropped.
+    The price column is told apart from the whole columns once they are read, since a column
+    of whole numbers can hold decimals further down. With 'columns', only those are kept
+    besides the item and price columns, and the first rows tell which of the other columns
+    hold text, so they cannot be the price and are not read past them.
+    """
+    rows = worksheet.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return pd.DataFrame()
+    names = header_names(header)
+    sample = list(islice(rows, sample_rows))
+    if columns is not None:
+        names_read = [
+            name for position, name in enumerate(names)
+            if name in columns or 'item' in name.lower()
+            or all(_is_number(row[position]) for row in sample if position < len(row) and row[position] is not None)
+        ]
+    else:
+        names_read = names
+    if not names_read:
+        return pd.DataFrame()
+
+    positions = [names.index(name) for name in names_read]
+    width = max(positions) + 1
+    # Short rows are padded so every read position exists
+    padded = (row + (None,) * (width - len(row)) if len(row) < width else row for row in chain(sample, rows))
+    getter = itemgetter(*positions)
+    values = list(zip(*(getter(row) for row in padded))) if len(positions) > 1 else [
+        tuple(row[positions[0]] for row in padded)
+    ]
+    if not values:
+        values = [()] * len(names_read)
+
+    kinds = _kept_columns({name: _column_kind(name, column) for name, column in zip(names_read, values)})
+    if columns is not None:
+        kinds = {
+            name: kind for name, kind in kinds.items()
+            if name in columns or kind == 'price' or 'item' in name.lower()
+        }
+    if not kinds:
+        return pd.DataFrame()
+    columns_read = dict(zip(names_read, values))
+    sheet_df = pd.DataFrame({
+        'PRICE' if kind == 'price' else name: _typed_column(list(columns_read[name]), kind)
+        for name, kind in kinds.items()
+    })
+    price_found = 'price' in kinds.values()
+
+    first_non_null_column = next((col for col in sheet_df.columns if sheet_df[col].notna().any()), None)
+    if first_non_null_column is not None:
+        sheet_df = sheet_df[sheet_df[first_non_null_column].notna()]
+    if price_found:
+        sheet_df = sheet_df[sheet_df['PRICE'].notna()]
+    return sheet_df
+
+
+class StreamingPriceList(Mapping):
+    """
+    A price list workbook read with openpyxl's read-only mode, one sheet at a time. Only the
+    sheets named in 'sheet_names' are listed (every sheet with None), and a sheet is parsed the
+    first time it is accessed, so load time and memory grow with the sheets and columns used.
+    Sheets come out cleaned as clean_price_list leaves them. Behaves as a read-only dictionary.
+    'on_load', when set, is called with the name and the frame of every sheet once it is parsed.
+    The workbook file stays open while sheets are left to parse, and is closed once the last one
+    is; close() closes it earlier, and a sheet accessed after that opens it again. Used as a
+    context manager, the file is closed when the block ends.
+    """
+
+    def __init__(self, workbook_path, sheet_names=SHEET_DICT, columns=None, sample_rows=SAMPLE_ROWS):
+        self.workbook_path = workbook_path
+        self.columns = columns
+        self.sample_rows = sample_rows
+        self._workbook = None
+        self._sheets = {}
+        self._lock = threading.Lock()
+        self.on_load = None
+        self.sheet_names = [
+            name for name in self._open().sheetnames if sheet_names is None or name in sheet_names
+        ]
+
+    def _open(self):
+        if self._workbook is None:
+            from openpyxl import load_workbook
+            self._workbook = load_workbook(self.workbook_path, read_only=True, data_only=True)
+        return self._workbook
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def signature(self):
+        """
+        Identifies the workbook and what is read from it without parsing any sheet:
+        its path, modification time and size, the sheets listed and the columns kept.
+        """
+        stat = os.stat(self.workbook_path)
+        return (os.path.abspath(self.workbook_path), stat.st_mtime_ns, stat.st_size,
+                tuple(self.sheet_names), self.columns and tuple(self.columns), self.sample_rows)
+
+    def __getitem__(self, sheet_name):
+        if sheet_name not in self.sheet_names:
+            raise KeyError(sheet_name)
+        # Stages run on threads, and the workbook reads from a single open file
+        with self._lock:
+            if sheet_name not in self._sheets:
+                self._sheets[sheet_name] = read_sheet(self._open()[sheet_name], self.columns, self.sample_rows)
+                if len(self._sheets) == len(self.sheet_names):
+                    self._close()
+                if self.on_load is not None:
+                    self.on_load(sheet_name, self._sheets[sheet_name])
+        return self._sheets[sheet_name]
+
+    def __iter__(self):
+        return iter(self.sheet_names)
+
+    def __len__(self):
+        return len(self.sheet_names)
+
+    def __contains__(self, sheet_name):
+        return sheet_name in self.sheet_names
+
+    def loaded(self):
+        """
+        Names of the sheets parsed so far.
+        """
+        return list(self._sheets)
+
+    def __getstate__(self):
+        # The open workbook and the lock stay with this process; the sheets left are read again on access
+        state = self.__dict__.copy()
+        state['_workbook'] = None
+        state['on_load'] = None
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+def read_workbook_streaming(workbook_path, sheet_names=SHEET_DICT, columns=None):
+    """
+    Opens a price list workbook for lazy, streamed reading of the sheets in 'sheet_names'.
+    """
+    return StreamingPriceList(workbook_path, sheet_names, columns)
+
+def close_workbook(price_list):
+    """
+    Closes the workbook file behind a streamed price list. A price list read whole has none.
+    """
+    if isinstance(price_list, StreamingPriceList):
+        price_list.close()